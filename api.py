@@ -1,9 +1,21 @@
 import pandas as pd
-import time
-from googleapiclient.errors import HttpError
 import logging
+import os
 from datetime import datetime
-from googleapiclient.discovery import build
+from checkpoint import CheckpointStore, CHECKPOINT_DB
+from quota import QuotaScheduler, QuotaExhausted, load_api_keys
+from search_cache import SearchCache
+from channel_reader import iter_rows, count_rows
+from telemetry import metrics, add_telemetry_arguments, start_telemetry
+from sharding import add_shard_argument, shard_path, check_shard_count
+from channel_filter import ensure_manifest, load_rules
+from resolver import BatchResolver, ID_COLUMNS, channel_id_from_row, search_channel_id, uploads_playlist_id
+
+PROGRESS_CSV = './data/progress.csv'
+
+# checkpoint kind of the channels resolved here; init.py's step1 uses 'channel'
+# and only counts channels that made it into upload_playlists.csv
+CHECKPOINT_KIND = 'api_channel'
 
 def setup_logging():
     logging.basicConfig(
@@ -12,91 +24,98 @@ def setup_logging():
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
 
-def load_progress():
-    try:
-        return pd.read_csv('./data/progress.csv')
-    except FileNotFoundError:
-        return pd.DataFrame(columns=['channel_name', 'playlist_id', 'processed_at'])
+def load_progress(store):
+    """Returns the set of channels already resolved, importing progress.csv once"""
+    store.import_csv_column(PROGRESS_CSV, 'channel_name', CHECKPOINT_KIND, value_column='playlist_id')
+    return store.done_keys(CHECKPOINT_KIND)
 
-def save_progress(channel_name, playlist_id):
-    progress_df = load_progress()
+def save_progress(store, channel_name, playlist_id):
+    """Checkpoint the channel and append its row to progress.csv (no rewrite)"""
     new_row = {
         'channel_name': channel_name,
         'playlist_id': playlist_id,
         'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
-    progress_df = pd.concat([progress_df, pd.DataFrame([new_row])], ignore_index=True)
-    progress_df.to_csv('./data/progress.csv', index=False)
+    header = not os.path.exists(PROGRESS_CSV)
+    pd.DataFrame([new_row]).to_csv(PROGRESS_CSV, mode='a', header=header, index=False)
+    store.mark(CHECKPOINT_KIND, channel_name, value=playlist_id)
 
-def get_uploads_playlist_id(api_key, channel_name, max_retries=5):
-    youtube = build('youtube', 'v3', developerKey=api_key)
-    
-    for attempt in range(max_retries):
-        try:
-            # Search for the channel
-            request = youtube.search().list(
-                part="id",
-                q=channel_name,
-                type="channel",
-                maxResults=1
-            )
-            response = request.execute()
-            
-            if not response.get('items'):
-                logging.warning(f"Channel not found: {channel_name}")
-                return None
-                
-            channel_id = response['items'][0]['id']['channelId']
-            
-            # Get uploads playlist ID
-            request = youtube.channels().list(
-                part="contentDetails",
-                id=channel_id
-            )
-            response = request.execute()
-            
-            if not response['items']:
-                logging.warning(f"No content details found for channel: {channel_name}")
-                return None
-                
-            return response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-            
-        # need to extend or revise rate limits youtube v3 api
-        except HttpError as e:
-            if e.resp.status in [429, 403]:  # Quota exceeded or rate limit
-                if attempt == max_retries - 1:
-                    logging.error(f"Max retries reached for {channel_name}: {str(e)}")
-                    raise
-                wait_time = (2 ** attempt) * 60  # Exponential backoff
-                logging.info(f"Rate limit hit. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error processing {channel_name}: {str(e)}")
-                raise
+def get_uploads_playlist_id(scheduler, channel_name, cache=None):
+    """
+    Search for the channel and return its uploads playlist ID.
+    The uploads ID is derived from the channel ID (UC... -> UU...), so only
+    the search.list call is spent, and not even that when cache has the name.
+    Quota and rate limits are handled by the scheduler, which raises
+    QuotaExhausted once every key is spent.
+    """
+    channel_id = search_channel_id(scheduler, channel_name, cache)
+    return uploads_playlist_id(channel_id) if channel_id else None
 
-if __name__ == "__main__":
+def main(argv=None):
+    """Resolves every channel to its uploads playlist into PROGRESS_CSV"""
+    global PROGRESS_CSV
+    import argparse
+    
+    parser = argparse.ArgumentParser()
+    add_shard_argument(parser)
+    add_telemetry_arguments(parser)
+    parser.add_argument("--unfiltered", action="store_true",
+                        help="crawl the raw channel list instead of the filtered manifest")
+    parser.add_argument("--rules", help="JSON file overriding channel_filter.DEFAULT_RULES")
+    args = parser.parse_args(argv)
+    try:
+        check_shard_count(CHECKPOINT_DB, args.shard)
+    except FileExistsError as e:
+        parser.error(str(e))
+    start_telemetry(args)
+    
     setup_logging()
     api_key = "API KEY"
+    scheduler = QuotaScheduler(load_api_keys(api_key))
+    
+    # a shard keeps its own progress file and checkpoints
+    PROGRESS_CSV = shard_path(PROGRESS_CSV, args.shard)
+    store = CheckpointStore(shard_path(CHECKPOINT_DB, args.shard))
     
-    # Load channel names
-    channels_df = pd.read_csv('./data/youtube_channels_1M_clean.csv')
-    progress_df = load_progress()
+    # Stream channel names, filtering out already processed channels per chunk
+    processed_channels = load_progress(store)
+    channels_csv = './data/youtube_channels_1M_clean.csv'
+    if not args.unfiltered:
+        channels_csv = ensure_manifest(channels_csv, rules=load_rules(args.rules))
+    channels_to_process = iter_rows(channels_csv,
+                                    columns=('channel_name',) + ID_COLUMNS,
+                                    key='channel_name', skip=processed_channels, shard=args.shard)
     
-    # Filter out already processed channels
-    processed_channels = set(progress_df['channel_name'])
-    channels_to_process = channels_df[~channels_df['channel_name'].isin(processed_channels)]
+    # rows with a known channel ID are resolved without search.list
+    cache = SearchCache()
+    resolver = BatchResolver(scheduler, cache=cache)
+    shards = args.shard.count if args.shard else 1
+    progress = metrics.progress('api', max(count_rows(channels_csv) // shards - len(processed_channels), 0))
     
-    for _, row in channels_to_process.iterrows():
-        channel_name = row['channel_name']
-        try:
-            uploads_playlist_id = get_uploads_playlist_id(api_key, channel_name)
-            if uploads_playlist_id:
-                save_progress(channel_name, uploads_playlist_id)
+    def save_resolved(results):
+        for channel_name, _, playlist_id in results:
+            if playlist_id:
+                save_progress(store, channel_name, playlist_id)
                 logging.info(f"Successfully processed {channel_name}")
-        except Exception as e:
-            logging.error(f"Failed to process {channel_name}: {str(e)}")
-            # If quota exceeded, stop processing
-            if isinstance(e, HttpError) and e.resp.status in [429, 403]:
-                logging.error("Daily quota exceeded. Stopping processing.")
+    
+    try:
+        for row in channels_to_process:
+            channel_name = row['channel_name']
+            progress.advance()
+            try:
+                save_resolved(resolver.add(channel_name, channel_id_from_row(row)))
+            except QuotaExhausted as e:
+                # every key is out of quota, stop processing
+                logging.error(f"Daily quota exceeded. Stopping processing. {e}")
                 break
-            continue
\ No newline at end of file
+            except Exception as e:
+                logging.error(f"Failed to process {channel_name}: {str(e)}")
+                continue
+        save_resolved(resolver.flush())
+    finally:
+        store.close()
+        cache.close()
+        scheduler.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import time
+import asyncio
+import logging
+
+from checkpoint import CheckpointStore, CHECKPOINT_DB, playlist_state, load_refresh_state, is_known_video
+from channel_reader import iter_rows, count_rows
+from quota import QuotaExhausted, classify_error
+from sinks import open_sink, VIDEO_COLUMNS
+from priority import prioritized
+from telemetry import metrics
+from video_listing import ListingError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# asyncio version of step2. Pages of one playlist are still fetched in order
+# (each needs the previous nextPageToken), but many playlists are paged at
+# once over a single pooled aiohttp session. Requests ask for a partial
+# response via fields= so YouTube only sends video IDs, publish times and
+# the page token.
+
+PLAYLIST_ITEMS_URL = "https://www.googleapis.com/youtube/v3/playlistItems"
+PLAYLIST_ITEMS_FIELDS = "items/contentDetails(videoId,videoPublishedAt),nextPageToken"
+METHOD = 'playlistItems.list'
+
+
+def _error_reason(data):
+    try:
+        return data['error']['errors'][0]['reason']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def playlist_items_url(scheduler):
+    """PLAYLIST_ITEMS_URL, or the same path on the scheduler's api_endpoint override"""
+    if getattr(scheduler, 'api_endpoint', None):
+        return scheduler.api_endpoint.rstrip('/') + '/youtube/v3/playlistItems'
+    return PLAYLIST_ITEMS_URL
+
+
+async def fetch_playlist_items(session, scheduler, playlist_id, limiter, state=None, max_rate_limit_retries=5):
+    """
+    Pages through one playlist; returns (video_id, published_at) pairs.
+    limiter is the semaphore shared by every playlist, so it bounds the
+    number of requests in flight overall. With state, paging stops at the
+    first video a previous run saw. Raises QuotaExhausted from the
+    scheduler when no key can pay for the next page, and ListingError on
+    any other failed page so a partial playlist is never checkpointed.
+    """
+    items_out = []
+    next_page_token = None
+    rate_limit_retries = 0
+    while True:
+        key = scheduler.acquire(METHOD)
+        params = {
+            'part': 'contentDetails',
+            'playlistId': playlist_id,
+            'maxResults': 50,
+            'fields': PLAYLIST_ITEMS_FIELDS,
+            'key': key,
+        }
+        if next_page_token:
+            params['pageToken'] = next_page_token
+
+        async with limiter:
+            started = time.time()
+            async with session.get(playlist_items_url(scheduler), params=params) as resp:
+                status = resp.status
+                data = await resp.json(content_type=None)
+            metrics.observe('youtube_api_latency_seconds', time.time() - started, method=METHOD)
+
+        kind = 'ok' if status == 200 else classify_error(status, _error_reason(data))
+        metrics.inc('youtube_api_calls_total', method=METHOD, status=kind)
+        if status == 200:
+            scheduler.charge(key, METHOD)
+            for item in data.get('items', []):
+                video_id = item['contentDetails']['videoId']
+                published_at = item['contentDetails'].get('videoPublishedAt')
+                if is_known_video(video_id, published_at, state):
+                    return items_out
+                items_out.append((video_id, published_at))
+            next_page_token = data.get('nextPageToken')
+            if not next_page_token or not data.get('items'):
+                break
+            continue
+
+        scheduler.charge(key, METHOD, exhausted=(kind == 'quota'))
+        if kind == 'quota':
+            continue
+        if kind == 'rate_limit' and rate_limit_retries < max_rate_limit_retries:
+            await asyncio.sleep(2 ** rate_limit_retries)
+            rate_limit_retries += 1
+            continue
+        raise ListingError(f"HTTP {status} for playlist '{playlist_id}': {_error_reason(data)}")
+    return items_out
+
+
+async def run_async_step2(scheduler, playlists_csv, videoids_csv, fmt='csv', concurrency=32,
+                          checkpoint_db=CHECKPOINT_DB, refresh=False, score=None, budget=None):
+    """
+    Runs `concurrency` playlist workers fed from a bounded queue. Rows go to
+    the same sink/checkpoint scheme as init.step2_get_video_ids: playlists
+    are marked done, with their newest video, once the sink has flushed
+    their rows. refresh=True revisits every playlist for new videos only.
+    score (a priority.make_score function) orders the playlists; budget (a
+    CrawlBudget) stops feeding new ones once it is used up.
+    """
+    if aiohttp is None:
+        raise ImportError("The async step2 mode needs aiohttp (pip install aiohttp)")
+
+    store = CheckpointStore(checkpoint_db)
+    sink = open_sink(videoids_csv, VIDEO_COLUMNS, fmt)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    limiter = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    unflushed = {}
+    totals = {'playlists': 0, 'videos': 0}
+    done_playlists = None if refresh else store.done_keys('playlist')
+    progress = metrics.progress('step2', max(count_rows(playlists_csv) - len(done_playlists or ()), 0))
+
+    async def producer():
+        rows = iter_rows(playlists_csv, columns=['channel_name', 'uploads_playlist_id'],
+                         key='uploads_playlist_id', skip=done_playlists)
+        if score:
+            rows = prioritized(rows, score)
+        for row in rows:
+            if stop.is_set() or (budget and budget.exhausted()):
+                break
+            await queue.put(row)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker(session):
+        nonlocal unflushed
+        while True:
+            row = await queue.get()
+            if row is None or stop.is_set():
+                return
+            playlist_id = row['uploads_playlist_id']
+            state = load_refresh_state(store, playlist_id) if refresh else None
+            try:
+                items = await fetch_playlist_items(session, scheduler, playlist_id, limiter, state)
+            except QuotaExhausted as e:
+                logging.info(f"[async step2] {e}. Stopping, rows collected so far are kept.")
+                stop.set()
+                return
+            except Exception as e:
+                logging.error(f"[async step2] Error for playlist '{playlist_id}': {e}")
+                continue
+            totals['playlists'] += 1
+            totals['videos'] += len(items)
+            progress.advance()
+            unflushed[playlist_id] = playlist_state(items)
+            if state and state.get('seed'):
+                # listed before states were kept: its videos are already written
+                items = []
+            out_rows = [{'channel_name': row['channel_name'], 'playlist_id': playlist_id, 'video_id': vid}
+                        for vid, _ in items]
+            if sink.write(out_rows):
+                store.mark_many('playlist', unflushed)
+                store.flush()
+                unflushed = {}
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+            feeder = asyncio.create_task(producer())
+            await asyncio.gather(*workers)
+            # workers may have quit early on QuotaExhausted; don't leave the producer blocked
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+    finally:
+        sink.close()
+        store.mark_many('playlist', unflushed)
+        store.close()
+    logging.info(f"[async step2] {totals['playlists']} playlists, {totals['videos']} videos "
+                 f"written to '{videoids_csv}' ({fmt}).")
+    return totals
+
+
+def step2_get_video_ids_async(scheduler, playlists_csv, videoids_csv, fmt='csv', concurrency=32, refresh=False,
+                              checkpoint_db=CHECKPOINT_DB, score=None, budget=None):
+    return asyncio.run(run_async_step2(scheduler, playlists_csv, videoids_csv, fmt, concurrency,
+                                       checkpoint_db=checkpoint_db, refresh=refresh, score=score, budget=budget))
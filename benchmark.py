@@ -0,0 +1,592 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import base64
+import hashlib
+import logging
+import resource
+import argparse
+import threading
+import contextlib
+import urllib.request
+import urllib.error
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offline throughput benchmark.
+#
+# MockYouTube is a local HTTP server that answers search.list, channels.list
+# and playlistItems.list the way the Data API does (pagination tokens,
+# per-key quota with quotaExceeded 403s, random 429s), plus a transcript
+# endpoint and a yt-dlp style channel endpoint, all with configurable
+# latency and error rates. Every answer is derived from hashes of the
+# request, so runs are reproducible without any stored fixtures.
+#
+# `python benchmark.py` generates a synthetic youtube_channels_1M_clean.csv,
+# points the crawlers at the mock (YOUTUBE_API_ENDPOINT / YOUTUBE_API_KEYS,
+# and MockTranscriptApi in place of YouTubeTranscriptApi), runs step1-3,
+# api.py and the pytube1.py pipeline end to end in a scratch directory and
+# reports rows/sec, p50/p99 call latency and peak RSS per stage.
+
+WORKDIR = "./bench"
+VIDEO_ID_CHARS = 11
+
+
+def _digest(*parts):
+    return hashlib.blake2b('|'.join(str(p) for p in parts).encode('utf-8'), digest_size=16).digest()
+
+
+def _b64(digest, n):
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')[:n]
+
+
+def mock_channel_id(channel_name):
+    return 'UC' + _b64(_digest('channel', str(channel_name).strip().lower()), 22)
+
+
+def mock_video_id(playlist_id, index):
+    return _b64(_digest('video', playlist_id, index), VIDEO_ID_CHARS)
+
+
+def _fraction(*parts):
+    """Deterministic float in [0, 1) for a request"""
+    return int.from_bytes(_digest(*parts)[:8], 'big') / 2 ** 64
+
+
+# =====================
+# === Synthetic input
+# =====================
+
+def generate_channels_csv(path, rows, seed=0, id_fraction=0.9):
+    """
+    Writes a youtube_channels_1M_clean.csv lookalike: channel_name,
+    channel_id (for id_fraction of the rows, blank otherwise) and a
+    heavy-tailed total_videos like the real list.
+    """
+    rng = random.Random(seed)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('channel_name,channel_id,total_videos\n')
+        for i in range(rows):
+            name = f"bench channel {i}"
+            channel_id = mock_channel_id(name) if rng.random() < id_fraction else ''
+            total_videos = max(1, min(20000, int(rng.paretovariate(1.1) * 20)))
+            f.write(f'{name},{channel_id},{total_videos}\n')
+    return path
+
+
+# =================
+# === Mock server
+# =================
+
+class MockConfig:
+    def __init__(self, latency_ms=20.0, jitter_ms=10.0, rate_limit_rate=0.01, server_error_rate=0.0,
+                 key_quota=1000000, max_videos=300, not_found_rate=0.02, transcript_disabled_rate=0.15,
+                 transcript_missing_rate=0.05, transcript_429_rate=0.005, segments=120, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.key_quota = key_quota
+        self.max_videos = max_videos
+        self.not_found_rate = not_found_rate
+        self.transcript_disabled_rate = transcript_disabled_rate
+        self.transcript_missing_rate = transcript_missing_rate
+        self.transcript_429_rate = transcript_429_rate
+        self.segments = segments
+        self.seed = seed
+
+
+# unit costs charged by the mock, same as quota.UNIT_COSTS
+MOCK_COSTS = {'search': 100, 'channels': 1, 'playlistItems': 1}
+
+
+class MockYouTube:
+    """Threaded mock server; url is e.g. http://127.0.0.1:54321/"""
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or MockConfig()
+        self.lock = threading.Lock()
+        self.spent = {}
+        self.requests = {}
+        self.rng = random.Random(self.config.seed)
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                mock.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='mock-youtube', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- plumbing ---
+
+    def _sleep(self):
+        with self.lock:
+            delay = max(0.0, self.config.latency_ms + self.rng.uniform(-1, 1) * self.config.jitter_ms)
+        time.sleep(delay / 1000.0)
+
+    def _chance(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def _send(self, handler, status, body):
+        data = json.dumps(body).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json; charset=UTF-8')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _api_error(self, handler, status, reason, message):
+        self._send(handler, status, {'error': {'code': status, 'message': message,
+                                               'errors': [{'reason': reason, 'message': message}]}})
+
+    def handle(self, handler):
+        parsed = urlparse(handler.path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        parts = parsed.path.strip('/').split('/')
+        endpoint = parts[-1] if parts else ''
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        self._sleep()
+        if parts[:2] == ['youtube', 'v3'] and endpoint in MOCK_COSTS:
+            self.handle_data_api(handler, endpoint, params)
+        elif parts[:1] == ['transcripts'] and len(parts) == 2:
+            self.handle_transcript(handler, parts[1])
+        elif parts[:1] == ['ytdlp'] and endpoint == 'channel':
+            self.handle_ytdlp(handler, params.get('name', ''))
+        else:
+            self._send(handler, 404, {'error': 'not found'})
+
+    # --- Data API ---
+
+    def handle_data_api(self, handler, endpoint, params):
+        key = params.get('key', '')
+        if self._chance(self.config.rate_limit_rate):
+            return self._api_error(handler, 429, 'rateLimitExceeded', 'Too many requests')
+        if self._chance(self.config.server_error_rate):
+            return self._api_error(handler, 500, 'backendError', 'Backend error')
+        with self.lock:
+            if self.spent.get(key, 0) + MOCK_COSTS[endpoint] > self.config.key_quota:
+                exceeded = True
+            else:
+                exceeded = False
+                self.spent[key] = self.spent.get(key, 0) + MOCK_COSTS[endpoint]
+        if exceeded:
+            return self._api_error(handler, 403, 'quotaExceeded', 'The request cannot be completed because you have exceeded your quota.')
+        if endpoint == 'search':
+            self._send(handler, 200, self.search(params.get('q', '')))
+        elif endpoint == 'channels':
+            self._send(handler, 200, self.channels(params.get('id', '')))
+        else:
+            self._send(handler, 200, self.playlist_items(params.get('playlistId', ''), params.get('pageToken')))
+
+    def search(self, query):
+        if _fraction('missing', query) < self.config.not_found_rate:
+            return {'kind': 'youtube#searchListResponse', 'items': []}
+        return {'kind': 'youtube#searchListResponse',
+                'items': [{'id': {'kind': 'youtube#channel', 'channelId': mock_channel_id(query)}}]}
+
+    def channels(self, ids):
+        items = [{'id': cid, 'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + cid[2:]}}}
+                 for cid in ids.split(',') if cid.startswith('UC')]
+        return {'kind': 'youtube#channelListResponse', 'items': items}
+
+    def playlist_size(self, playlist_id):
+        return 1 + int(_fraction('size', playlist_id) ** 3 * self.config.max_videos)
+
+    def playlist_items(self, playlist_id, page_token):
+        size = self.playlist_size(playlist_id)
+        start = int(page_token) if page_token and page_token.isdigit() else 0
+        end = min(size, start + 50)
+        # uploads playlists list the newest video first
+        items = [{'contentDetails': {'videoId': mock_video_id(playlist_id, size - 1 - i),
+                                     'videoPublishedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                                       time.gmtime(1.5e9 + (size - i) * 86400))}}
+                 for i in range(start, end)]
+        body = {'kind': 'youtube#playlistItemListResponse', 'items': items}
+        if end < size:
+            body['nextPageToken'] = str(end)
+        return body
+
+    # --- transcripts / yt-dlp ---
+
+    def handle_transcript(self, handler, video_id):
+        if self._chance(self.config.transcript_429_rate):
+            return self._send(handler, 429, {'error': 'TooManyRequests'})
+        roll = _fraction('transcript', video_id)
+        if roll < self.config.transcript_disabled_rate:
+            return self._send(handler, 404, {'error': 'TranscriptsDisabled'})
+        if roll < self.config.transcript_disabled_rate + self.config.transcript_missing_rate:
+            return self._send(handler, 404, {'error': 'NoTranscriptFound', 'languages': ['de']})
+        n = 1 + int(_fraction('segments', video_id) * self.config.segments)
+        segments = [{'text': f"segment {i} of {video_id}", 'start': i * 2.5, 'duration': 2.5} for i in range(n)]
+        self._send(handler, 200, {'languages': ['en'], 'segments': segments})
+
+    def handle_ytdlp(self, handler, name):
+        if _fraction('missing', name) < self.config.not_found_rate:
+            return self._send(handler, 404, {'error': 'not found'})
+        playlist_id = 'UU' + mock_channel_id(name)[2:]
+        entries = [{'id': mock_video_id(playlist_id, i), 'title': f"video {i}",
+                    'url': f"https://www.youtube.com/watch?v={mock_video_id(playlist_id, i)}"}
+                   for i in range(self.playlist_size(playlist_id))]
+        self._send(handler, 200, {'channel': name, 'entries': entries})
+
+
+# ==============================================
+# === Clients that talk to the mock server
+# ==============================================
+
+class _MockTranscriptError(Exception):
+    pass
+
+
+# named like the youtube_transcript_api exceptions, so
+# transcript_cache.classify_transcript_error treats them the same way
+TRANSCRIPT_ERRORS = {name: type(name, (_MockTranscriptError,), {})
+                     for name in ('TranscriptsDisabled', 'NoTranscriptFound', 'TooManyRequests')}
+
+
+class _MockTranscript:
+    def __init__(self, language_code, segments):
+        self.language_code = language_code
+        self.segments = segments
+
+    def fetch(self):
+        return self.segments
+
+
+class _MockTranscriptList:
+    def __init__(self, languages, segments):
+        self.transcripts = [_MockTranscript(code, segments) for code in languages]
+
+    def __iter__(self):
+        return iter(self.transcripts)
+
+    def find_transcript(self, language_codes):
+        for transcript in self.transcripts:
+            if transcript.language_code in language_codes:
+                return transcript
+        raise TRANSCRIPT_ERRORS['NoTranscriptFound']()
+
+
+class MockTranscriptApi:
+    """The part of YouTubeTranscriptApi that transcript_cache uses, backed by the mock server"""
+    url = None
+
+    @classmethod
+    def list_transcripts(cls, video_id):
+        try:
+            with urllib.request.urlopen(f"{cls.url}transcripts/{video_id}", timeout=30) as resp:
+                body = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            name = json.loads(e.read() or b'{}').get('error', '')
+            raise TRANSCRIPT_ERRORS.get(name, _MockTranscriptError)(f"HTTP {e.code}")
+        return _MockTranscriptList(body['languages'], body['segments'])
+
+
+def mock_channel_playlists(url):
+    """Stand-in for pytube1.get_channel_playlists that asks the mock server"""
+    def get_channel_playlists(channel_name, max_retries=3, retry_delay=5, ydl=None, limiter=None):
+        query = urllib.parse.urlencode({'name': channel_name})
+        try:
+            with urllib.request.urlopen(f"{url}ytdlp/channel?{query}", timeout=30) as resp:
+                info = json.loads(resp.read())
+        except urllib.error.HTTPError:
+            return None
+        import pytube1
+        return pytube1.process_channel_videos(info)
+    return get_channel_playlists
+
+
+# ===============
+# === Stages
+# ===============
+
+LATENCY_METRICS = ('youtube_api_latency_seconds', 'transcript_latency_seconds', 'ytdlp_extract_latency_seconds')
+
+
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_mb():
+    """Resident set size of this process right now (Linux /proc), None elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+
+def lifetime_peak_rss_mb():
+    """ru_maxrss of this process and of its finished children, in MB: peaks over the whole process lifetime"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(own / scale, 1), round(children / scale, 1)
+
+
+class RssSampler:
+    """
+    Samples this process's RSS from a thread while a stage runs, so each
+    stage gets its own peak rather than ru_maxrss's lifetime high-water mark.
+    peak stays None where /proc isn't available.
+    """
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = None
+        self.done = threading.Event()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _loop(self):
+        while not self.done.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self.thread = threading.Thread(target=self._loop, name='bench-rss', daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self._sample()
+
+
+def latency_summary(snapshot):
+    out = {}
+    for name in LATENCY_METRICS:
+        for series in snapshot['histograms'].get(name, []):
+            label = ','.join(f"{k}={v}" for k, v in sorted(series['labels'].items()))
+            out[f"{name}{'{' + label + '}' if label else ''}"] = {
+                'count': series['count'], 'p50': series['p50'], 'p99': series['p99']}
+    return out
+
+
+def run_stage(name, directory, fn, count_rows_fn, quiet=True):
+    """Runs fn() inside directory and returns its report entry"""
+    from telemetry import metrics
+
+    metrics.reset()
+    cwd = os.getcwd()
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    started = time.time()
+    error = None
+    try:
+        sink = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(sink), RssSampler() as rss:
+            fn()
+    except ImportError as e:
+        error = f"skipped: {e}"
+    except Exception as e:
+        error = f"failed: {type(e).__name__}: {e}"
+        logging.exception(f"[bench] {name} failed")
+    elapsed = time.time() - started
+    try:
+        rows = count_rows_fn() if error is None else 0
+    finally:
+        os.chdir(cwd)
+    own_peak, children_peak = lifetime_peak_rss_mb()
+    report = {
+        'stage': name,
+        'seconds': round(elapsed, 2),
+        'rows': rows,
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency': latency_summary(metrics.snapshot()),
+        # sampled during this stage; the lifetime figures only ever grow
+        'peak_rss_mb': rss.peak,
+        'process_peak_rss_mb': own_peak,
+        'process_peak_children_rss_mb': children_peak,
+    }
+    if error:
+        report['error'] = error
+    return report
+
+
+def link_channels(channels_csv, directory):
+    """Each stage group gets its own data dir with the shared synthetic input"""
+    data = os.path.join(directory, 'data')
+    os.makedirs(data, exist_ok=True)
+    target = os.path.join(data, 'youtube_channels_1M_clean.csv')
+    if not os.path.exists(target):
+        os.symlink(os.path.abspath(channels_csv), target)
+
+
+def run_benchmark(args):
+    from channel_reader import count_rows
+
+    workdir = os.path.abspath(args.workdir)
+    channels_csv = os.path.join(workdir, 'youtube_channels_1M_clean.csv')
+    generate_channels_csv(channels_csv, args.channels, seed=args.seed, id_fraction=args.id_fraction)
+
+    config = MockConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_limit_rate=args.rate_limit_rate,
+                        server_error_rate=args.server_error_rate, key_quota=args.key_quota,
+                        max_videos=args.max_videos, transcript_disabled_rate=args.transcript_disabled_rate,
+                        transcript_429_rate=args.transcript_429_rate, seed=args.seed)
+    server = MockYouTube(config).start()
+    os.environ['YOUTUBE_API_ENDPOINT'] = server.url
+    os.environ['YOUTUBE_API_KEYS'] = ','.join(f"bench-key-{i}" for i in range(args.keys))
+    MockTranscriptApi.url = server.url
+
+    reports = []
+    pipeline_dir = os.path.join(workdir, 'pipeline')
+    link_channels(channels_csv, pipeline_dir)
+    state = {}
+
+    def import_init():
+        # init builds its scheduler (and quota ledger) at import, so import it from inside the stage dir
+        import transcript_cache
+        transcript_cache.YouTubeTranscriptApi = MockTranscriptApi
+        import init
+        state['init'] = init
+
+    def step1():
+        import_init()
+        init = state['init']
+        init.step1_get_playlists(init.scheduler, init.CHANNELS_CSV, init.PLAYLISTS_CSV, 'last_processed_channels.txt',
+                                 checkpoint_db=init.CHECKPOINT_DB)
+
+    def step2():
+        init = state['init']
+        if args.use_async:
+            from async_step2 import step2_get_video_ids_async
+            step2_get_video_ids_async(init.scheduler, init.PLAYLISTS_CSV, init.VIDEOIDS_CSV,
+                                      concurrency=args.concurrency, checkpoint_db=init.CHECKPOINT_DB)
+        else:
+            init.step2_get_video_ids('csv', init.CHECKPOINT_DB)
+
+    def step3():
+        init = state['init']
+        if args.workers > 0:
+            init.step3_get_transcripts_concurrent(args.workers, 500, 'csv', init.CHECKPOINT_DB,
+                                                  transcript_store=args.store)
+        else:
+            init.step3_get_transcripts('csv', init.CHECKPOINT_DB, transcript_store=args.store)
+
+    def transcript_rows():
+        init = state['init']
+        if args.store:
+            from transcript_store import TranscriptStore
+            with TranscriptStore(init.TRANSCRIPT_STORE_DIR) as store:
+                return len(store)
+        return count_rows(init.TRANSCRIPTS_CSV) if os.path.exists(init.TRANSCRIPTS_CSV) else 0
+
+    stages = set(args.stages)
+    if stages & {'step1', 'step2', 'step3'}:
+        reports.append(run_stage('step1', pipeline_dir, step1,
+                                 lambda: count_rows(state['init'].PLAYLISTS_CSV), quiet=not args.verbose))
+        if 'init' in state and stages & {'step2', 'step3'}:
+            reports.append(run_stage('step2', pipeline_dir, step2,
+                                     lambda: count_rows(state['init'].VIDEOIDS_CSV), quiet=not args.verbose))
+        if 'init' in state and 'step3' in stages:
+            reports.append(run_stage('step3', pipeline_dir, step3, transcript_rows, quiet=not args.verbose))
+
+    if 'api' in stages:
+        api_dir = os.path.join(workdir, 'api')
+        link_channels(channels_csv, api_dir)
+
+        def api_main():
+            import api
+            api.main(['--unfiltered'])
+
+        reports.append(run_stage('api', api_dir, api_main,
+                                 lambda: count_rows('./data/progress.csv'), quiet=not args.verbose))
+
+    if 'pytube1' in stages:
+        pytube_dir = os.path.join(workdir, 'pytube1')
+        link_channels(channels_csv, pytube_dir)
+
+        def pytube_main():
+            import pytube1
+            # yt-dlp itself can't be pointed at a mock, so the extraction call is swapped out;
+            # the pool, segments and checkpoints are the real ones (workers fork with the swap)
+            pytube1.get_channel_playlists = mock_channel_playlists(server.url)
+            names = (f"bench channel {i}" for i in range(args.channels))
+            pytube1.process_channels(names, checkpoint_db='./data/checkpoints.db',
+                                     results_dir='youtube_results', workers=args.workers)
+
+        def segment_rows():
+            directory = 'youtube_results'
+            if not os.path.isdir(directory):
+                return 0
+            return sum(count_rows(os.path.join(directory, f)) for f in os.listdir(directory) if f.endswith('.csv'))
+
+        reports.append(run_stage('pytube1', pytube_dir, pytube_main, segment_rows, quiet=not args.verbose))
+
+    server.stop()
+    return {'config': vars(config), 'channels': args.channels, 'mock_requests': server.requests, 'stages': reports}
+
+
+def print_report(result):
+    print(f"{'stage':<10}{'seconds':>10}{'rows':>10}{'rows/s':>10}{'rss MB':>9}  latency p50/p99 (s)")
+    for stage in result['stages']:
+        latency = '; '.join(f"{name.split('_latency')[0]}{name[name.find('{'):] if '{' in name else ''} "
+                            f"{v['p50']}/{v['p99']} (n={v['count']})"
+                            for name, v in stage['latency'].items())
+        print(f"{stage['stage']:<10}{stage['seconds']:>10}{stage['rows']:>10}{stage['rows_per_second']:>10}"
+              f"{stage['peak_rss_mb'] if stage['peak_rss_mb'] is not None else '-':>9}  {stage.get('error') or latency}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline crawler benchmark against a local mock YouTube")
+    parser.add_argument("--stages", nargs='+', default=['step1', 'step2', 'step3', 'api', 'pytube1'],
+                        choices=['step1', 'step2', 'step3', 'api', 'pytube1'])
+    parser.add_argument("--workdir", default=WORKDIR, help="scratch directory (wiped data is not reused)")
+    parser.add_argument("--channels", type=int, default=2000, help="rows in the synthetic channel list")
+    parser.add_argument("--id-fraction", type=float, default=0.9,
+                        help="share of channels that come with a channel_id (the rest need search.list)")
+    parser.add_argument("--keys", type=int, default=50, help="number of fake API keys")
+    parser.add_argument("--key-quota", type=int, default=1000000, help="units the mock allows per key")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.01, help="share of Data API calls answered 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-videos", type=int, default=300, help="largest mock uploads playlist")
+    parser.add_argument("--transcript-disabled-rate", type=float, default=0.15)
+    parser.add_argument("--transcript-429-rate", type=float, default=0.005)
+    parser.add_argument("--workers", type=int, default=8, help="step3 / pytube1 workers (0 = serial)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="step2 with aiohttp")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--store", action="store_true", help="step3 into the transcript store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="also write the report as JSON here")
+    parser.add_argument("--verbose", action="store_true", help="keep the crawlers' own output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if os.path.exists(args.workdir) and os.listdir(args.workdir):
+        print(f"{args.workdir} is not empty; remove it or pass another --workdir so runs don't resume")
+        sys.exit(1)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    result = run_benchmark(args)
+    print_report(result)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
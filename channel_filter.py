@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import heapq
+import hashlib
+import logging
+
+from channel_reader import iter_chunks
+
+# The channel cleaning rules from example.py as one reusable stage.
+#
+# Rules are plain data (DEFAULT_RULES, or a JSON file with the same keys).
+# The stage streams youtube_channels_1M_clean.csv in chunks, applies the
+# rules vectorized, and writes a filtered manifest plus a stats file next to
+# it. The manifest is reused as long as the input file and the rules are
+# unchanged, and every crawler reads the manifest instead of the raw list,
+# so no quota is spent on channels we'd throw away. load_stats() and the
+# fingerprint check don't import pandas, only a rebuild does.
+
+DEFAULT_RULES = {
+    # the K biggest channels by total_videos are dropped if above max_videos
+    'top_k': 50,
+    'top_k_max_videos': 100000,
+    # case-insensitive substrings of channel_name that exclude a channel
+    'exclude_keywords': ['india', 'hindi', 'telugu', 'tamil', 'malayalam'],
+    # inclusive bounds on total_videos
+    'min_videos': 1,
+    'max_videos': 10000,
+}
+
+FILTERED_CSV = "./data/youtube_channels_filtered.csv"
+
+
+def load_rules(path=None):
+    rules = dict(DEFAULT_RULES)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            rules.update(json.load(f))
+    return rules
+
+
+def compile_keywords(keywords):
+    """One alternation regex for all keywords, compiled once"""
+    if not keywords:
+        return None
+    return re.compile('|'.join(re.escape(k.lower()) for k in keywords))
+
+
+def rules_fingerprint(channels_csv, rules):
+    """Changes whenever the input file or the rules change"""
+    st = os.stat(channels_csv)
+    payload = json.dumps({'input': os.path.abspath(channels_csv), 'size': st.st_size,
+                          'mtime': int(st.st_mtime), 'rules': rules}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def stats_path(manifest_csv):
+    return os.path.splitext(manifest_csv)[0] + '.stats.json'
+
+
+def find_top_k(channels_csv, k):
+    """First pass: names of the k channels with the most videos (heap, one chunk at a time)"""
+    heap = []
+    for chunk in iter_chunks(channels_csv, columns=['channel_name', 'total_videos']):
+        chunk = chunk.nlargest(k, 'total_videos')
+        for name, total in zip(chunk['channel_name'], chunk['total_videos']):
+            item = (total, str(name))
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return heap
+
+
+def filter_chunk(chunk, rules, keyword_re, top_k_names, stats):
+    """Applies the rules to one DataFrame chunk, counting drops per rule"""
+    import pandas as pd
+
+    names = chunk['channel_name'].fillna('').astype(str)
+
+    drop = names.str.strip() == ''
+    stats['dropped_empty_name'] += int(drop.sum())
+
+    if top_k_names:
+        rule = ~drop & names.isin(top_k_names)
+        stats['dropped_top_k'] += int(rule.sum())
+        drop |= rule
+
+    if keyword_re is not None:
+        rule = ~drop & names.str.lower().str.contains(keyword_re)
+        stats['dropped_keywords'] += int(rule.sum())
+        drop |= rule
+
+    total = pd.to_numeric(chunk['total_videos'], errors='coerce').fillna(0)
+    rule = ~drop & ((total < rules['min_videos']) | (total > rules['max_videos']))
+    stats['dropped_bounds'] += int(rule.sum())
+    drop |= rule
+
+    return chunk[~drop]
+
+
+def build_manifest(channels_csv, manifest_csv=FILTERED_CSV, rules=None):
+    """Streams channels_csv through the rules into manifest_csv; returns the stats dict"""
+    import pandas as pd
+
+    rules = rules or dict(DEFAULT_RULES)
+    keyword_re = compile_keywords(rules.get('exclude_keywords'))
+    top_k_names = set()
+    if rules.get('top_k'):
+        top_k_names = set(name for total, name in find_top_k(channels_csv, rules['top_k'])
+                          if total > rules['top_k_max_videos'])
+
+    stats = {'rows_in': 0, 'rows_out': 0, 'total_videos_out': 0, 'dropped_empty_name': 0,
+             'dropped_top_k': 0, 'dropped_keywords': 0, 'dropped_bounds': 0}
+    # shards starting together may all rebuild the manifest, so each writes
+    # its own temp file and the last complete one wins
+    tmp_csv = f"{manifest_csv}.{os.getpid()}.tmp"
+    header = True
+    with open(tmp_csv, 'w', encoding='utf-8', newline='') as out:
+        for chunk in iter_chunks(channels_csv):
+            stats['rows_in'] += len(chunk)
+            kept = filter_chunk(chunk, rules, keyword_re, top_k_names, stats)
+            stats['rows_out'] += len(kept)
+            stats['total_videos_out'] += int(pd.to_numeric(kept['total_videos'], errors='coerce').fillna(0).sum())
+            kept.to_csv(out, header=header, index=False)
+            header = False
+    os.replace(tmp_csv, manifest_csv)
+
+    stats['fingerprint'] = rules_fingerprint(channels_csv, rules)
+    stats['rules'] = rules
+    tmp_stats = f"{stats_path(manifest_csv)}.{os.getpid()}.tmp"
+    with open(tmp_stats, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_stats, stats_path(manifest_csv))
+    logging.info(f"Filtered {stats['rows_in']} channels down to {stats['rows_out']} "
+                 f"({stats['total_videos_out']} videos) into {manifest_csv}")
+    return stats
+
+
+def load_stats(manifest_csv=FILTERED_CSV):
+    try:
+        with open(stats_path(manifest_csv), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_manifest(channels_csv, manifest_csv=FILTERED_CSV, rules=None):
+    """Returns the path of an up-to-date filtered manifest, rebuilding it only when stale"""
+    rules = rules or dict(DEFAULT_RULES)
+    stats = load_stats(manifest_csv)
+    if (stats and os.path.exists(manifest_csv)
+            and stats.get('fingerprint') == rules_fingerprint(channels_csv, rules)):
+        return manifest_csv
+    build_manifest(channels_csv, manifest_csv, rules)
+    return manifest_csv
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the filtered channel manifest")
+    parser.add_argument("--input", default="./data/youtube_channels_1M_clean.csv")
+    parser.add_argument("--output", default=FILTERED_CSV)
+    parser.add_argument("--rules", help="JSON file overriding DEFAULT_RULES")
+    args = parser.parse_args()
+
+    print(json.dumps(build_manifest(args.input, args.output, load_rules(args.rules)), indent=2))
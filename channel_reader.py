@@ -0,0 +1,74 @@
+import csv
+
+from sharding import shard_mask
+
+# Streaming input layer for the big CSVs (youtube_channels_1M_clean.csv,
+# upload_playlists.csv, video_ids.csv). Reads only the columns asked for,
+# chunk by chunk, and drops already-processed keys per chunk, so memory
+# stays flat no matter how big the file is. pandas is only imported once a
+# file is actually parsed; count_rows/read_header don't need it.
+
+CHUNKSIZE = 50000
+
+
+def read_header(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def count_rows(path, block_size=1 << 20):
+    """Counts data rows by scanning for newlines (no CSV parsing)"""
+    n = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            n += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        n += 1
+    return max(n - 1, 0)
+
+
+def iter_chunks(path, columns=None, key=None, skip=None, start_row=0, start_offset=None, chunksize=CHUNKSIZE,
+                shard=None, shard_key='channel_name'):
+    """
+    Yields DataFrame chunks of path.
+
+    columns:      columns to read; ones missing from the file are ignored
+    key/skip:     rows whose stripped key value is in skip are dropped
+    start_row:    number of data rows to skip first
+    start_offset: byte offset of the start of a data row to seek to instead
+    shard:        sharding.Shard; only rows whose shard_key hashes to it are kept
+    """
+    import pandas as pd
+
+    header = read_header(path)
+    wanted = header if columns is None else [c for c in header if c in set(columns) | ({shard_key} if shard else set())]
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if start_offset:
+            f.seek(start_offset)
+            reader = pd.read_csv(f, header=None, names=header, usecols=wanted, chunksize=chunksize,
+                                 skiprows=start_row or None)
+        else:
+            reader = pd.read_csv(f, usecols=wanted, chunksize=chunksize,
+                                 skiprows=range(1, start_row + 1) if start_row else None)
+        for chunk in reader:
+            if key is not None:
+                chunk[key] = chunk[key].fillna('').astype(str).str.strip()
+                if skip:
+                    chunk = chunk[~chunk[key].isin(skip)]
+            if shard is not None:
+                chunk = chunk[shard_mask(chunk[shard_key].fillna('').astype(str), shard)]
+            if len(chunk):
+                yield chunk
+
+
+def iter_rows(path, columns=None, key=None, skip=None, start_row=0, start_offset=None, chunksize=CHUNKSIZE,
+              shard=None, shard_key='channel_name'):
+    """Same as iter_chunks, one dict per row"""
+    for chunk in iter_chunks(path, columns, key, skip, start_row, start_offset, chunksize, shard, shard_key):
+        yield from chunk.to_dict('records')
@@ -0,0 +1,251 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+# One SQLite file holds the resume state for every entry point (init.py,
+# api.py, pytube1.py). Rows are keyed by (kind, key) where kind is one of
+# 'channel', 'playlist' or 'video' (api.py and pytube1.py keep their channels
+# under 'api_channel' and 'ytdlp_channel'), so lookups are a primary key hit instead
+# of re-reading text files / CSVs on every restart.
+
+CHECKPOINT_DB = "./data/checkpoints.db"
+
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    kind        TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    value       TEXT,
+    created_at  TEXT NOT NULL,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imports (
+    source      TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+"""
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CheckpointStore:
+    """
+    SQLite (WAL mode) checkpoint store with batched commits.
+    mark() buffers writes and commits every commit_every calls; call flush()
+    or close() (or use it as a context manager) to commit the rest.
+    """
+    def __init__(self, path=CHECKPOINT_DB, commit_every=500):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, kind, key):
+        """Returns (status, attempts, value) for a key, or None if unseen"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT status, attempts, value FROM checkpoints WHERE kind = ? AND key = ?",
+                (kind, str(key))
+            ).fetchone()
+
+    def is_done(self, kind, key):
+        row = self.get(kind, key)
+        return row is not None and row[0] == DONE
+
+    def get_value(self, kind, key):
+        row = self.get(kind, key)
+        return row[2] if row else None
+
+    def done_keys(self, kind):
+        """Returns the set of finished keys of one kind (one indexed scan)"""
+        with self.lock:
+            cur = self.conn.execute(
+                "SELECT key FROM checkpoints WHERE kind = ? AND status = ?", (kind, DONE)
+            )
+            return set(row[0] for row in cur)
+
+    def count(self, kind, status=None):
+        with self.lock:
+            if status is None:
+                cur = self.conn.execute("SELECT COUNT(*) FROM checkpoints WHERE kind = ?", (kind,))
+            else:
+                cur = self.conn.execute(
+                    "SELECT COUNT(*) FROM checkpoints WHERE kind = ? AND status = ?", (kind, status)
+                )
+            return cur.fetchone()[0]
+
+    def mark(self, kind, key, status=DONE, value=None):
+        """Records an attempt for key with its new status (and optional value)"""
+        now = _now()
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO checkpoints (kind, key, status, attempts, value, created_at, updated_at)
+                   VALUES (?, ?, ?, 1, ?, ?, ?)
+                   ON CONFLICT (kind, key) DO UPDATE SET
+                       status = excluded.status,
+                       attempts = checkpoints.attempts + 1,
+                       value = COALESCE(excluded.value, checkpoints.value),
+                       updated_at = excluded.updated_at""",
+                (kind, str(key), status, value, now, now)
+            )
+            self._maybe_commit(1)
+
+    def mark_many(self, kind, keys, status=DONE):
+        """Marks many keys at once; keys may be a dict of key -> value to store alongside"""
+        now = _now()
+        values = keys if isinstance(keys, dict) else {}
+        with self.lock:
+            rows = [(kind, str(key), status, values.get(key), now, now) for key in keys]
+            self.conn.executemany(
+                """INSERT INTO checkpoints (kind, key, status, attempts, value, created_at, updated_at)
+                   VALUES (?, ?, ?, 1, ?, ?, ?)
+                   ON CONFLICT (kind, key) DO UPDATE SET
+                       status = excluded.status,
+                       attempts = checkpoints.attempts + 1,
+                       value = COALESCE(excluded.value, checkpoints.value),
+                       updated_at = excluded.updated_at""",
+                rows
+            )
+            self._maybe_commit(len(rows))
+
+    def _maybe_commit(self, n):
+        self.uncommitted += n
+        if self.uncommitted >= self.commit_every:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    # --- one-off imports of the legacy resume files ---
+
+    def _imported(self, source):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM imports WHERE source = ?", (source,)
+            ).fetchone() is not None
+
+    def _record_import(self, source):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imports (source, imported_at) VALUES (?, ?)", (source, _now())
+            )
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def import_channel_list(self, path):
+        """Imports a last_processed_channels.txt style file (one name per line) once"""
+        source = os.path.abspath(path)
+        if not os.path.exists(path) or self._imported(source):
+            return 0
+        with open(path, 'r', encoding='utf-8') as f:
+            names = [line.strip() for line in f if line.strip()]
+        self.mark_many('channel', names)
+        self._record_import(source)
+        logging.info(f"Imported {len(names)} processed channels from {path}")
+        return len(names)
+
+    def import_csv_column(self, path, column='channel_name', kind='channel', value_column=None):
+        """Imports processed keys from a legacy CSV (progress.csv, youtube_results/*.csv) once per kind"""
+        source = f"{kind}:{os.path.abspath(path)}"
+        if not os.path.exists(path) or self._imported(source):
+            return 0
+        import csv
+        n = 0
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                key = row.get(column)
+                if not key:
+                    continue
+                self.mark(kind, key, DONE, row.get(value_column) if value_column else None)
+                n += 1
+        self._record_import(source)
+        logging.info(f"Imported {n} processed {kind}s from {path}")
+        return n
+
+
+# --- step2 playlist state ---
+# Uploads playlists list newest videos first, so remembering the newest video
+# we have seen per playlist lets a refresh stop paging as soon as it gets
+# back to it. The state is stored as JSON in the 'playlist' checkpoint value.
+
+def playlist_state(items):
+    """
+    Newest-video state after a fetch. items are (video_id, published_at)
+    pairs newest first; None when there is nothing new, which mark_many
+    treats as "keep the stored value".
+    """
+    if not items:
+        return None
+    video_id, published_at = items[0]
+    return json.dumps({'newest_video_id': video_id, 'newest_published_at': published_at})
+
+
+def load_playlist_state(store, playlist_id):
+    value = store.get_value('playlist', playlist_id)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def load_refresh_state(store, playlist_id):
+    """
+    State for a refresh. Playlists checkpointed before states were kept get
+    a seed state: only their newest video is listed, to be stored as the
+    state, and no rows are written for it (they are all in the output).
+    """
+    state = load_playlist_state(store, playlist_id)
+    if state is None and store.is_done('playlist', playlist_id):
+        return {'seed': True}
+    return state
+
+
+def is_known_video(video_id, published_at, state):
+    """True once paging has reached videos fetched by a previous run"""
+    if not state:
+        return False
+    if state.get('seed'):
+        # seeding: only the first (newest) video is new
+        if state.get('seeded'):
+            return True
+        state['seeded'] = True
+        return False
+    if video_id == state.get('newest_video_id'):
+        return True
+    # the remembered video may have been deleted; fall back to publish time
+    newest = state.get('newest_published_at')
+    return bool(published_at and newest and published_at < newest)
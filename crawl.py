@@ -0,0 +1,179 @@
+import os
+import sys
+import csv
+import json
+import time
+import runpy
+import argparse
+
+from checkpoint import CheckpointStore, CHECKPOINT_DB, FAILED
+from quota import QuotaLedger, QUOTA_LEDGER_DB, DAILY_QUOTA, load_api_keys, key_label, quota_day, seconds_until_reset
+from channel_reader import count_rows
+from channel_filter import load_stats, FILTERED_CSV
+from sharding import Shard, add_shard_argument, shard_path, shard_of
+
+# Lightweight entry point for the crawl.
+#
+# status and shard-plan only read SQLite files and CSVs line by line, so they
+# start without pandas, googleapiclient or youtube_transcript_api and can be
+# polled by cron or an orchestrator. step1/step2/step3/pipeline/merge hand
+# their arguments to init.py's command line, which is only imported then;
+# resume is the pipeline, which queues whatever earlier runs left unfinished
+# before it takes new channels.
+#
+#   python crawl.py status [--shards N | --shard i/N] [--json]
+#   python crawl.py shard-plan --shards N
+#   python crawl.py resume [--shard i/N] [pipeline flags]
+#   python crawl.py step3 --workers 16 --shard 2/8
+
+CHANNELS_CSV    = "./data/youtube_channels_1M_clean.csv"
+PLAYLISTS_CSV   = "./data/upload_playlists.csv"
+VIDEOIDS_CSV    = "./data/video_ids.csv"
+TRANSCRIPTS_CSV = "./data/transcripts.csv"
+
+# commands that run init.py's command line unchanged
+INIT_COMMANDS = ('step1', 'step2', 'step3', 'pipeline', 'merge')
+
+
+def run_init(argv):
+    """Runs `python init.py <argv>` in this process"""
+    sys.argv = ['init.py'] + list(argv)
+    runpy.run_module('init', run_name='__main__')
+
+
+def output_rows(csv_path, fmt='csv'):
+    """Rows written to a step output so far, None if it doesn't exist yet"""
+    if fmt == 'parquet':
+        from sinks import output_path, count_output_rows
+        return count_output_rows(csv_path, fmt) if os.path.exists(output_path(csv_path, fmt)) else None
+    return count_rows(csv_path) if os.path.exists(csv_path) else None
+
+
+def shard_status(shard=None, fmt='csv'):
+    """Checkpoint and output counts of one shard (or the unsharded run)"""
+    status = {'shard': f"{shard.index}/{shard.count}" if shard else None}
+    manifest = load_stats()
+    if manifest:
+        # the manifest isn't split per shard; jump hashing spreads it evenly
+        status['channels_in_manifest'] = manifest['rows_out'] // (shard.count if shard else 1)
+    checkpoint_db = shard_path(CHECKPOINT_DB, shard)
+    if os.path.exists(checkpoint_db):
+        with CheckpointStore(checkpoint_db) as store:
+            status['channels_resolved'] = store.count('channel')
+            status['playlists_listed'] = store.count('playlist')
+            status['videos_attempted'] = store.count('video')
+            status['videos_failed'] = store.count('video', FAILED)
+    status['playlists_written'] = output_rows(shard_path(PLAYLISTS_CSV, shard))
+    status['video_ids_written'] = output_rows(shard_path(VIDEOIDS_CSV, shard), fmt)
+    status['transcripts_written'] = output_rows(shard_path(TRANSCRIPTS_CSV, shard), fmt)
+    return status
+
+
+def quota_status(ledger_path=QUOTA_LEDGER_DB):
+    """Units spent and left today per key, from the ledger only (no API client)"""
+    day = quota_day()
+    saved = {}
+    if os.path.exists(ledger_path):
+        ledger = QuotaLedger(ledger_path)
+        saved = ledger.load(day)
+        ledger.close()
+    labels = [key_label(key) for key in load_api_keys()] or sorted(saved)
+    keys = {}
+    for label in labels:
+        units, exhausted = saved.get(label, (0, False))
+        keys[label] = {'spent': units, 'left': 0 if exhausted else max(0, DAILY_QUOTA - units),
+                       'exhausted': exhausted}
+    return {'day': day, 'resets_in_seconds': round(seconds_until_reset()), 'keys': keys}
+
+
+def _n(value):
+    return '-' if value is None else f"{value:,}"
+
+
+def print_status(shards, quota):
+    for status in shards:
+        print(f"== shard {status['shard']} ==" if status['shard'] else "== crawl ==")
+        manifest = status.get('channels_in_manifest')
+        print(f"step1  channels resolved    {_n(status.get('channels_resolved'))}"
+              + (f" / ~{manifest:,} in the manifest" if manifest else ""))
+        print(f"       playlists written    {_n(status['playlists_written'])}")
+        print(f"step2  playlists listed     {_n(status.get('playlists_listed'))}")
+        print(f"       video ids written    {_n(status['video_ids_written'])}")
+        print(f"step3  videos attempted     {_n(status.get('videos_attempted'))}"
+              f" ({_n(status.get('videos_failed'))} failed)")
+        print(f"       transcripts written  {_n(status['transcripts_written'])}")
+    left = sum(key['left'] for key in quota['keys'].values())
+    spent = sum(key['spent'] for key in quota['keys'].values())
+    print(f"quota  {quota['day']}: {len(quota['keys'])} keys, {spent:,} units spent, {left:,} left, "
+          f"resets in {quota['resets_in_seconds'] / 3600:.1f} hours")
+
+
+def shard_plan(channels_csv, count):
+    """Channels and total_videos per shard of channels_csv, by the same hash --shard uses"""
+    plan = [{'shard': f"{index}/{count}", 'channels': 0, 'total_videos': 0} for index in range(count)]
+    with open(channels_csv, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('channel_name') or '').strip()
+            if not name:
+                continue
+            entry = plan[shard_of(name, count)]
+            entry['channels'] += 1
+            try:
+                entry['total_videos'] += int(float(row.get('total_videos') or 0))
+            except ValueError:
+                pass
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl entry point; status and shard-plan start without "
+                                                 "the heavy dependencies")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    status_cmd = commands.add_parser("status", help="checkpoint, output and quota counts")
+    add_shard_argument(status_cmd)
+    status_cmd.add_argument("--shards", type=int, default=0, help="report every shard of N")
+    status_cmd.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    status_cmd.add_argument("--json", action="store_true", help="print one JSON object instead")
+
+    plan_cmd = commands.add_parser("shard-plan", help="how the channels split over N shards")
+    plan_cmd.add_argument("--shards", type=int, required=True)
+    plan_cmd.add_argument("--channels", default=None,
+                          help=f"channel list to split (default: {FILTERED_CSV} if built, else {CHANNELS_CSV})")
+    plan_cmd.add_argument("--json", action="store_true")
+
+    commands.add_parser("resume", add_help=False, help="continue the crawl from its checkpoints (init.py pipeline)")
+    for name in INIT_COMMANDS:
+        commands.add_parser(name, add_help=False, help=f"init.py {name}")
+    args, rest = parser.parse_known_args()
+
+    if args.command in INIT_COMMANDS:
+        run_init([args.command] + rest)
+    elif args.command == "resume":
+        run_init(['pipeline'] + rest)
+    elif rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    elif args.command == "status":
+        if args.shards:
+            shards = [Shard(index, args.shards) for index in range(args.shards)]
+        else:
+            shards = [args.shard]
+        report = {'time': time.time(),
+                  'shards': [shard_status(shard, args.format) for shard in shards],
+                  'quota': quota_status()}
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print_status(report['shards'], report['quota'])
+    elif args.command == "shard-plan":
+        if args.shards < 1:
+            parser.error("shard-plan needs --shards N >= 1")
+        channels_csv = args.channels or (FILTERED_CSV if os.path.exists(FILTERED_CSV) else CHANNELS_CSV)
+        plan = shard_plan(channels_csv, args.shards)
+        if args.json:
+            print(json.dumps(plan))
+        else:
+            print(f"{channels_csv} over {args.shards} shards:")
+            for entry in plan:
+                print(f"  {entry['shard']:>7}  {entry['channels']:>9,} channels  {entry['total_videos']:>12,} videos"
+                      f"   python crawl.py resume --shard {entry['shard']}")
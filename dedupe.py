@@ -0,0 +1,362 @@
+import os
+import re
+import csv
+import zlib
+import sqlite3
+import logging
+import argparse
+import numpy as np
+
+from sinks import iter_transcripts, FORMATS
+from sharding import add_shard_argument, shard_path
+from telemetry import metrics
+
+# Near-duplicate transcripts (reuploads, compilations, spam networks).
+#
+# Each transcript becomes a set of hashed word shingles and a MinHash
+# signature of NUM_PERM uint32s, computed as NumPy arrays a batch at a time.
+# Signatures are appended to signatures.bin (row i = document i), and an LSH
+# table in index.db puts every document into BANDS buckets of ROWS
+# signature values each. Documents sharing a bucket are candidates; a
+# candidate pair is kept when the signatures agree on at least
+# SIMILARITY_THRESHOLD of their positions (the estimated Jaccard similarity).
+# New transcripts only look up and add their own buckets, so the index grows
+# incrementally; clusters are the connected components of the kept pairs.
+
+DEDUPE_DIR = "./data/dedupe"
+TRANSCRIPTS_CSV = "./data/transcripts.csv"
+DUPLICATES_CSV = "./data/duplicate_clusters.csv"
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# with 16 bands of 8 rows, pairs above ~0.7 Jaccard almost always collide
+SIMILARITY_THRESHOLD = 0.8
+# a bucket shared by thousands of identical spam uploads is only compared
+# against its oldest members; that is enough to put them in one cluster
+MAX_BUCKET_CANDIDATES = 50
+BATCH_SIZE = 1000
+SEED = 1
+
+HASH_PRIME = (1 << 32) - 5
+MIX = np.uint64(1099511628211)
+WORD_RE = re.compile(r"\w+")
+SIGNATURE_DTYPE = np.dtype('<u4')
+
+
+def _permutations(num_perm=NUM_PERM, seed=SEED):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, HASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, HASH_PRIME, num_perm, dtype=np.uint64)
+    return a, b
+
+
+PERM_A, PERM_B = _permutations()
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Distinct 32-bit hashes of the k-word shingles of text (the whole text when shorter)"""
+    words = WORD_RE.findall(str(text).lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(w.encode('utf-8')) for w in words), dtype=np.uint64, count=len(words))
+    width = max(len(words) - k + 1, 1)
+    combined = np.zeros(width, dtype=np.uint64)
+    for j in range(min(k, len(words))):
+        combined = combined * MIX ^ hashes[j:j + width]
+    return np.unique(combined & np.uint64(0xFFFFFFFF))
+
+
+def minhash(shingle_hashes, block=4096):
+    """NUM_PERM-long signature: min over shingles of (a*x + b) mod p per permutation"""
+    signature = np.full(NUM_PERM, HASH_PRIME, dtype=np.uint64)
+    # a, x < 2**32, so a*x + b stays inside uint64; blocks bound the (shingles x NUM_PERM) temporary
+    for start in range(0, len(shingle_hashes), block):
+        x = shingle_hashes[start:start + block, None]
+        np.minimum(signature, ((x * PERM_A + PERM_B) % HASH_PRIME).min(axis=0), out=signature)
+    return signature.astype(SIGNATURE_DTYPE)
+
+
+def signatures(texts):
+    """(n, NUM_PERM) signatures for a batch, plus a mask of the texts that had any words"""
+    sigs = np.zeros((len(texts), NUM_PERM), dtype=SIGNATURE_DTYPE)
+    valid = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        hashes = shingles(text)
+        if len(hashes):
+            sigs[i] = minhash(hashes)
+            valid[i] = True
+    return sigs, valid
+
+
+def band_hashes(sigs):
+    """(n, BANDS) int64 bucket keys"""
+    banded = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    keys = np.zeros((len(sigs), BANDS), dtype=np.uint64)
+    for r in range(ROWS):
+        keys = keys * MIX ^ banded[:, :, r]
+    return keys.view(np.int64)
+
+
+class MinHashIndex:
+    """
+    Persistent, incrementally updated MinHash/LSH index.
+    update() adds transcripts it hasn't seen, clusters() groups the
+    near-duplicates found so far.
+    """
+    def __init__(self, path=DEDUPE_DIR, threshold=SIMILARITY_THRESHOLD, max_candidates=MAX_BUCKET_CANDIDATES):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS docs (
+                   doc INTEGER PRIMARY KEY,
+                   video_id TEXT NOT NULL UNIQUE,
+                   channel_name TEXT
+               )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS buckets (
+                   band INTEGER NOT NULL,
+                   hash INTEGER NOT NULL,
+                   doc INTEGER NOT NULL,
+                   PRIMARY KEY (band, hash, doc)
+               ) WITHOUT ROWID"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS pairs (
+                   a INTEGER NOT NULL,
+                   b INTEGER NOT NULL,
+                   similarity REAL NOT NULL,
+                   PRIMARY KEY (a, b)
+               ) WITHOUT ROWID"""
+        )
+        # videos whose transcript has no words to shingle, so updates don't re-read them
+        self.conn.execute("CREATE TABLE IF NOT EXISTS empty_docs (video_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._check_meta()
+        self.conn.commit()
+
+        self.sig_path = os.path.join(path, 'signatures.bin')
+        self.docs = self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        self.sig_file = open(self.sig_path, 'ab')
+        # rows written after the last commit belong to no document; drop them
+        self.sig_file.truncate(self.docs * NUM_PERM * SIGNATURE_DTYPE.itemsize)
+
+    def _check_meta(self):
+        config = {'shingle_words': SHINGLE_WORDS, 'num_perm': NUM_PERM, 'bands': BANDS, 'seed': SEED}
+        stored = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if not stored:
+            self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in config.items()])
+        elif stored != {k: str(v) for k, v in config.items()}:
+            raise ValueError(f"{self.path} was built with {stored}, current settings are {config}; "
+                             f"use another directory or rebuild")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.docs
+
+    def indexed_videos(self):
+        """Video IDs already seen: indexed documents and empty transcripts"""
+        seen = {row[0] for row in self.conn.execute("SELECT video_id FROM docs")}
+        seen.update(row[0] for row in self.conn.execute("SELECT video_id FROM empty_docs"))
+        return seen
+
+    def _signature_rows(self):
+        if not self.docs:
+            return np.empty((0, NUM_PERM), dtype=SIGNATURE_DTYPE)
+        return np.memmap(self.sig_path, dtype=SIGNATURE_DTYPE, mode='r', shape=(self.docs, NUM_PERM))
+
+    def add_batch(self, rows):
+        """
+        Indexes (channel_name, video_id, text) rows and records their
+        near-duplicates; returns (documents indexed, new duplicate pairs).
+        Rows without words are only recorded in empty_docs.
+        """
+        sigs, valid = signatures([text for _, _, text in rows])
+        empty = [video_id for (_, video_id, _), ok in zip(rows, valid) if not ok]
+        if empty:
+            self.conn.executemany("INSERT OR IGNORE INTO empty_docs VALUES (?)", ((v,) for v in empty))
+            self.conn.commit()
+        rows = [row for row, ok in zip(rows, valid) if ok]
+        sigs = sigs[valid]
+        if not rows:
+            return 0, 0
+        first = self.docs
+        docs = np.arange(first, first + len(rows))
+        keys = band_hashes(sigs)
+
+        self.sig_file.write(sigs.tobytes())
+        self.sig_file.flush()
+        os.fsync(self.sig_file.fileno())
+        self.conn.executemany("INSERT INTO docs VALUES (?, ?, ?)",
+                              ((int(d), video_id, channel_name) for d, (channel_name, video_id, _) in zip(docs, rows)))
+        self.conn.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                              ((band, int(keys[i, band]), int(docs[i]))
+                               for i in range(len(rows)) for band in range(BANDS)))
+        self.docs += len(rows)
+
+        # candidates: anything sharing a bucket, including earlier docs of this batch
+        pairs = set()
+        for i, doc in enumerate(docs.tolist()):
+            for band in range(BANDS):
+                for (other,) in self.conn.execute(
+                        "SELECT doc FROM buckets WHERE band = ? AND hash = ? AND doc != ? ORDER BY doc LIMIT ?",
+                        (band, int(keys[i, band]), doc, self.max_candidates)):
+                    pairs.add((min(doc, other), max(doc, other)))
+        found = 0
+        if pairs:
+            a, b = np.array(sorted(pairs)).T
+            all_sigs = self._signature_rows()
+            similarity = (all_sigs[a] == all_sigs[b]).mean(axis=1)
+            keep = similarity >= self.threshold
+            found = self.conn.executemany(
+                "INSERT OR IGNORE INTO pairs VALUES (?, ?, ?)",
+                zip(a[keep].tolist(), b[keep].tolist(), similarity[keep].round(4).tolist())).rowcount
+        self.conn.commit()
+        metrics.inc('dedupe_documents_total', len(rows))
+        metrics.inc('dedupe_pairs_total', found)
+        return len(rows), found
+
+    def update(self, transcripts, batch_size=BATCH_SIZE, known=None):
+        """
+        Adds every (channel_name, video_id, text) not indexed yet; returns
+        (documents, pairs) added. known is indexed_videos() when the caller
+        already has it; it is updated in place.
+        """
+        known = self.indexed_videos() if known is None else known
+        progress = metrics.progress('dedupe')
+        batch, added, found = [], 0, 0
+        for row in transcripts:
+            if row[1] in known:
+                continue
+            known.add(row[1])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                indexed, pairs = self.add_batch(batch)
+                added += indexed
+                found += pairs
+                progress.advance(len(batch))
+                logging.info(f"Dedupe: {added} transcripts indexed, {found} near-duplicate pairs")
+                batch = []
+        if batch:
+            indexed, pairs = self.add_batch(batch)
+            added += indexed
+            found += pairs
+            progress.advance(len(batch))
+        return added, found
+
+    def similar(self, video_id):
+        """[(video_id, channel_name, similarity)] of the near-duplicates of one video"""
+        return self.conn.execute(
+            """SELECT d.video_id, d.channel_name, p.similarity
+               FROM docs src
+               JOIN pairs p ON p.a = src.doc OR p.b = src.doc
+               JOIN docs d ON d.doc = CASE WHEN p.a = src.doc THEN p.b ELSE p.a END
+               WHERE src.video_id = ?
+               ORDER BY p.similarity DESC""",
+            (video_id,)
+        ).fetchall()
+
+    def clusters(self, min_size=2):
+        """Lists of (video_id, channel_name) per duplicate cluster, oldest document first"""
+        parent = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                parent[x] = parent.get(parent[x], parent[x])
+                x = parent[x]
+            return x
+
+        for a, b in self.conn.execute("SELECT a, b FROM pairs"):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        members = {}
+        for doc in parent:
+            members.setdefault(find(doc), []).append(doc)
+        for root in list(members):
+            members[root].append(root)
+        out = []
+        for docs in members.values():
+            if len(docs) < min_size:
+                continue
+            docs = sorted(set(docs))
+            placeholders = ','.join('?' * len(docs))
+            out.append(self.conn.execute(
+                f"SELECT video_id, channel_name FROM docs WHERE doc IN ({placeholders}) ORDER BY doc", docs
+            ).fetchall())
+        out.sort(key=len, reverse=True)
+        return out
+
+    def write_clusters(self, path=DUPLICATES_CSV, min_size=2):
+        """
+        One row per clustered video: cluster (video ID of the first upload
+        seen), video_id, channel_name, cluster_size, cluster_channels.
+        """
+        clusters = self.clusters(min_size)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['cluster', 'video_id', 'channel_name', 'cluster_size', 'cluster_channels'])
+            for members in clusters:
+                channels = len({channel_name for _, channel_name in members})
+                for video_id, channel_name in members:
+                    writer.writerow([members[0][0], video_id, channel_name, len(members), channels])
+        os.replace(tmp, path)
+        return len(clusters)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        self.sig_file.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Near-duplicate transcript detection (MinHash/LSH)")
+    parser.add_argument("--dir", default=DEDUPE_DIR, help="index directory")
+    add_shard_argument(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update = commands.add_parser("update", help="index transcripts that aren't in the index yet")
+    update.add_argument("--format", choices=FORMATS, default='csv', help="format of the step3 output")
+    update.add_argument("--store", action="store_true", help="read transcripts from the transcript store")
+    update.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    update.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+
+    clusters_cmd = commands.add_parser("clusters", help=f"write duplicate clusters to {DUPLICATES_CSV}")
+    clusters_cmd.add_argument("--out", default=DUPLICATES_CSV)
+    clusters_cmd.add_argument("--min-size", type=int, default=2)
+    similar_cmd = commands.add_parser("similar", help="near-duplicates of one video")
+    similar_cmd.add_argument("video_id")
+    args = parser.parse_args()
+
+    index_dir = shard_path(args.dir, args.shard)
+    if args.command == "update":
+        from transcript_store import TRANSCRIPT_STORE_DIR
+        with MinHashIndex(index_dir, threshold=args.threshold) as index:
+            store_dir = shard_path(TRANSCRIPT_STORE_DIR, args.shard) if args.store else None
+            known = index.indexed_videos()
+            rows = iter_transcripts(shard_path(TRANSCRIPTS_CSV, args.shard), args.format, store_dir,
+                                    skip=known)
+            added, found = index.update(rows, args.batch_size, known)
+            print(f"Indexed {added} new transcripts ({len(index)} total), {found} new near-duplicate pairs")
+    elif args.command == "clusters":
+        with MinHashIndex(index_dir) as index:
+            out = shard_path(args.out, args.shard)
+            print(f"{index.write_clusters(out, args.min_size)} clusters written to {out}")
+    elif args.command == "similar":
+        with MinHashIndex(index_dir) as index:
+            for video_id, channel_name, similarity in index.similar(args.video_id):
+                print(f"{similarity:.2f}\t{video_id}\t{channel_name}")
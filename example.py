@@ -3,25 +3,26 @@
 # https://www.youtube.com/@lmsys-org/videos
 
 
-import numpy as np
-import pandas as pd
 import os
 
-from googleapiclient.discovery import build
-from youtube_transcript_api import YouTubeTranscriptApi
-
 import time, requests
+import argparse
+from quota import build_youtube
+from search_cache import SearchCache
+from transcript_cache import TranscriptCache, fetch_transcript, OK
+from sharding import add_shard_argument, shard_mask, shard_path
 
 API_KEY = 'API KEY'
 
-# Construct a Resource for interacting with an API
-# https://stackoverflow.com/questions/46158127/youtube-api-get-upload-playlistid-for-youtube-channel 
-youtube = build('youtube', 'v3', developerKey=API_KEY)
-
+dataset_path = './data/youtube_channels_1M_clean.csv'
 
+# Set up by main(), so importing this file builds no client and reads no CSV.
+# The client comes from the cached discovery document (see quota.py).
+# https://stackoverflow.com/questions/46158127/youtube-api-get-upload-playlistid-for-youtube-channel 
+youtube = None
+search_cache = None
+transcript_cache = None
 
-dataset_path = './data/youtube_channels_1M_clean.csv'
-df = pd.read_csv(dataset_path)
 
 """ # get uploads playlist id 
 def get_playlist_id(channel_name):
@@ -62,50 +63,45 @@ def get_video_ids(playlist_id):
         return []
  """
 
-# fetching transcripts (from each video id)
-
-# total_videos = df['total_videos'].sum()
-#print("\n total_videos (sum from csv):", total_videos)
-# 453246133
-top_50_channels = df.nlargest(50, 'total_videos')
-
-# removing top 50 channels with too many videos (more than 100000)
-channels_to_remove = top_50_channels[top_50_channels['total_videos'] > 100000]
-# print("\n channels to remove because they have too many videos:")
-# print(channels_to_remove)
-print("\n amount of channels before removing:", len(df))
-
-df = df[~df['channel_name'].isin(channels_to_remove['channel_name'])]
-df['channel_name'] = df['channel_name'].fillna('')
-
-# removing channels with keywords 'india', 'hindi', 'telugu', 'tamil', 'malayalam'
-keywords_to_remove = ['india', 'hindi', 'telugu', 'tamil', 'malayalam']
-channels_to_remove = df[df['channel_name'].str.lower().str.contains('|'.join(keywords_to_remove))]
-# print(channels_to_remove)
-df = df[~df['channel_name'].str.lower().str.contains('|'.join(keywords_to_remove))]
-
-# removing channels with more than 10000 videos
-df = df[df['total_videos'] <= 10000]
-
-# removing channels with 0 videos
-df = df[df['total_videos'] > 0]
-
-# total amount of channels & videos
-print("\n amount of channels after removing:", len(df))
-print(df['total_videos']/100000, 'M videos')
-
-
-# 18 M videos top 50
-print(df.nlargest(50, 'total_videos'))
-
-print(top_50_channels['total_videos'])
-
-print(top_50_channels['total_videos'].sum())
-
-output_path = "./data/youtube_transcripts.csv"
+def load_channels(shard=None):
+    """Reads the filtered channel manifest, printing its stats; only shard's rows with shard set"""
+    import pandas as pd
+    from channel_filter import ensure_manifest, load_stats
+
+    # the cleaning rules (top 50 cap, keyword exclusion, total_videos bounds)
+    # live in channel_filter.py, shared with init.py / api.py / pytube1.py; the
+    # filtered manifest is cached and only rebuilt when the input changes
+    df = pd.read_csv(ensure_manifest(dataset_path))
+
+    # total_videos = df['total_videos'].sum()
+    #print("\n total_videos (sum from csv):", total_videos)
+    # 453246133
+    # removing top 50 channels with too many videos (more than 100000)
+    # removing channels with keywords 'india', 'hindi', 'telugu', 'tamil', 'malayalam'
+    # removing channels with more than 10000 videos
+    # removing channels with 0 videos
+    filter_stats = load_stats()
+    print("\n amount of channels before removing:", filter_stats['rows_in'])
+    print(" removed: top 50", filter_stats['dropped_top_k'], "| keywords", filter_stats['dropped_keywords'],
+          "| video bounds", filter_stats['dropped_bounds'])
+
+    # total amount of channels & videos
+    print("\n amount of channels after removing:", len(df))
+    print(filter_stats['total_videos_out']/1000000, 'M videos')
+
+    if shard is not None:
+        df = df[shard_mask(df['channel_name'].astype(str).str.strip(), shard)]
+        print(f"\n shard {shard.index}/{shard.count}: {len(df)} channels")
+
+    # 18 M videos top 50
+    print(df.nlargest(50, 'total_videos'))
+    return df
 
 # Function to get the 'uploads' playlist ID
 def get_uploads_playlist_id(channel_name):
+    cached = search_cache.get(channel_name)
+    if cached is not None:
+        return cached.uploads_playlist_id
     try:
         request = youtube.channels().list(
             part="contentDetails",
@@ -113,7 +109,17 @@ def get_uploads_playlist_id(channel_name):
             forUsername=channel_name if not channel_name.startswith("UC") else None
         )
         response = request.execute()
-        uploads_playlist_id = response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+        if not response.get('items'):
+            # negative-cache it so the next run doesn't ask again; a forUsername
+            # miss is not cached, since init.py/api.py read the same entries to
+            # skip search.list, which usually does find modern handles
+            if channel_name.startswith("UC"):
+                search_cache.put(channel_name, None)
+            print(f"Channel not found: {channel_name}")
+            return None
+        item = response['items'][0]
+        uploads_playlist_id = item['contentDetails']['relatedPlaylists']['uploads']
+        search_cache.put(channel_name, item['id'], uploads_playlist_id)
         return uploads_playlist_id
     except Exception as e:
         print(f"Error fetching playlist ID for {channel_name}: {e}")
@@ -145,63 +151,94 @@ def get_video_ids_from_playlist(playlist_id):
 def get_transcripts(video_ids):
     transcripts = {}
     for video_id in video_ids:
-        try:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
-            transcripts[video_id] = " ".join([entry['text'] for entry in transcript])
-        except Exception as e:
-            print(f"Could not retrieve transcript for video ID {video_id}: {e}")
+        if transcript_cache.should_skip(video_id):
+            continue
+        outcome = fetch_transcript(video_id)
+        transcript_cache.record(video_id, outcome.status, outcome.languages)
+        if outcome.status == OK:
+            transcripts[video_id] = outcome.text
+        else:
+            print(f"Could not retrieve transcript for video ID {video_id}: {outcome.status}")
     return transcripts
 
 # Function to append processed data to CSV
 def append_to_csv(data, output_file):
+    import pandas as pd
     df = pd.DataFrame(data)
     if not os.path.isfile(output_file):
         df.to_csv(output_file, index=False)  # Write header if file doesn't exist
     else:
         df.to_csv(output_file, mode='a', header=False, index=False)  # Append without header
 
-# Main logic
-last_processed_video_id = None  # Track the last processed video ID
+def main():
+    global youtube, search_cache, transcript_cache
 
-for index, row in df.iterrows():
-    channel_name = row['channel_name']
-    print(f"Processing channel {channel_name} ({channel_name})...")
+    # --shard i/N: only crawl this shard's channels, into its own output file
+    parser = argparse.ArgumentParser()
+    add_shard_argument(parser)
+    args, _ = parser.parse_known_args()
 
-    # Step 1: Get 'uploads' playlist ID
-    uploads_playlist_id = get_uploads_playlist_id(channel_name)
-    if not uploads_playlist_id:
-        continue
+    youtube = build_youtube(API_KEY)
+    df = load_channels(args.shard)
+    output_path = shard_path("./data/youtube_transcripts.csv", args.shard)
 
-    # Step 2: Fetch video IDs from the playlist
-    video_ids = get_video_ids_from_playlist(uploads_playlist_id)
-    print(f"Found {len(video_ids)} videos for channel {channel_name}")
+    # shared with init.py / api.py, so names resolved there cost nothing here
+    search_cache = SearchCache()
+    # known-dead videos (captions disabled, not found, ...) are skipped until
+    # their retry time; see transcript_cache.py
+    transcript_cache = TranscriptCache()
 
-    # Step 3: Fetch transcripts for all videos
-    for video_id in video_ids:
-        # Skip already processed videos
-        if last_processed_video_id and video_id <= last_processed_video_id:
-            continue
+    # Main logic
+    last_processed_video_id = None  # Track the last processed video ID
 
-        try:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
-            transcript_text = " ".join([entry['text'] for entry in transcript])
-
-            # Append data to CSV
-            append_to_csv([{
-                'Channel Name': channel_name,
-                'Channel Identifier': channel_name,
-                'Playlist ID': uploads_playlist_id,
-                'Video ID': video_id,
-                'Transcript': transcript_text
-            }], output_path)
-
-            # Update the last processed video ID
-            last_processed_video_id = video_id
-            print(f"Successfully processed video ID {video_id}")
+    for index, row in df.iterrows():
+        channel_name = row['channel_name']
+        print(f"Processing channel {channel_name} ({channel_name})...")
 
-        except Exception as e:
-            print(f"Error processing video ID {video_id}: {e}")
+        # Step 1: Get 'uploads' playlist ID
+        uploads_playlist_id = get_uploads_playlist_id(channel_name)
+        if not uploads_playlist_id:
             continue
+
+        # Step 2: Fetch video IDs from the playlist
+        video_ids = get_video_ids_from_playlist(uploads_playlist_id)
+        print(f"Found {len(video_ids)} videos for channel {channel_name}")
+
+        # Step 3: Fetch transcripts for all videos
+        for video_id in video_ids:
+            # Skip already processed videos
+            if last_processed_video_id and video_id <= last_processed_video_id:
+                continue
+            if transcript_cache.should_skip(video_id):
+                continue
+
+            try:
+                outcome = fetch_transcript(video_id)
+                transcript_cache.record(video_id, outcome.status, outcome.languages)
+                if outcome.status != OK:
+                    print(f"Error processing video ID {video_id}: {outcome.status}")
+                    continue
+                transcript_text = outcome.text
+
+                # Append data to CSV
+                append_to_csv([{
+                    'Channel Name': channel_name,
+                    'Channel Identifier': channel_name,
+                    'Playlist ID': uploads_playlist_id,
+                    'Video ID': video_id,
+                    'Transcript': transcript_text
+                }], output_path)
+
+                # Update the last processed video ID
+                last_processed_video_id = video_id
+                print(f"Successfully processed video ID {video_id}")
+
+            except Exception as e:
+                print(f"Error processing video ID {video_id}: {e}")
+                continue
+
+    search_cache.close()
+    transcript_cache.close()
     
 
 # print(df.head())
@@ -265,4 +302,7 @@ def step1_get_playlists():
     if not results:
         print("No new playlists were added.")
 
-"""
\ No newline at end of file
+"""
+
+if __name__ == "__main__":
+    main()
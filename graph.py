@@ -0,0 +1,414 @@
+import os
+import re
+import zlib
+import sqlite3
+import logging
+import argparse
+import numpy as np
+
+from sinks import iter_output_chunks, iter_transcripts, FORMATS
+from sharding import add_shard_argument, shard_path
+
+# Channel/video graph of the crawled corpus, stored as CSR arrays.
+#
+# Every channel in upload_playlists.csv and every video in video_ids.csv is
+# a node with a dense integer ID (kinds.npy says which is which; nodes.db
+# maps IDs to channel names / video IDs and back). Edges are undirected and
+# stored in both directions:
+#   channel -- video   membership, weight 1
+#   video   -- video   transcript similarity: videos that share rare terms,
+#                      weight = shared terms / SIMILARITY_TERMS
+# The adjacency is indptr (int64, nodes+1), indices (int32) and weights
+# (float32) saved as .npy and opened with mmap_mode='r', so traversals over
+# millions of nodes only page in the rows they touch. BFS, connected
+# components and PageRank below work on whole frontiers / edge arrays at a
+# time instead of per-node Python objects.
+
+GRAPH_DIR = "./data/graph"
+PLAYLISTS_CSV = "./data/upload_playlists.csv"
+VIDEOIDS_CSV = "./data/video_ids.csv"
+TRANSCRIPTS_CSV = "./data/transcripts.csv"
+
+CHANNEL = 0
+VIDEO = 1
+KIND_NAMES = {CHANNEL: 'channel', VIDEO: 'video'}
+
+# transcript similarity: terms are hashed into TERM_BUCKETS document-frequency
+# counters; each video keeps its SIMILARITY_TERMS rarest terms that occur in
+# 2..MAX_TERM_DF videos, and two videos are linked when they share at least
+# MIN_SHARED_TERMS of them
+TERM_BUCKETS = 1 << 22
+SIMILARITY_TERMS = 8
+MAX_TERM_DF = 20
+MIN_SHARED_TERMS = 2
+TOKEN_RE = re.compile(r"[^\W\d_]{4,}")
+
+
+# ==================
+# === Construction
+# ==================
+
+class NodeMap:
+    """(kind, key) -> dense node ID, assigned in insertion order"""
+    def __init__(self):
+        self.ids = {}
+        self.kinds = []
+        self.keys = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def get(self, kind, key):
+        return self.ids.get((kind, key))
+
+    def add(self, kind, key):
+        node = self.ids.get((kind, key))
+        if node is None:
+            node = self.ids[(kind, key)] = len(self.kinds)
+            self.kinds.append(kind)
+            self.keys.append(key)
+        return node
+
+    def add_many(self, kind, keys):
+        return np.fromiter((self.add(kind, k) for k in keys), dtype=np.int32, count=len(keys))
+
+
+def term_hashes(text):
+    """Distinct hashed terms of a transcript (crc32, so they are stable across runs)"""
+    terms = {zlib.crc32(t.encode('utf-8')) % TERM_BUCKETS for t in TOKEN_RE.findall(str(text).lower())}
+    return np.fromiter(terms, dtype=np.int64, count=len(terms))
+
+
+def similarity_edges(nodes, transcripts, max_df=MAX_TERM_DF, terms_per_video=SIMILARITY_TERMS,
+                     min_shared=MIN_SHARED_TERMS):
+    """
+    Video-video edges from shared rare transcript terms.
+    transcripts is a callable returning a fresh (video_id, text) iterator;
+    it is read twice (document frequencies, then terms per video).
+    Returns (src, dst, weights) with src < dst.
+    """
+    df = np.zeros(TERM_BUCKETS, dtype=np.int32)
+    for _, text in transcripts():
+        df[term_hashes(text)] += 1
+
+    pair_terms, pair_nodes = [], []
+    for video_id, text in transcripts():
+        node = nodes.get(VIDEO, video_id)
+        if node is None:
+            continue
+        terms = term_hashes(text)
+        counts = df[terms]
+        terms = terms[(counts >= 2) & (counts <= max_df)]
+        if not len(terms):
+            continue
+        rarest = terms[np.argsort(df[terms], kind='stable')[:terms_per_video]]
+        pair_terms.append(rarest)
+        pair_nodes.append(np.full(len(rarest), node, dtype=np.int32))
+    del df
+    if not pair_terms:
+        return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32)
+
+    terms = np.concatenate(pair_terms)
+    members = np.concatenate(pair_nodes)
+    order = np.argsort(terms, kind='stable')
+    terms, members = terms[order], members[order]
+
+    # a term is shared by at most max_df videos, so every pair of videos under
+    # the same term is at most max_df - 1 positions apart in the sorted arrays
+    keys = []
+    n = np.int64(len(nodes))
+    for gap in range(1, max_df):
+        same = terms[gap:] == terms[:-gap]
+        if not same.any():
+            break
+        a, b = members[:-gap][same].astype(np.int64), members[gap:][same].astype(np.int64)
+        keys.append(np.minimum(a, b) * n + np.maximum(a, b))
+    if not keys:
+        return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32)
+    keys, shared = np.unique(np.concatenate(keys), return_counts=True)
+    keep = shared >= min_shared
+    keys, shared = keys[keep], shared[keep]
+    return ((keys // n).astype(np.int32), (keys % n).astype(np.int32),
+            (shared / terms_per_video).astype(np.float32))
+
+
+def to_csr(num_nodes, src, dst, weights):
+    """Undirected edge list -> (indptr, indices, weights), both directions, duplicates dropped"""
+    src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+    weights = np.concatenate([weights, weights])
+    keys = src.astype(np.int64) * num_nodes + dst
+    keys, first = np.unique(keys, return_index=True)
+    indices = (keys % num_nodes).astype(np.int32)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount((keys // num_nodes).astype(np.int64), minlength=num_nodes), out=indptr[1:])
+    return indptr, indices, weights[first]
+
+
+def _save_array(path, array):
+    # np.save appends .npy to names that lack it, so the temp name keeps the suffix
+    tmp = path[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def build_graph(graph_dir=GRAPH_DIR, playlists_csv=PLAYLISTS_CSV, videoids_csv=VIDEOIDS_CSV,
+                transcripts_csv=TRANSCRIPTS_CSV, fmt='csv', store_dir=None, similarity=True,
+                max_df=MAX_TERM_DF, terms_per_video=SIMILARITY_TERMS, min_shared=MIN_SHARED_TERMS):
+    """
+    Rebuilds the graph in graph_dir from the step1-3 outputs (playlists CSV,
+    video IDs and transcripts in fmt, or a TranscriptStore with store_dir).
+    """
+    os.makedirs(graph_dir, exist_ok=True)
+    nodes = NodeMap()
+    if os.path.exists(playlists_csv):
+        for chunk in iter_output_chunks(playlists_csv, ['channel_name'], 'csv', key='channel_name'):
+            for name in chunk['channel_name']:
+                nodes.add(CHANNEL, name)
+
+    src, dst = [], []
+    for chunk in iter_output_chunks(videoids_csv, ['channel_name', 'video_id'], fmt, key='video_id'):
+        chunk = chunk[chunk['video_id'] != '']
+        names = chunk['channel_name'].astype(object).fillna('').astype(str).str.strip()
+        src.append(nodes.add_many(CHANNEL, names.tolist()))
+        dst.append(nodes.add_many(VIDEO, chunk['video_id'].tolist()))
+    logging.info(f"Graph: {len(nodes)} nodes, {sum(len(s) for s in src)} membership edges")
+    src = np.concatenate(src) if src else np.empty(0, np.int32)
+    dst = np.concatenate(dst) if dst else np.empty(0, np.int32)
+    weights = np.ones(len(src), dtype=np.float32)
+
+    if similarity:
+        def transcripts():
+            return ((video_id, text) for _, video_id, text in iter_transcripts(transcripts_csv, fmt, store_dir))
+
+        sim_src, sim_dst, sim_weights = similarity_edges(nodes, transcripts, max_df, terms_per_video, min_shared)
+        logging.info(f"Graph: {len(sim_src)} similarity edges")
+        src, dst = np.concatenate([src, sim_src]), np.concatenate([dst, sim_dst])
+        weights = np.concatenate([weights, sim_weights])
+
+    indptr, indices, weights = to_csr(len(nodes), src, dst, weights)
+    del src, dst
+    _save_array(os.path.join(graph_dir, 'indptr.npy'), indptr)
+    _save_array(os.path.join(graph_dir, 'indices.npy'), indices)
+    _save_array(os.path.join(graph_dir, 'weights.npy'), weights)
+    _save_array(os.path.join(graph_dir, 'kinds.npy'), np.asarray(nodes.kinds, dtype=np.uint8))
+
+    nodes_db = os.path.join(graph_dir, 'nodes.db')
+    if os.path.exists(nodes_db):
+        os.remove(nodes_db)
+    conn = sqlite3.connect(nodes_db)
+    conn.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY, kind INTEGER NOT NULL, key TEXT NOT NULL)")
+    conn.executemany("INSERT INTO nodes VALUES (?, ?, ?)", zip(range(len(nodes)), nodes.kinds, nodes.keys))
+    conn.execute("CREATE UNIQUE INDEX nodes_key ON nodes (key, kind)")
+    conn.commit()
+    conn.close()
+    logging.info(f"Graph written to {graph_dir}: {len(nodes)} nodes, {len(indices)} directed edges")
+    return CsrGraph(graph_dir)
+
+
+# ===============
+# === Reading
+# ===============
+
+class CsrGraph:
+    """Memory-mapped graph written by build_graph()"""
+    def __init__(self, graph_dir=GRAPH_DIR):
+        self.path = graph_dir
+        self.indptr = np.load(os.path.join(graph_dir, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(graph_dir, 'indices.npy'), mmap_mode='r')
+        self.weights = np.load(os.path.join(graph_dir, 'weights.npy'), mmap_mode='r')
+        self.kinds = np.load(os.path.join(graph_dir, 'kinds.npy'), mmap_mode='r')
+        self.conn = sqlite3.connect(os.path.join(graph_dir, 'nodes.db'), check_same_thread=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def num_edges(self):
+        """Undirected edges (each is stored twice)"""
+        return len(self.indices) // 2
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def node_id(self, key, kind=None):
+        """Node ID of a channel name or video ID, or None"""
+        if kind is None:
+            row = self.conn.execute("SELECT id FROM nodes WHERE key = ? ORDER BY kind LIMIT 1", (key,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT id FROM nodes WHERE key = ? AND kind = ?", (key, kind)).fetchone()
+        return row[0] if row else None
+
+    def node_key(self, node):
+        row = self.conn.execute("SELECT key FROM nodes WHERE id = ?", (int(node),)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.conn.close()
+
+
+# ================
+# === Algorithms
+# ================
+
+def _expand(indptr, indices, frontier):
+    """Concatenated neighbor lists of the frontier nodes, without a Python loop"""
+    starts = np.asarray(indptr[frontier])
+    lengths = np.asarray(indptr[frontier + 1]) - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int32)
+    # position of each output slot inside its own neighbor list
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.asarray(indices[np.repeat(starts, lengths) + offsets])
+
+
+def bfs(graph, source, max_depth=None):
+    """Hop distance from source to every node (-1 where unreachable or deeper than max_depth)"""
+    dist = np.full(len(graph), -1, dtype=np.int32)
+    dist[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+        depth += 1
+        reached = _expand(graph.indptr, graph.indices, frontier)
+        reached = np.unique(reached[dist[reached] < 0])
+        dist[reached] = depth
+        frontier = reached.astype(np.int64)
+    return dist
+
+
+def connected_components(graph):
+    """
+    Component label per node, 0..k-1 in order of each component's lowest node ID.
+    Min-label propagation with hooking and pointer jumping, so it takes a
+    handful of passes over the edge array rather than one BFS per component.
+    """
+    n = len(graph)
+    labels = np.arange(n, dtype=np.int64)
+    degrees = graph.degrees()
+    has_edges = np.flatnonzero(degrees)
+    starts = np.asarray(graph.indptr[:-1])[has_edges]
+    while len(has_edges):
+        smallest = np.minimum.reduceat(labels[graph.indices], starts)
+        changed = smallest < labels[has_edges]
+        if not changed.any():
+            break
+        # hook each root onto the smallest label seen next to any of its members
+        np.minimum.at(labels, labels[has_edges[changed]], smallest[changed])
+        np.minimum.at(labels, has_edges[changed], smallest[changed])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    return np.unique(labels, return_inverse=True)[1].astype(np.int32)
+
+
+def pagerank(graph, damping=0.85, tol=1e-6, max_iter=100, weighted=True):
+    """PageRank over the (symmetric) weighted adjacency; dangling nodes spread their rank uniformly"""
+    n = len(graph)
+    degrees = graph.degrees()
+    src = np.repeat(np.arange(n, dtype=np.int32), degrees)
+    weights = np.asarray(graph.weights, dtype=np.float64) if weighted else np.ones(len(graph.indices))
+    has_edges = degrees > 0
+    out_weight = np.zeros(n)
+    out_weight[has_edges] = np.add.reduceat(weights, np.asarray(graph.indptr[:-1])[has_edges])
+    share = weights / out_weight[src]
+    del weights
+    indices = np.asarray(graph.indices)
+
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(max_iter):
+        dangling = rank[~has_edges].sum()
+        new = np.bincount(indices, weights=rank[src] * share, minlength=n)
+        new = damping * (new + dangling / n) + (1.0 - damping) / n
+        delta = np.abs(new - rank).sum()
+        rank = new
+        if delta < tol:
+            break
+    logging.info(f"PageRank stopped after {iteration + 1} iterations (delta {delta:.2e})")
+    return rank
+
+
+def top_nodes(graph, scores, k=20, kind=None):
+    """[(key, kind name, score)] of the k highest scoring nodes, optionally of one kind"""
+    candidates = np.flatnonzero(np.asarray(graph.kinds) == kind) if kind is not None else np.arange(len(graph))
+    best = candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+    return [(graph.node_key(i), KIND_NAMES[int(graph.kinds[i])], float(scores[i])) for i in best]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build and query the channel/video graph")
+    parser.add_argument("--graph-dir", default=GRAPH_DIR)
+    add_shard_argument(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="(re)build the graph from the step1-3 outputs")
+    build.add_argument("--format", choices=FORMATS, default='csv', help="format of video_ids / transcripts")
+    build.add_argument("--store", action="store_true", help="read transcripts from the transcript store")
+    build.add_argument("--no-similarity", action="store_true", help="membership edges only")
+    build.add_argument("--max-df", type=int, default=MAX_TERM_DF)
+    build.add_argument("--terms", type=int, default=SIMILARITY_TERMS)
+    build.add_argument("--min-shared", type=int, default=MIN_SHARED_TERMS)
+
+    commands.add_parser("stats", help="node/edge counts and degree summary")
+    bfs_cmd = commands.add_parser("bfs", help="nodes within --depth hops of a channel name or video ID")
+    bfs_cmd.add_argument("key")
+    bfs_cmd.add_argument("--depth", type=int, default=2)
+    bfs_cmd.add_argument("--limit", type=int, default=50)
+    components_cmd = commands.add_parser("components", help="connected component sizes")
+    components_cmd.add_argument("--top", type=int, default=10)
+    pagerank_cmd = commands.add_parser("pagerank", help="highest PageRank channels/videos")
+    pagerank_cmd.add_argument("--top", type=int, default=20)
+    pagerank_cmd.add_argument("--kind", choices=['channel', 'video'], default=None)
+    pagerank_cmd.add_argument("--unweighted", action="store_true")
+    args = parser.parse_args()
+
+    graph_dir = shard_path(args.graph_dir, args.shard)
+    if args.command == "build":
+        from transcript_store import TRANSCRIPT_STORE_DIR
+        build_graph(graph_dir, shard_path(PLAYLISTS_CSV, args.shard), shard_path(VIDEOIDS_CSV, args.shard),
+                    shard_path(TRANSCRIPTS_CSV, args.shard), args.format,
+                    shard_path(TRANSCRIPT_STORE_DIR, args.shard) if args.store else None,
+                    not args.no_similarity, args.max_df, args.terms, args.min_shared).close()
+    else:
+        with CsrGraph(graph_dir) as graph:
+            if args.command == "stats":
+                degrees = graph.degrees()
+                kinds = np.asarray(graph.kinds)
+                print(f"{len(graph)} nodes ({int((kinds == CHANNEL).sum())} channels, "
+                      f"{int((kinds == VIDEO).sum())} videos), {graph.num_edges} edges")
+                if len(graph):
+                    print(f"degree: mean {degrees.mean():.2f}, max {degrees.max()}, "
+                          f"isolated {int((degrees == 0).sum())}")
+            elif args.command == "bfs":
+                source = graph.node_id(args.key)
+                if source is None:
+                    parser.error(f"'{args.key}' is not in the graph")
+                dist = bfs(graph, source, args.depth)
+                reached = np.flatnonzero(dist > 0)
+                print(f"{len(reached)} nodes within {args.depth} hops of {args.key}")
+                for node in reached[np.argsort(dist[reached], kind='stable')][:args.limit]:
+                    print(f"{dist[node]}\t{KIND_NAMES[int(graph.kinds[node])]}\t{graph.node_key(node)}")
+            elif args.command == "components":
+                labels = connected_components(graph)
+                sizes = np.bincount(labels)
+                print(f"{len(sizes)} components")
+                for label in np.argsort(-sizes, kind='stable')[:args.top]:
+                    example = graph.node_key(np.flatnonzero(labels == label)[0])
+                    print(f"{sizes[label]}\t{example}")
+            elif args.command == "pagerank":
+                kind = {'channel': CHANNEL, 'video': VIDEO}.get(args.kind)
+                ranks = pagerank(graph, weighted=not args.unweighted)
+                for key, kind_name, score in top_nodes(graph, ranks, args.top, kind):
+                    print(f"{score:.6g}\t{kind_name}\t{key}")
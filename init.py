@@ -4,25 +4,39 @@
 
 #This project is an automated YouTube data extraction and analysis tool designed to gather, process, and analyze large-scale YouTube channel data. It leverages the YouTube API to fetch "uploads" playlist IDs for channels, retrieves video IDs from these playlists, and extracts video transcripts. The tool handles API rate limits and quota management, ensuring continuous data collection. It stores the collected data in CSV files for easy access and further analysis. This project aims to provide researchers and developers with a robust framework for studying YouTube content trends, user behavior, and video metadata, enabling data-driven insights and applications.
 
-import numpy as np
-import pandas as pd
 import os
 import sys
-from googleapiclient.discovery import build
-from youtube_transcript_api import YouTubeTranscriptApi
 import csv
 import time, requests
 import logging
-from datetime import datetime, timedelta
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from checkpoint import CheckpointStore, CHECKPOINT_DB, DONE, FAILED, playlist_state, load_refresh_state
+from quota import QuotaScheduler, QuotaExhausted, load_api_keys
+from search_cache import SearchCache
+from transcript_cache import TranscriptCache, TRANSCRIPT_CACHE_DB, fetch_transcript, OK, RATE_LIMITED, TRANSIENT
+from resolver import BatchResolver, ID_COLUMNS, channel_id_from_row, search_channel_id, uploads_playlist_id
+from channel_reader import iter_rows, count_rows
+from sharding import add_shard_argument, shard_path, check_shard_count, check_merge, merge_outputs
+from channel_filter import ensure_manifest, load_rules, load_stats, FILTERED_CSV
+from priority import YieldStats, CrawlBudget, prioritized, load_channel_videos, make_score, SCORES, YIELD_STATS_JSON
+from throttle import AdaptiveThrottle
+from telemetry import metrics, add_telemetry_arguments, start_telemetry
+from transcript_store import TranscriptStore, TRANSCRIPT_STORE_DIR
+from video_listing import ListingError, make_lister, api_playlist_items, LISTERS
+from sinks import open_sink, output_path, iter_output_rows, count_output_rows, VIDEO_COLUMNS, TRANSCRIPT_COLUMNS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 API_KEY = 'API KEY'
 
-# Construct a Resource for interacting with an API
+# Every Data API call goes through the scheduler, which builds one client per
+# key in $YOUTUBE_API_KEYS (falling back to API_KEY), charges each call its
+# unit cost and rotates keys as they run out of quota.
 # https://stackoverflow.com/questions/46158127/youtube-api-get-upload-playlistid-for-youtube-channel 
-youtube = build('youtube', 'v3', developerKey=API_KEY)
+scheduler = QuotaScheduler(load_api_keys(API_KEY))
 
 
 
@@ -31,6 +45,8 @@ CHANNELS_CSV    = "./data/youtube_channels_1M_clean.csv"
 PLAYLISTS_CSV   = "./data/upload_playlists.csv"
 VIDEOIDS_CSV    = "./data/video_ids.csv"
 TRANSCRIPTS_CSV = "./data/transcripts.csv"
+# step2/step3 can write CSV or partitioned Parquet (see sinks.py); the
+# Parquet outputs live next to the CSV paths as video_ids.parquet etc.
 
 
 # =================================================
@@ -46,50 +62,23 @@ def get_last_processed(csv_file):
             last_row = row
         return last_row
 
-class QuotaHandler:
-    def __init__(self):
-        self.quota_exceeded = False
-        self.last_quota_reset = datetime.now()
-        
-    def handle_quota_exceeded(self):
-        self.quota_exceeded = True
-        # Calculate time until next quota reset (3 AM PST)
-        now = datetime.now()
-        next_reset = now.replace(hour=3, minute=0, second=0, microsecond=0)
-        if now.hour >= 3:
-            next_reset += timedelta(days=1)
-        
-        wait_seconds = (next_reset - now).total_seconds()
-        return wait_seconds
-
-def get_uploads_playlist_id(youtube, channel_name):
+def get_uploads_playlist_id(scheduler, channel_name, cache=None):
     """
-    Returns the 'uploads' playlist ID of a given channel_name. 
+    Returns the 'uploads' playlist ID of a given channel_name.
     channel_name can be either:
-      - A channel ID that starts with 'UC' (use 'id' parameter), or
-      - A channel username (use 'forUsername' parameter).
+      - A channel ID that starts with 'UC' (mapped to 'UU...' without any call), or
+      - A channel name, looked up with search.list (100 units) unless cache has it.
+    Raises QuotaExhausted when no key has quota left for the search.
     """
     try:
-        search_response = youtube.search().list(part='snippet', q=channel_name, type='channel', maxResults=1).execute()
-        if 'error' in search_response:
-            if search_response['error']['reason'] == 'quotaExceeded':
-                return None
-        if search_response['items']:
-            channel_id = search_response['items'][0]['id']['channelId']
-            request = youtube.channels().list(part='contentDetails', id=channel_id)
-            response = request.execute()
-            if 'items' in response:
-                uploads_playlist_id = response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-                logging.info(f"Playlist ID: {uploads_playlist_id}")
-                return uploads_playlist_id
-            else:
-                logging.warning("No items found in response")
-        else:
-            logging.warning("No items found in search response")
-            return None
+        channel_id = channel_name if channel_name.startswith('UC') else search_channel_id(scheduler, channel_name, cache)
+        uploads_id = uploads_playlist_id(channel_id)
+        if uploads_id:
+            logging.info(f"Playlist ID: {uploads_id}")
+        return uploads_id
+    except QuotaExhausted:
+        raise
     except Exception as e:
-        if 'quota' in str(e).lower():
-            return None
         logging.error(f"Error fetching playlist ID for {channel_name}: {e}")
         return None
 
@@ -99,125 +88,203 @@ def ensure_directory_exists():
 
 def append_to_playlist_csv(channel_name, playlist_id, playlists_csv):
     """Append new channel data to playlist CSV"""
-    mode = 'a' if os.path.exists(playlists_csv) else 'w'
     header = not os.path.exists(playlists_csv)
-    
-    df = pd.DataFrame([[channel_name, playlist_id]], 
-                     columns=['channel_name', 'uploads_playlist_id'])
-    df.to_csv(playlists_csv, mode=mode, header=header, index=False)
+    with open(playlists_csv, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(['channel_name', 'uploads_playlist_id'])
+        writer.writerow([channel_name, playlist_id])
 
-def update_last_processed(channel_name, last_processed_file):
-    """Update last processed channel file"""
-    with open(last_processed_file, 'a', encoding='utf-8') as f:
-        f.write(f"{channel_name}\n")
+def update_last_processed(channel_name, store):
+    """Mark a channel as processed in the checkpoint store"""
+    store.mark('channel', channel_name)
 
-def step1_get_playlists(youtube, channels_csv, playlists_csv, last_processed_file):
-    quota_handler = QuotaHandler()
+def record_resolved(results, playlists_csv, store, processed_channels, on_resolved=None):
+    """
+    Writes resolved (channel_name, channel_id, uploads_id) tuples and
+    checkpoints them; on_resolved(channel_name, uploads_id) is called after.
+    """
+    for channel_name, channel_id, pl_id in results:
+        if pl_id:
+            logging.info(f"Playlist ID: {pl_id}")
+            append_to_playlist_csv(channel_name, pl_id, playlists_csv)
+            update_last_processed(channel_name, store)
+            processed_channels.add(channel_name)
+            if on_resolved:
+                on_resolved(channel_name, pl_id)
+
+def step1_get_playlists(scheduler, channels_csv, playlists_csv, last_processed_file, checkpoint_db=CHECKPOINT_DB,
+                        verify_channels=False, start_row=0, shard=None, prioritize=None, budget=None,
+                        on_resolved=None, stop=None):
+    """
+    Resolves every channel in channels_csv to its uploads playlist.
+    Rows that already carry a channel ID (see resolver.channel_id_from_row)
+    are resolved without search.list, in channels.list batches of 50 when
+    verify_channels is set; only bare names are searched.
+    The CSV is streamed in chunks, skipping checkpointed channels as it goes,
+    and with shard set only that shard's channels are read.
+    prioritize names a priority.SCORES score ('yield' = expected videos per
+    quota unit) to resolve channels in; budget (a CrawlBudget) ends the run early.
+    on_resolved(channel_name, uploads_id) is called for every playlist once
+    it is written and checkpointed (the pipeline feeds step2 from it).
+    stop (a threading.Event) ends the wait for the quota reset early, and the run with it.
+    """
     ensure_directory_exists()
+    store = CheckpointStore(checkpoint_db)
+    # one-off import of the old text file so existing runs resume where they were
+    store.import_channel_list(last_processed_file)
+    cache = SearchCache()
+    # rough backlog for the queue depth / ETA gauges, counted once: a filtered
+    # manifest's stats already hold its row count, and a --start-row resume goes without
+    total = None
+    if not start_row:
+        manifest = load_stats(channels_csv)
+        rows_in_csv = manifest['rows_out'] if manifest else count_rows(channels_csv)
+        total = max(rows_in_csv // (shard.count if shard else 1) - len(store.done_keys('channel')), 0)
+    progress = metrics.progress('step1', total)
     
-    while True:
-        try:
-            df = pd.read_csv(channels_csv)
-            processed_channels = set()
-            
-            if os.path.exists(last_processed_file):
-                with open(last_processed_file, 'r') as f:
-                    processed_channels = set(line.strip() for line in f)
-            
-            for idx, row in df.iterrows():
-                channel_name = str(row['channel_name']).strip()
+    # one resolver for every retry: what it resolved or queued before the
+    # quota ran out is paid for and must not be looked up again
+    resolver = BatchResolver(scheduler, verify=verify_channels, cache=cache)
+    
+    try:
+        while True:
+            try:
+                processed_channels = store.done_keys('channel')
+                # write what was kept from before the last QuotaExhausted first
+                record_resolved(resolver.flush(), playlists_csv, store, processed_channels, on_resolved)
+                rows = iter_rows(channels_csv, columns=('channel_name', 'total_videos') + ID_COLUMNS,
+                                 key='channel_name', skip=processed_channels, start_row=start_row, shard=shard)
+                if prioritize:
+                    rows = prioritized(rows, make_score('step1', prioritize, YieldStats(YIELD_STATS_JSON),
+                                                             channel_id_of=channel_id_from_row))
                 
-                if channel_name in processed_channels:
-                    continue
+                for row in rows:
+                    if budget and budget.exhausted():
+                        break
+                    channel_name = row['channel_name']
+                    
+                    if not channel_name or channel_name in processed_channels:
+                        continue
+                    progress.advance()
+                        
+                    try:
+                        results = resolver.add(channel_name, channel_id_from_row(row))
+                    except QuotaExhausted:
+                        raise
+                    except Exception as e:
+                        logging.error(f"Error fetching playlist ID for {channel_name}: {e}")
+                        continue
+                    record_resolved(results, playlists_csv, store, processed_channels, on_resolved)
                     
-                pl_id = get_uploads_playlist_id(youtube, channel_name)
+                record_resolved(resolver.flush(), playlists_csv, store, processed_channels, on_resolved)
+                logging.info(f"Resolved with {resolver.searches} searches and {resolver.batches} channels.list batches")
+                break
                 
-                if pl_id is None and quota_handler.quota_exceeded:
-                    wait_time = quota_handler.handle_quota_exceeded()
-                    logging.info(f"Quota exceeded. Waiting {wait_time/3600:.1f} hours until reset")
-                    time.sleep(wait_time)
+            except QuotaExhausted as e:
+                # every key is spent; sleep until the daily reset and rescan
+                store.flush()
+                cache.flush()
+                logging.info(f"Quota exceeded on all keys. Waiting {e.wait_seconds/3600:.1f} hours until reset")
+                if stop is None:
+                    time.sleep(e.wait_seconds)
+                elif stop.wait(e.wait_seconds):
                     break
-                
-                if pl_id:
-                    append_to_playlist_csv(channel_name, pl_id, playlists_csv)
-                    update_last_processed(channel_name, last_processed_file)
-                    processed_channels.add(channel_name)
-                
-            if quota_handler.quota_exceeded:
                 continue
-                
-            break
-            
-        except Exception as e:
-            logging.error(f"Error in processing: {e}")
-            break
+            except PipelineStopped:
+                # raised by the pipeline's on_resolved once it stops; not an error
+                raise
+            except Exception as e:
+                logging.error(f"Error in processing: {e}")
+                break
+    finally:
+        store.close()
+        cache.close()
 
 
 # =====================================================
 # === STEP 2: Get video IDs from each "uploads" playlist
 # =====================================================
 
-def get_video_ids_from_playlist(playlist_id):
+def get_playlist_items(playlist_id, state=None):
     """
-    Returns all video IDs in a playlist via pagination.
+    Returns (video_id, published_at) pairs of a playlist through the Data
+    API, newest first; see video_listing.api_playlist_items.
     """
-    video_ids = []
-    next_page_token = None
-    while True:
-        try:
-            request = youtube.playlistItems().list(
-                part="contentDetails",
-                playlistId=playlist_id,
-                maxResults=5000,
-                pageToken=next_page_token
-            )
-            response = request.execute()
-            items = response.get('items', [])
-            if not items:
-                break
-
-            for item in items:
-                video_id = item['contentDetails']['videoId']
-                video_ids.append(video_id)
-
-            next_page_token = response.get('nextPageToken')
-            if not next_page_token:
-                break
+    return api_playlist_items(scheduler, playlist_id, state)
 
-        except Exception as e:
-            print(f"[get_video_ids_from_playlist] Error for playlist '{playlist_id}': {e}")
-            break
 
-    return video_ids
+def get_video_ids_from_playlist(playlist_id):
+    """
+    Returns all video IDs in a playlist via pagination.
+    """
+    return [video_id for video_id, _ in get_playlist_items(playlist_id)]
 
 
-def step2_get_video_ids():
+def step2_get_video_ids(fmt='csv', checkpoint_db=CHECKPOINT_DB, refresh=False, prioritize=None, budget=None,
+                        lister=None):
     """
     Reads PLAYLISTS_CSV, fetches all videos for each playlist,
-    and writes out VIDEOIDS_CSV with columns:
+    and streams rows to VIDEOIDS_CSV (video_ids.parquet with fmt='parquet')
+    with columns:
       channel_name, playlist_id, video_id
+    Playlists are checkpointed once their rows are flushed to disk, along
+    with the newest video seen, so a rerun continues after the last flushed
+    batch. With refresh=True every playlist is revisited but only videos
+    newer than that one are fetched and appended (usually a single page).
+    prioritize names a priority.SCORES score ('yield' = expected transcripts
+    per quota unit) to page playlists in; budget (a CrawlBudget) ends the run early.
+    lister is a video_listing backend (default: the Data API); playlists it
+    can't list are left unchecked for the next run.
     """
-    print("=== STEP 2: Getting Video IDs from Playlists ===")
-    df = pd.read_csv(PLAYLISTS_CSV,)
-
-    all_videos = []
-    for idx, row in df.iterrows():
-        channel_name = row['channel_name']
-        playlist_id  = row['uploads_playlist_id']
-
-        vids = get_video_ids_from_playlist(playlist_id)
-        print(f"[step2_get_video_ids] Found {len(vids)} videos for channel '{channel_name}'")
-
-        for vid in vids:
-            all_videos.append({
-                'channel_name': channel_name,
-                'playlist_id': playlist_id,
-                'video_id': vid
-            })
-
-    video_df = pd.DataFrame(all_videos)
-    video_df.to_csv(VIDEOIDS_CSV, index=False)
-    print(f"[step2_get_video_ids] Created '{VIDEOIDS_CSV}' with {len(all_videos)} rows.")
+    print(f"=== STEP 2: Getting Video IDs from Playlists{' (refresh)' if refresh else ''} ===")
+    lister = lister or make_lister('api', scheduler)
+    store = CheckpointStore(checkpoint_db)
+    done_playlists = None if refresh else store.done_keys('playlist')
+    sink = open_sink(VIDEOIDS_CSV, VIDEO_COLUMNS, fmt)
+    unflushed = {}
+    total = 0
+    progress = metrics.progress('step2', max(count_rows(PLAYLISTS_CSV) - len(done_playlists or ()), 0))
+    rows = iter_rows(PLAYLISTS_CSV, columns=['channel_name', 'uploads_playlist_id'],
+                     key='uploads_playlist_id', skip=done_playlists)
+    if prioritize:
+        rows = prioritized(rows, make_score('step2', prioritize, YieldStats(YIELD_STATS_JSON),
+                                            load_channel_videos(FILTERED_CSV)))
+    try:
+        for row in rows:
+            if budget and budget.exhausted():
+                break
+            channel_name = row['channel_name']
+            playlist_id  = row['uploads_playlist_id']
+            state = load_refresh_state(store, playlist_id) if refresh else None
+
+            try:
+                items = lister.list_videos(playlist_id, state)
+            except QuotaExhausted as e:
+                print(f"[step2_get_video_ids] {e}. Stopping, rows collected so far are kept.")
+                break
+            except ListingError as e:
+                print(f"[step2_get_video_ids] {e}")
+                continue
+            new_state = playlist_state(items)
+            if state and state.get('seed'):
+                # listed before states were kept: its videos are already written
+                items = []
+            print(f"[step2_get_video_ids] Found {len(items)} {'new ' if state else ''}videos for channel '{channel_name}'")
+
+            progress.advance()
+            unflushed[playlist_id] = new_state
+            total += len(items)
+            out_rows = [{'channel_name': channel_name, 'playlist_id': playlist_id, 'video_id': vid} for vid, _ in items]
+            if sink.write(out_rows):
+                store.mark_many('playlist', unflushed)
+                store.flush()
+                unflushed = {}
+    finally:
+        sink.close()
+        store.mark_many('playlist', unflushed)
+        store.close()
+    print(f"[step2_get_video_ids] Wrote {total} rows to '{VIDEOIDS_CSV}' ({fmt}).")
 
 
 # ========================================================
@@ -229,42 +296,518 @@ def get_transcript_text(video_id):
     Returns the concatenated transcript string for a video
     using YouTubeTranscriptApi.
     """
-    try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        transcript_text = " ".join([entry['text'] for entry in transcript_list])
-        return transcript_text
-    except Exception as e:
-        print(f"[get_transcript_text] Could not retrieve transcript for video ID '{video_id}': {e}")
-        return None
+    outcome = fetch_transcript(video_id)
+    if outcome.status != OK:
+        print(f"[get_transcript_text] Could not retrieve transcript for video ID '{video_id}': {outcome.status}")
+    return outcome.text
+
+
+def record_outcome(cache, stats, channel_name, video_id, outcome):
+    """Caches a fetch outcome; only real answers (not throttling) count toward hit rates"""
+    cache.record(video_id, outcome.status, outcome.languages)
+    if outcome.status not in (RATE_LIMITED, TRANSIENT):
+        stats.record(channel_name, outcome.status == OK)
 
 
-def step3_get_transcripts():
+def step3_get_transcripts(fmt='csv', checkpoint_db=CHECKPOINT_DB, prioritize=None, budget=None,
+                          transcript_store=False):
     """
     Reads VIDEOIDS_CSV, attempts to fetch transcripts,
-    and writes TRANSCRIPTS_CSV with columns:
+    and streams TRANSCRIPTS_CSV (transcripts.parquet with fmt='parquet') with columns:
       channel_name, playlist_id, video_id, transcript
+    Per-channel hit rates are kept in YIELD_STATS_JSON; prioritize names a
+    priority.SCORES score ('yield' = channels that usually have transcripts first).
+    Every outcome goes to the transcript cache, and videos it still blocks
+    (captions disabled, not found, throttled recently) are skipped up front.
+    With transcript_store=True transcripts go to the compressed, deduplicated
+    TranscriptStore (segment timing kept) instead of TRANSCRIPTS_CSV.
     """
     print("=== STEP 3: Getting Transcripts for Each Video ID ===")
-    df = pd.read_csv(VIDEOIDS_CSV)
-
-    results = []
-    for idx, row in df.iterrows():
-        channel_name = row['channel_name']
-        playlist_id  = row['playlist_id']
-        video_id     = row['video_id']
+    store = CheckpointStore(checkpoint_db)
+    cache = TranscriptCache(TRANSCRIPT_CACHE_DB)
+    sink = open_transcript_sink(fmt, 500, transcript_store)
+    stats = YieldStats(YIELD_STATS_JSON)
+    done_videos = store.done_keys('video') | cache.blocked_keys()
+    # rough backlog: every row minus the ones finished or blocked before
+    progress = metrics.progress('step3', max(count_output_rows(VIDEOIDS_CSV, fmt) - len(done_videos), 0))
+    rows = iter_output_rows(VIDEOIDS_CSV, VIDEO_COLUMNS, fmt, key='video_id', skip=done_videos)
+    if prioritize:
+        rows = prioritized(rows, make_score('step3', prioritize, stats))
+    attempted = []
+    try:
+        for row in rows:
+            if budget and budget.exhausted():
+                break
+            video_id = row['video_id']
+            outcome = fetch_transcript_throttled(video_id)
+            record_outcome(cache, stats, row['channel_name'], video_id, outcome)
+            attempted.append((video_id, outcome.text is not None))
+            progress.advance()
+            if outcome.text:
+                row['transcript'] = outcome.text
+                row['segments'] = outcome.segments
+                if sink.write([row]):
+                    checkpoint_videos(store, attempted)
+                    attempted = []
+    finally:
+        sink.close()
+        checkpoint_videos(store, attempted)
+        store.close()
+        cache.close()
+        stats.save()
+    print(f"[step3_get_transcripts] Wrote {sink.rows_written} transcripts to "
+          f"'{TRANSCRIPT_STORE_DIR if transcript_store else TRANSCRIPTS_CSV}' ({'store' if transcript_store else fmt}).")
+
+
+def open_transcript_sink(fmt, batch_size, transcript_store=False):
+    """The step3 sink: the transcript store, or the CSV/Parquet sink for fmt"""
+    if transcript_store:
+        return TranscriptStore(TRANSCRIPT_STORE_DIR, batch_size=batch_size)
+    return open_sink(TRANSCRIPTS_CSV, TRANSCRIPT_COLUMNS, fmt, batch_size=batch_size)
+
+
+def checkpoint_videos(store, attempted):
+    """
+    Checkpoints (video_id, found) pairs whose rows are already on disk;
+    misses are marked failed so a rerun retries them.
+    """
+    if not attempted:
+        return
+    store.mark_many('video', [vid for vid, found in attempted if found], DONE)
+    store.mark_many('video', [vid for vid, found in attempted if not found], FAILED)
+    store.flush()
+
+
+# per-host concurrency ceilings for step3. every transcript request from
+# YouTubeTranscriptApi goes to www.youtube.com so that is the one that matters.
+# The actual limit adapts below the ceiling (AIMD, see throttle.py) and a
+# circuit breaker pauses all workers when the host starts throttling.
+TRANSCRIPT_HOST = "www.youtube.com"
+HOST_LIMITS = {TRANSCRIPT_HOST: 32}
+MAX_THROTTLE_RETRIES = 3
+_host_throttles = {}
+_host_throttles_lock = threading.Lock()
+
+
+def get_host_throttle(host):
+    """Returns the shared AdaptiveThrottle for requests to host"""
+    with _host_throttles_lock:
+        if host not in _host_throttles:
+            _host_throttles[host] = AdaptiveThrottle(host, max_limit=HOST_LIMITS.get(host, 4))
+        return _host_throttles[host]
+
+
+def throttle_result(outcome):
+    """Maps a TranscriptOutcome to the throttle's ok/throttled/error"""
+    if outcome.status == RATE_LIMITED:
+        return 'throttled'
+    if outcome.status == TRANSIENT:
+        return 'error'
+    return 'ok'
+
+
+def fetch_transcript_throttled(video_id):
+    return get_host_throttle(TRANSCRIPT_HOST).call(fetch_transcript, video_id, classify=throttle_result)
+
+
+class ThroughputCounter:
+    """Counts finished videos and logs videos/sec, backlog depth and throttle state"""
+    def __init__(self, total, report_every=100, throttle=None):
+        self.total = total
+        self.throttle = throttle
+        self.report_every = report_every
+        self.done = 0
+        self.found = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.progress = metrics.progress('step3', total)
+
+    def record(self, found):
+        with self.lock:
+            self.done += 1
+            self.progress.advance()
+            if found:
+                self.found += 1
+            if self.done % self.report_every == 0 or self.done == self.total:
+                self.report()
+
+    def rate(self):
+        elapsed = time.time() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        backlog = f", backlog {self.total - self.done}" if self.total is not None else ""
+        logging.info(
+            f"[step3] {self.done}{'/' + str(self.total) if self.total is not None else ''} videos, "
+            f"{self.found} transcripts, {self.rate():.1f} videos/s{backlog}"
+            + (f", throttle {self.throttle.metrics()}" if self.throttle else "")
+        )
+
+
+def fetch_transcript_row(row):
+    """Worker body: fetches one transcript through the host throttle; returns (video_id, outcome, row|None)"""
+    outcome = fetch_transcript_throttled(row['video_id'])
+    if not outcome.text:
+        return row['video_id'], outcome, None
+    return row['video_id'], outcome, {
+        'channel_name': row['channel_name'],
+        'playlist_id': row['playlist_id'],
+        'video_id': row['video_id'],
+        'transcript': outcome.text,
+        'segments': outcome.segments
+    }
+
+
+def flush_transcripts(rows, sink, store, attempted):
+    """Writes a batch of transcript rows and then checkpoints the attempted videos"""
+    sink.write(rows)
+    sink.flush()
+    checkpoint_videos(store, attempted)
+
+
+def step3_get_transcripts_concurrent(workers=8, batch_size=500, fmt='csv', checkpoint_db=CHECKPOINT_DB,
+                                     prioritize=None, budget=None, transcript_store=False):
+    """
+    Same output as step3_get_transcripts, but fans the transcript requests
+    out over a thread pool and appends finished rows to TRANSCRIPTS_CSV in
+    batches of batch_size, so a crash only loses the current batch.
+    At most 2 * workers requests are queued; the host throttle decides how
+    many actually run at once, and throttled videos are requeued up to
+    MAX_THROTTLE_RETRIES times before they are left to the transcript
+    cache. Videos already checkpointed or blocked by the cache are skipped.
+    prioritize/budget/transcript_store work as in step3_get_transcripts.
+    """
+    print(f"=== STEP 3: Getting Transcripts ({workers} workers) ===")
+    store = CheckpointStore(checkpoint_db)
+    cache = TranscriptCache(TRANSCRIPT_CACHE_DB)
+    done_videos = store.done_keys('video') | cache.blocked_keys()
+    rows = iter_output_rows(VIDEOIDS_CSV, VIDEO_COLUMNS, fmt, key='video_id', skip=done_videos)
+    sink = open_transcript_sink(fmt, batch_size, transcript_store)
+    stats = YieldStats(YIELD_STATS_JSON)
+    if prioritize:
+        rows = prioritized(rows, make_score('step3', prioritize, stats))
+
+    # rough backlog: every row minus the ones finished, blocked (or duplicated) before
+    counter = ThroughputCounter(max(count_output_rows(VIDEOIDS_CSV, fmt) - len(done_videos), 0),
+                                throttle=get_host_throttle(TRANSCRIPT_HOST))
+    pending = set()
+    row_of = {}
+    requeued = []
+    retries = {}
+    batch = []
+    attempted = []
+    written = 0
+    row_iter = rows
+
+    def next_rows():
+        # throttled videos go back in before new ones
+        while True:
+            row = requeued.pop() if requeued else next(row_iter, None)
+            if row is None:
+                return
+            yield row
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for row in next_rows():
+                if budget and budget.exhausted():
+                    break
+                future = pool.submit(fetch_transcript_row, row)
+                row_of[future] = row
+                pending.add(future)
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
 
-        t_text = get_transcript_text(video_id)
-        if t_text:
-            results.append({
-                'channel_name': channel_name,
-                'playlist_id': playlist_id,
-                'video_id': video_id,
-                'transcript': t_text
-            })
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                video_id, outcome, result = future.result()
+                row = row_of.pop(future)
+                if outcome.status == RATE_LIMITED and retries.get(video_id, 0) < MAX_THROTTLE_RETRIES:
+                    retries[video_id] = retries.get(video_id, 0) + 1
+                    requeued.append(row)
+                    continue
+                retries.pop(video_id, None)
+                counter.record(result is not None)
+                record_outcome(cache, stats, row['channel_name'], video_id, outcome)
+                attempted.append((video_id, result is not None))
+                if result:
+                    batch.append(result)
+
+            if len(batch) >= batch_size:
+                flush_transcripts(batch, sink, store, attempted)
+                written += len(batch)
+                batch = []
+                attempted = []
+
+    flush_transcripts(batch, sink, store, attempted)
+    written += len(batch)
+    sink.close()
+    store.close()
+    cache.close()
+    stats.save()
+    counter.report()
+    print(f"[step3_get_transcripts_concurrent] Appended {written} transcripts to "
+          f"'{TRANSCRIPT_STORE_DIR if transcript_store else TRANSCRIPTS_CSV}'.")
+
+
+# ===================================================
+# === PIPELINE: step1 -> step2 -> step3 overlapped
+# ===================================================
+
+# bounded hand-off queues between the stages; a full queue blocks the stage
+# before it, so a fast step1 can't run ahead of step3 by millions of rows
+PLAYLIST_QUEUE_SIZE = 200
+VIDEO_QUEUE_SIZE = 5000
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside pipeline threads once the pipeline is shutting down"""
+
+
+class PipelineVideoWriter:
+    """
+    Step2 side of the pipeline: writes video rows to the step2 sink and
+    checkpoints a playlist once all of its rows are on disk, like
+    step2_get_video_ids. Rows are held back until ready is set, so the
+    backlog reader never sees a half-appended VIDEOIDS_CSV; step2 can't get
+    far ahead meanwhile because the video queue is full of backlog.
+    """
+    def __init__(self, fmt, store):
+        self.sink = open_sink(VIDEOIDS_CSV, VIDEO_COLUMNS, fmt)
+        self.store = store
+        self.unflushed = {}
+        self.held = []
+        self.total = 0
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+
+    def write(self, playlist_id, items, rows):
+        with self.lock:
+            self.unflushed[playlist_id] = playlist_state(items)
+            self.total += len(rows)
+            self.held.extend(rows)
+            if not self.ready.is_set():
+                return
+            rows, self.held = self.held, []
+            if self.sink.write(rows):
+                self.store.mark_many('playlist', self.unflushed)
+                self.store.flush()
+                self.unflushed = {}
+
+    def close(self):
+        with self.lock:
+            self.sink.write(self.held)
+            self.held = []
+            self.sink.close()
+            self.store.mark_many('playlist', self.unflushed)
+            self.unflushed = {}
+
+
+def run_pipeline(channels_csv, step2_workers=4, step3_workers=8, batch_size=500, fmt='csv',
+                 checkpoint_db=CHECKPOINT_DB, verify_channels=False, start_row=0, shard=None, budget=None,
+                 transcript_store=False, lister=None, playlist_queue_size=PLAYLIST_QUEUE_SIZE,
+                 video_queue_size=VIDEO_QUEUE_SIZE):
+    """
+    Runs step1, step2 and step3 at the same time. Playlists resolved by step1
+    go straight to step2 workers and the videos they list straight to step3
+    workers, through bounded queues, so transcripts start arriving minutes
+    after launch instead of after the whole channel list is resolved.
+    Every stage writes and checkpoints exactly what its standalone step does
+    (PLAYLISTS_CSV, VIDEOIDS_CSV, TRANSCRIPTS_CSV or the transcript store), so
+    a crashed pipeline can be resumed with the pipeline or with single steps.
+    On start the backlogs of earlier runs (playlists without videos, videos
+    without transcripts) are queued before new work. lister picks the step2
+    backend as in step2_get_video_ids.
+    """
+    print(f"=== PIPELINE: step1 -> {step2_workers} step2 workers -> {step3_workers} step3 workers ===")
+    ensure_directory_exists()
+    lister = lister or make_lister('api', scheduler)
+    store = CheckpointStore(checkpoint_db)
+    cache = TranscriptCache(TRANSCRIPT_CACHE_DB)
+    stats = YieldStats(YIELD_STATS_JSON)
+    videos = PipelineVideoWriter(fmt, store)
+    sink = open_transcript_sink(fmt, batch_size, transcript_store)
+    playlists = queue.Queue(maxsize=playlist_queue_size)
+    video_rows = queue.Queue(maxsize=video_queue_size)
+    metrics.add_collector(lambda: {'pipeline_playlist_queue_depth': playlists.qsize(),
+                                   'pipeline_video_queue_depth': video_rows.qsize()})
+    stop = threading.Event()
+    # lock guards the queued sets and the current batch; flush_lock the sink writes
+    lock = threading.Lock()
+    flush_lock = threading.Lock()
+    step2_progress = metrics.progress('step2')
+    counter = ThroughputCounter(None, throttle=get_host_throttle(TRANSCRIPT_HOST))
+    queued_playlists = set()
+    queued_videos = store.done_keys('video') | cache.blocked_keys()
+    batch = []
+    attempted = []
+
+    def stopping():
+        if budget and budget.exhausted():
+            stop.set()
+        return stop.is_set()
+
+    def put(q, item):
+        # blocks while the next stage is behind, but gives up once the pipeline stops
+        while not stopping():
+            try:
+                q.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
 
-    out_df = pd.DataFrame(results)
-    out_df.to_csv(TRANSCRIPTS_CSV, index=False)
-    print(f"[step3_get_transcripts] Created '{TRANSCRIPTS_CSV}' with {len(results)} transcripts.")
+    def get(q):
+        while not stopping():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def queue_playlist(channel_name, playlist_id):
+        with lock:
+            if playlist_id in queued_playlists:
+                return
+            queued_playlists.add(playlist_id)
+        put(playlists, (channel_name, playlist_id))
+
+    def queue_video(row):
+        with lock:
+            if row['video_id'] in queued_videos:
+                return
+            queued_videos.add(row['video_id'])
+        put(video_rows, row)
+
+    def stage1():
+        if os.path.exists(PLAYLISTS_CSV):
+            for row in iter_rows(PLAYLISTS_CSV, columns=['channel_name', 'uploads_playlist_id'],
+                                 key='uploads_playlist_id', skip=store.done_keys('playlist')):
+                queue_playlist(row['channel_name'], row['uploads_playlist_id'])
+        # a stopped pipeline makes on_resolved raise, which ends step1 after its checkpoint
+        step1_get_playlists(scheduler, channels_csv, PLAYLISTS_CSV, 'last_processed_channels.txt',
+                            checkpoint_db=checkpoint_db, verify_channels=verify_channels, start_row=start_row,
+                            shard=shard, budget=budget, on_resolved=queue_playlist, stop=stop)
+
+    def video_backlog():
+        try:
+            if os.path.exists(output_path(VIDEOIDS_CSV, fmt)):
+                with lock:
+                    skip = set(queued_videos)
+                for row in iter_output_rows(VIDEOIDS_CSV, VIDEO_COLUMNS, fmt, key='video_id', skip=skip):
+                    queue_video(row)
+        finally:
+            videos.ready.set()
+
+    def stage2():
+        while True:
+            item = get(playlists)
+            if item is _DONE:
+                return
+            channel_name, playlist_id = item
+            while True:
+                try:
+                    items = lister.list_videos(playlist_id)
+                    break
+                except ListingError as e:
+                    # left unchecked; the next run picks it up from the playlist backlog
+                    logging.warning(f"[pipeline] {e}")
+                    items = None
+                    break
+                except QuotaExhausted as e:
+                    # step1 is waiting for the reset too; step3 keeps draining meanwhile
+                    logging.info(f"[pipeline] Quota exhausted, step2 waits {e.wait_seconds/3600:.1f} hours")
+                    if stop.wait(e.wait_seconds):
+                        return
+            if items is None:
+                continue
+            rows = [{'channel_name': channel_name, 'playlist_id': playlist_id, 'video_id': vid} for vid, _ in items]
+            videos.write(playlist_id, items, rows)
+            step2_progress.advance()
+            for row in rows:
+                queue_video(row)
+
+    def stage3():
+        nonlocal batch, attempted
+        while True:
+            row = get(video_rows)
+            if row is _DONE:
+                return
+            # throttled videos are retried right away; the host throttle spaces the retries out
+            for _ in range(MAX_THROTTLE_RETRIES + 1):
+                video_id, outcome, result = fetch_transcript_row(row)
+                if outcome.status != RATE_LIMITED:
+                    break
+            full = None
+            with lock:
+                counter.record(result is not None)
+                record_outcome(cache, stats, row['channel_name'], video_id, outcome)
+                attempted.append((video_id, result is not None))
+                if result:
+                    batch.append(result)
+                if len(batch) >= batch_size:
+                    full = (batch, attempted)
+                    batch, attempted = [], []
+            if full:
+                # the write and checkpoint happen outside lock, so step1/step2 don't wait on them
+                with flush_lock:
+                    flush_transcripts(full[0], sink, store, full[1])
+
+    def run(name, fn):
+        def target():
+            try:
+                fn()
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                logging.exception(f"[pipeline] {name} failed: {e}")
+                stop.set()
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def join(threads):
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+
+    threads = []
+    try:
+        threads.append(run('pipeline-step1', stage1))
+        step2 = [run(f'pipeline-step2-{i}', stage2) for i in range(step2_workers)]
+        step2.append(run('pipeline-video-backlog', video_backlog))
+        step3 = [run(f'pipeline-step3-{i}', stage3) for i in range(step3_workers)]
+        threads += step2 + step3
+        # each stage ends when the one before it is done and its queue is drained
+        join(threads[:1])
+        for _ in range(step2_workers):
+            put(playlists, _DONE)
+        join(step2)
+        for _ in range(step3_workers):
+            put(video_rows, _DONE)
+        join(step3)
+    except PipelineStopped:
+        pass
+    except KeyboardInterrupt:
+        logging.info("[pipeline] Interrupted, writing out what is finished")
+    finally:
+        stop.set()
+        # one deadline for all threads, not 60 s each
+        deadline = time.time() + 60
+        for thread in threads:
+            thread.join(timeout=max(deadline - time.time(), 0))
+        videos.close()
+        with lock, flush_lock:
+            flush_transcripts(batch, sink, store, attempted)
+        sink.close()
+        store.close()
+        cache.close()
+        stats.save()
+        counter.report()
+    print(f"[pipeline] Wrote {videos.total} video rows and {sink.rows_written} transcripts.")
 
 
 # ============================
@@ -276,19 +819,129 @@ if __name__ == "__main__":
     Usage:
       python onefile_script.py step1
       python onefile_script.py step2
-      python onefile_script.py step3
+      python onefile_script.py step3 [--workers N] [--batch-size N] [--store]
+      python onefile_script.py step2 [--refresh] [--async] [--concurrency N] [--lister api|ytdlp|hybrid]
+      python onefile_script.py pipeline [--step2-workers N] [--workers N] [--store]
+      python onefile_script.py merge --shards N [--force]
+    step2/step3/merge take --format csv|parquet
+    every step takes --shard i/N to run one shard with its own files
+    step1..3 take --prioritize [yield|hit_rate|size], --time-budget SECONDS and --quota-budget UNITS
     """
-    if len(sys.argv) < 2:
-        print("Please specify which step to run: step1, step2, or step3")
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("step", help="step1, step2, step3, pipeline (all three overlapped), or merge")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="step3: number of transcript worker threads (0 = serial; pipeline default 8)")
+    parser.add_argument("--step2-workers", type=int, default=4,
+                        help="pipeline: number of playlist paging threads")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="step3: rows per incremental write in concurrent mode")
+    parser.add_argument("--verify-channels", action="store_true",
+                        help="step1: confirm known channel IDs with batched channels.list calls")
+    parser.add_argument("--unfiltered", action="store_true",
+                        help="step1: crawl the raw channel list instead of the filtered manifest")
+    parser.add_argument("--rules", help="step1: JSON file overriding channel_filter.DEFAULT_RULES")
+    parser.add_argument("--start-row", type=int, default=0,
+                        help="step1: skip this many rows of the channels CSV before scanning")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="step2/step3: output format (parquet needs pyarrow)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="step2: only fetch videos newer than the last seen one per playlist")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="step2: page many playlists at once with aiohttp")
+    parser.add_argument("--lister", choices=LISTERS, default="api",
+                        help="step2/pipeline: list videos with the Data API, yt-dlp (no quota), "
+                             "or hybrid (API until the quota runs low, then yt-dlp)")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="step2 --async: max requests in flight")
+    parser.add_argument("--store", action="store_true",
+                        help="step3: write to the compressed transcript store (keeps segment timing)")
+    parser.add_argument("--prioritize", nargs="?", const="yield", default=None, choices=SCORES,
+                        help="step1-3: crawl in score order, default 'yield' per quota unit (see priority.py)")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="step1-3: stop after this many seconds")
+    parser.add_argument("--quota-budget", type=int, default=None,
+                        help="step1/step2: stop after spending this many quota units")
+    add_shard_argument(parser)
+    add_telemetry_arguments(parser)
+    parser.add_argument("--shards", type=int, default=0,
+                        help="merge: number of shards to combine")
+    parser.add_argument("--force", action="store_true",
+                        help="merge: overwrite existing outputs and skip missing shards")
+    args = parser.parse_args()
+    start_telemetry(args)
+
+    # each shard reads and writes its own files, so shards never coordinate;
+    # step1 shards the channel list, later steps just follow the shard's files
+    shard = args.shard
+    try:
+        check_shard_count(CHECKPOINT_DB, shard)
+    except FileExistsError as e:
+        print(e)
         sys.exit(1)
-
-    step = sys.argv[1].lower().strip()
+    CHECKPOINT_DB   = shard_path(CHECKPOINT_DB, shard)
+    PLAYLISTS_CSV   = shard_path(PLAYLISTS_CSV, shard)
+    VIDEOIDS_CSV    = shard_path(VIDEOIDS_CSV, shard)
+    TRANSCRIPTS_CSV = shard_path(TRANSCRIPTS_CSV, shard)
+    YIELD_STATS_JSON = shard_path(YIELD_STATS_JSON, shard)
+    TRANSCRIPT_CACHE_DB = shard_path(TRANSCRIPT_CACHE_DB, shard)
+    TRANSCRIPT_STORE_DIR = shard_path(TRANSCRIPT_STORE_DIR, shard)
+    budget = None
+    if args.time_budget or args.quota_budget:
+        budget = CrawlBudget(args.time_budget, args.quota_budget, scheduler)
+
+    step = args.step.lower().strip()
     if step == "step1":
-        step1_get_playlists(youtube, CHANNELS_CSV, PLAYLISTS_CSV, 'last_processed_channels.txt')
+        # crawl the filtered manifest (rebuilt only when the input or rules change)
+        channels_csv = CHANNELS_CSV if args.unfiltered else ensure_manifest(CHANNELS_CSV, rules=load_rules(args.rules))
+        step1_get_playlists(scheduler, channels_csv, PLAYLISTS_CSV, 'last_processed_channels.txt',
+                            checkpoint_db=CHECKPOINT_DB, verify_channels=args.verify_channels,
+                            start_row=args.start_row, shard=shard, prioritize=args.prioritize, budget=budget)
     elif step == "step2":
-        step2_get_video_ids()
+        if args.use_async:
+            if args.lister != "api":
+                parser.error("step2 --async always lists with the Data API; drop --lister")
+            from async_step2 import step2_get_video_ids_async
+            score = None
+            if args.prioritize:
+                score = make_score('step2', args.prioritize, YieldStats(YIELD_STATS_JSON),
+                                   load_channel_videos(FILTERED_CSV))
+            step2_get_video_ids_async(scheduler, PLAYLISTS_CSV, VIDEOIDS_CSV, args.format, args.concurrency,
+                                      refresh=args.refresh, checkpoint_db=CHECKPOINT_DB,
+                                      score=score, budget=budget)
+        else:
+            step2_get_video_ids(args.format, CHECKPOINT_DB, refresh=args.refresh,
+                                prioritize=args.prioritize, budget=budget,
+                                lister=make_lister(args.lister, scheduler, get_host_throttle(TRANSCRIPT_HOST)))
     elif step == "step3":
-        step3_get_transcripts()
+        if args.workers > 0:
+            step3_get_transcripts_concurrent(args.workers, args.batch_size, args.format, CHECKPOINT_DB,
+                                             prioritize=args.prioritize, budget=budget,
+                                             transcript_store=args.store)
+        else:
+            step3_get_transcripts(args.format, CHECKPOINT_DB, prioritize=args.prioritize, budget=budget,
+                                  transcript_store=args.store)
+    elif step == "pipeline":
+        channels_csv = CHANNELS_CSV if args.unfiltered else ensure_manifest(CHANNELS_CSV, rules=load_rules(args.rules))
+        run_pipeline(channels_csv, args.step2_workers, args.workers or 8, args.batch_size, args.format,
+                     CHECKPOINT_DB, verify_channels=args.verify_channels, start_row=args.start_row, shard=shard,
+                     budget=budget, transcript_store=args.store,
+                     lister=make_lister(args.lister, scheduler, get_host_throttle(TRANSCRIPT_HOST)))
+    elif step == "merge":
+        if args.shards < 1:
+            print("merge needs --shards N")
+            sys.exit(1)
+        outputs = [PLAYLISTS_CSV, output_path(VIDEOIDS_CSV, args.format), output_path(TRANSCRIPTS_CSV, args.format)]
+        try:
+            # check every output first so a refusal doesn't leave a half-merged set
+            for path in outputs:
+                check_merge(path, args.shards, args.force)
+        except (FileExistsError, FileNotFoundError) as e:
+            print(e)
+            sys.exit(1)
+        for path in outputs:
+            merge_outputs(path, args.shards, force=True)
     else:
-        print("Unknown step. Use 'step1', 'step2', or 'step3'.")
+        print("Unknown step. Use 'step1', 'step2', 'step3', 'pipeline', or 'merge'.")
         sys.exit(1)
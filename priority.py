@@ -0,0 +1,210 @@
+import os
+import json
+import math
+import time
+import heapq
+import logging
+
+from channel_reader import iter_chunks
+
+# Ordering crawl work by expected yield per quota unit.
+#
+# Work items (channel / playlist / video rows) are pulled from their input
+# stream into a bounded window and handed out highest score first. Scores
+# read live YieldStats, so they change as results come in; CrawlQueue
+# re-scores an item when it reaches the top and pushes it back if it is no
+# longer the best (lazy re-evaluation), which keeps pops O(log n).
+
+YIELD_STATS_JSON = "./data/yield_stats.json"
+WINDOW = 100000
+
+# search.list vs. a 1/50th share of a batched channels.list call
+SEARCH_COST = 100
+KNOWN_ID_COST = 1 / 50
+PAGE_SIZE = 50
+
+
+class YieldStats:
+    """Per-channel transcript hit rates, smoothed toward the global rate"""
+    def __init__(self, path=YIELD_STATS_JSON, prior_weight=5):
+        self.path = path
+        self.prior_weight = prior_weight
+        self.channels = {}
+        self.attempts = 0
+        self.hits = 0
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.channels = {name: tuple(v) for name, v in saved.get('channels', {}).items()}
+            self.attempts = saved.get('attempts', 0)
+            self.hits = saved.get('hits', 0)
+
+    def record(self, channel_name, hit):
+        attempts, hits = self.channels.get(channel_name, (0, 0))
+        self.channels[channel_name] = (attempts + 1, hits + (1 if hit else 0))
+        self.attempts += 1
+        self.hits += 1 if hit else 0
+
+    def global_rate(self):
+        # optimistic 0.5 until there is data
+        return (self.hits + 1) / (self.attempts + 2)
+
+    def hit_rate(self, channel_name):
+        attempts, hits = self.channels.get(channel_name, (0, 0))
+        return (hits + self.prior_weight * self.global_rate()) / (attempts + self.prior_weight)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'attempts': self.attempts, 'hits': self.hits,
+                       'channels': {k: list(v) for k, v in self.channels.items()}}, f)
+        os.replace(tmp, self.path)
+
+
+def _videos(row):
+    try:
+        total = float(row.get('total_videos') or 0)
+    except (TypeError, ValueError):
+        return 1.0
+    return total if total > 0 and not math.isnan(total) else 1.0
+
+
+def load_channel_videos(channels_csv):
+    """channel_name -> total_videos from a channels CSV (for step2_score)"""
+    channel_videos = {}
+    if not channels_csv or not os.path.exists(channels_csv):
+        return channel_videos
+    for chunk in iter_chunks(channels_csv, columns=['channel_name', 'total_videos']):
+        for name, total in zip(chunk['channel_name'].astype(str), chunk['total_videos']):
+            channel_videos[name.strip()] = _videos({'total_videos': total})
+    return channel_videos
+
+
+def step1_score(channel_id_of):
+    """Expected videos unlocked per quota unit for resolving a channel row"""
+    def score(row):
+        cost = KNOWN_ID_COST if channel_id_of(row) else SEARCH_COST
+        return _videos(row) / cost
+    return score
+
+
+def step2_score(stats, channel_videos=None):
+    """
+    Expected transcripts per playlistItems unit: videos per page times the
+    channel's hit rate. channel_videos maps channel_name -> total_videos.
+    """
+    channel_videos = channel_videos or {}
+    def score(row):
+        videos = channel_videos.get(row['channel_name'], PAGE_SIZE)
+        per_unit = videos / max(1, math.ceil(videos / PAGE_SIZE))
+        return per_unit * stats.hit_rate(row['channel_name'])
+    return score
+
+
+def step3_score(stats):
+    """Transcript requests cost no quota, so just try likely hits first"""
+    def score(row):
+        return stats.hit_rate(row['channel_name'])
+    return score
+
+
+def hit_rate_score(stats):
+    """Channels with the best transcript hit rate so far first"""
+    def score(row):
+        return stats.hit_rate(row['channel_name'])
+    return score
+
+
+def size_score(channel_videos=None):
+    """Biggest channels first, ignoring cost"""
+    channel_videos = channel_videos or {}
+    def score(row):
+        if 'total_videos' in row:
+            return _videos(row)
+        return channel_videos.get(row['channel_name'], 1.0)
+    return score
+
+
+SCORES = ('yield', 'hit_rate', 'size')
+
+
+def make_score(step, name, stats, channel_videos=None, channel_id_of=None):
+    """
+    Score function for one of the steps ('step1'..'step3'). 'yield' is the
+    expected-value-per-unit score of that step, the others are the same for
+    every step.
+    """
+    if name == 'hit_rate':
+        return hit_rate_score(stats)
+    if name == 'size':
+        return size_score(channel_videos)
+    if name != 'yield':
+        raise ValueError(f"Unknown score '{name}', expected one of {SCORES}")
+    if step == 'step1':
+        return step1_score(channel_id_of)
+    if step == 'step2':
+        return step2_score(stats, channel_videos)
+    return step3_score(stats)
+
+
+class CrawlQueue:
+    """Max-priority queue whose scores are re-checked lazily on pop"""
+    def __init__(self, score_fn):
+        self.score_fn = score_fn
+        self.heap = []
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item):
+        self.seq += 1
+        heapq.heappush(self.heap, (-self.score_fn(item), self.seq, item))
+
+    def pop(self):
+        while True:
+            _, seq, item = heapq.heappop(self.heap)
+            fresh = -self.score_fn(item)
+            if not self.heap or fresh <= self.heap[0][0]:
+                return item
+            heapq.heappush(self.heap, (fresh, seq, item))
+
+
+class CrawlBudget:
+    """Stop condition for a run: wall-clock seconds and/or quota units"""
+    def __init__(self, max_seconds=None, max_units=None, scheduler=None):
+        self.max_seconds = max_seconds
+        self.max_units = max_units
+        self.scheduler = scheduler
+        self.started = time.time()
+        self.start_remaining = scheduler.remaining() if scheduler and max_units else None
+
+    def units_spent(self):
+        if self.start_remaining is None:
+            return 0
+        return self.start_remaining - self.scheduler.remaining()
+
+    def exhausted(self):
+        if self.max_seconds and time.time() - self.started >= self.max_seconds:
+            logging.info(f"Time budget of {self.max_seconds}s used up")
+            return True
+        if self.max_units and self.units_spent() >= self.max_units:
+            logging.info(f"Quota budget of {self.max_units} units used up")
+            return True
+        return False
+
+
+def prioritized(items, score_fn, window=WINDOW):
+    """
+    Re-orders a stream of items best-first within a sliding window of
+    `window` items, so memory stays bounded on huge inputs.
+    """
+    queue = CrawlQueue(score_fn)
+    for item in items:
+        queue.push(item)
+        if len(queue) >= window:
+            yield queue.pop()
+    while len(queue):
+        yield queue.pop()
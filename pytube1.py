@@ -4,7 +4,19 @@ import os
 import yt_dlp
 import time
 import re
-from urllib.parse import quote, unquote
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote, unquote, urlparse
+from checkpoint import CheckpointStore, CHECKPOINT_DB
+from channel_reader import iter_chunks, count_rows
+from sharding import add_shard_argument, shard_path, check_shard_count
+from channel_filter import ensure_manifest, load_rules
+from telemetry import metrics, add_telemetry_arguments, start_telemetry
+
+# yt-dlp results are checkpointed under their own kind so they don't collide
+# with channels resolved through the Data API in init.py / api.py
+CHECKPOINT_KIND = 'ytdlp_channel'
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -16,36 +28,52 @@ def sanitize_channel_name(channel_name):
     clean_name = clean_name.strip().replace(' ', '').replace('&', '')
     return clean_name
 
-def get_channel_playlists(channel_name, max_retries=3, retry_delay=5):
-    """Get playlist information with improved error handling"""
+YDL_OPTS = {
+    'quiet': True,
+    'extract_flat': True,
+    'force_generic_extractor': True,
+    'ignoreerrors': True,
+    'sleep_interval': 1,  # Rate limiting
+    'max_sleep_interval': 5
+}
+
+# pooled workers are paced by SharedRateLimiter instead of per-request sleeps
+POOLED_YDL_OPTS = {k: v for k, v in YDL_OPTS.items() if k not in ('sleep_interval', 'max_sleep_interval')}
+
+# requests per second allowed per domain, across all worker processes
+DOMAIN_RATES = {'www.youtube.com': 2.0}
+
+def channel_urls(channel_name):
+    """Simplified URL patterns to try for a channel"""
+    clean_channel = sanitize_channel_name(channel_name)
+    return [
+        f"https://www.youtube.com/@{clean_channel}",  # Handle
+        f"https://www.youtube.com/channel/{clean_channel}"  # Channel ID
+    ]
+
+def get_channel_playlists(channel_name, max_retries=3, retry_delay=5, ydl=None, limiter=None):
+    """
+    Get playlist information with improved error handling.
+    Pass a long-lived ydl to reuse its HTTP session across channels, and a
+    SharedRateLimiter to pace requests across processes.
+    """
+    own_ydl = ydl is None
     try:
-        clean_channel = sanitize_channel_name(channel_name)
-        
-        ydl_opts = {
-            'quiet': True,
-            'extract_flat': True,
-            'force_generic_extractor': True,
-            'ignoreerrors': True,
-            'sleep_interval': 1,  # Rate limiting
-            'max_sleep_interval': 5
-        }
-        
-        # Simplified URL patterns
-        urls_to_try = [
-            f"https://www.youtube.com/@{clean_channel}",  # Handle
-            f"https://www.youtube.com/channel/{clean_channel}"  # Channel ID
-        ]
+        urls_to_try = channel_urls(channel_name)
+        if own_ydl:
+            ydl = yt_dlp.YoutubeDL(YDL_OPTS)
         
         for retry in range(max_retries):
             for url in urls_to_try:
                 try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        logging.info(f"Attempting to fetch: {url}")
-                        channel_info = ydl.extract_info(url, download=False)
-                        
-                        if channel_info and 'entries' in channel_info:
-                            logging.info(f"Successfully found channel: {channel_info.get('channel', 'Unknown')}")
-                            return process_channel_videos(channel_info)
+                    if limiter is not None:
+                        limiter.wait(url)
+                    logging.info(f"Attempting to fetch: {url}")
+                    channel_info = ydl.extract_info(url, download=False)
+                    
+                    if channel_info and 'entries' in channel_info:
+                        logging.info(f"Successfully found channel: {channel_info.get('channel', 'Unknown')}")
+                        return process_channel_videos(channel_info)
                             
                 except Exception as e:
                     if '404' in str(e):
@@ -64,6 +92,85 @@ def get_channel_playlists(channel_name, max_retries=3, retry_delay=5):
     except Exception as e:
         logging.error(f"An error occurred while processing channel '{channel_name}': {str(e)}")
         return None
+    finally:
+        if own_ydl and ydl is not None:
+            ydl.close()
+
+class SharedRateLimiter:
+    """
+    Per-domain minimum spacing between requests, shared by every worker
+    process (the next free slot per domain lives in shared memory).
+    """
+    def __init__(self, rates=DOMAIN_RATES, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.intervals = {domain: 1.0 / rate for domain, rate in rates.items()}
+        self.lock = ctx.Lock()
+        self.next_slot = {domain: ctx.Value('d', 0.0, lock=False) for domain in rates}
+
+    def wait(self, url):
+        domain = urlparse(url).netloc
+        if domain not in self.next_slot:
+            return
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot[domain].value)
+            self.next_slot[domain].value = slot + self.intervals[domain]
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+# per-process state for the pooled mode
+_worker_ydl = None
+_worker_limiter = None
+
+def _init_worker(limiter):
+    """Builds the worker's long-lived YoutubeDL once"""
+    global _worker_ydl, _worker_limiter
+    _worker_ydl = yt_dlp.YoutubeDL(POOLED_YDL_OPTS)
+    _worker_limiter = limiter
+
+def _extract_in_worker(channel):
+    # workers can't reach the parent's telemetry, so the timing travels back with the result
+    started = time.time()
+    videos = get_channel_playlists(channel, ydl=_worker_ydl, limiter=_worker_limiter)
+    return channel, videos, time.time() - started
+
+def record_extraction(seconds, videos):
+    metrics.observe('ytdlp_extract_latency_seconds', seconds)
+    metrics.inc('ytdlp_channels_total', status='ok' if videos else 'not_found')
+
+def iter_serial_results(channels):
+    """Yields (channel, videos) one channel at a time over a single YoutubeDL"""
+    with yt_dlp.YoutubeDL(YDL_OPTS) as ydl:
+        for channel in channels:
+            logging.info(f"Processing channel: {channel}")
+            started = time.time()
+            videos = get_channel_playlists(channel, ydl=ydl)
+            record_extraction(time.time() - started, videos)
+            yield channel, videos
+
+def iter_pooled_results(channels, workers, rates=DOMAIN_RATES):
+    """
+    Yields (channel, videos) as a process pool finishes them. Each worker
+    keeps one YoutubeDL for its lifetime; at most 2 * workers channels are
+    in flight so the channel iterator is consumed lazily.
+    """
+    limiter = SharedRateLimiter(rates)
+    pending = set()
+    channels = iter(channels)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(limiter,)) as pool:
+        while True:
+            for channel in channels:
+                pending.add(pool.submit(_extract_in_worker, channel))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                channel, videos, seconds = future.result()
+                record_extraction(seconds, videos)
+                yield channel, videos
 
 def process_channel_videos(channel_info):
     """Process videos from channel info"""
@@ -85,66 +192,201 @@ def append_to_csv(data, output_file):
     else:
         df.to_csv(output_file, mode='a', header=False, index=False)  # Append without header
 
-def get_processed_channels(output_dir="youtube_results"):
-    """Get set of already processed channel names from existing CSVs"""
-    processed = set()
-    if not os.path.exists(output_dir):
-        return processed
-        
-    for file in os.listdir(output_dir):
-        if file.endswith('.csv'):
-            try:
-                df = pd.read_csv(os.path.join(output_dir, file))
-                if 'channel_name' in df.columns:
-                    processed.update(df['channel_name'].unique())
-            except Exception as e:
-                logging.warning(f"Error reading {file}: {e}")
+VIDEO_COLUMNS = ['channel_name', 'video_id', 'title', 'url']
+
+# snapshot files written by older versions (each one a full copy of everything before it)
+LEGACY_SNAPSHOT_RE = re.compile(r'^youtube_playlists_(\d+|final)\.csv$')
+SEGMENT_RE = re.compile(r'^segment-(\d+)\.csv$')
+
+def import_legacy_snapshots(store, output_dir="youtube_results"):
+    """
+    Checkpoints the channels of the legacy youtube_playlists_*.csv snapshots
+    in output_dir (once per file); returns the files that couldn't be read.
+    """
+    failed = []
+    if os.path.exists(output_dir):
+        for file in sorted(os.listdir(output_dir)):
+            if LEGACY_SNAPSHOT_RE.match(file):
+                try:
+                    store.import_csv_column(os.path.join(output_dir, file), 'channel_name', CHECKPOINT_KIND)
+                except Exception as e:
+                    logging.warning(f"Error reading {file}: {e}")
+                    failed.append(file)
+    return failed
+
+def get_processed_channels(store, output_dir="youtube_results"):
+    """
+    Get set of already processed channel names from the checkpoint store.
+    Legacy youtube_playlists_*.csv snapshots in output_dir are imported once
+    (tracked per file); segments are checkpointed as they are written, so
+    they never need re-reading.
+    """
+    import_legacy_snapshots(store, output_dir)
     
+    processed = store.done_keys(CHECKPOINT_KIND)
     logging.info(f"Found {len(processed)} already processed channels")
     return processed
 
-def process_channels(channel_list):
-    """Process channels with skip for already processed"""
-    processed_channels = get_processed_channels()
-    all_videos = []
+class SegmentWriter:
+    """
+    Append-only CSV segments in results_dir (segment-000001.csv, ...).
+    append() writes only the rows it is given and rotates to a new segment
+    after rows_per_segment rows, so nothing is ever rewritten. Every run
+    starts a fresh segment, so a crash can at worst truncate the tail of
+    the last one.
+    """
+    def __init__(self, results_dir, columns=VIDEO_COLUMNS, rows_per_segment=100000):
+        self.results_dir = results_dir
+        self.columns = columns
+        self.rows_per_segment = rows_per_segment
+        os.makedirs(results_dir, exist_ok=True)
+        numbers = [int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(results_dir)) if m]
+        self.segment = max(numbers, default=0) + 1
+        self.rows_in_segment = 0
+
+    def path(self):
+        return os.path.join(self.results_dir, f"segment-{self.segment:06d}.csv")
+
+    def append(self, rows):
+        if not rows:
+            return
+        if self.rows_in_segment >= self.rows_per_segment:
+            self.segment += 1
+            self.rows_in_segment = 0
+        header = self.rows_in_segment == 0
+        pd.DataFrame(rows, columns=self.columns).to_csv(self.path(), mode='a', header=header, index=False)
+        self.rows_in_segment += len(rows)
+        metrics.inc('rows_written_total', len(rows), output=os.path.basename(self.results_dir))
+
+def process_channels(channel_list, checkpoint_db=CHECKPOINT_DB, results_dir="youtube_results", workers=0,
+                     flush_every=10, total=None):
+    """
+    Process channels with skip for already processed.
+    workers > 0 extracts in a process pool (see iter_pooled_results).
+    Rows are appended to segments every flush_every channels, and those
+    channels are checkpointed right after, so memory holds one batch at most.
+    total is the number of channels in channel_list, for the ETA gauges.
+    """
+    store = CheckpointStore(checkpoint_db)
+    processed_channels = get_processed_channels(store, results_dir)
+    writer = SegmentWriter(results_dir)
+    pending_rows = []
+    unsaved_channels = []
     success_count = 0
+    progress = metrics.progress('ytdlp', max(total - len(processed_channels), 0) if total is not None else None)
     
-    results_dir = "youtube_results"
-    os.makedirs(results_dir, exist_ok=True)
+    def unprocessed(channels):
+        for channel in channels:
+            if channel in processed_channels:
+                logging.info(f"Skipping already processed channel: {channel}")
+                continue
+            yield channel
     
-    for channel in channel_list:
-        if channel in processed_channels:
-            logging.info(f"Skipping already processed channel: {channel}")
-            continue
-            
-        logging.info(f"Processing channel: {channel}")
-        videos = get_channel_playlists(channel)
-        
-        if videos:
-            all_videos.extend(videos)
-            success_count += 1
-            processed_channels.add(channel)
-            
-            # Save progress every 10 channels
-            if success_count % 10 == 0:
-                df = pd.DataFrame(all_videos)
-                output_file = os.path.join(results_dir, f"youtube_playlists_{success_count}.csv")
-                df.to_csv(output_file, index=False)
-                logging.info(f"Saved interim results to {output_file}")
+    def save():
+        # the rows are on disk, so their channels can be checkpointed
+        writer.append(pending_rows)
+        store.mark_many(CHECKPOINT_KIND, unsaved_channels)
+        store.flush()
+        logging.info(f"Appended {len(pending_rows)} rows for {len(unsaved_channels)} channels to {writer.path()}")
+        pending_rows.clear()
+        unsaved_channels.clear()
+    
+    if workers > 0:
+        results = iter_pooled_results(unprocessed(channel_list), workers)
+    else:
+        results = iter_serial_results(unprocessed(channel_list))
     
-    # Save final results
-    if all_videos:
-        final_df = pd.DataFrame(all_videos)
-        final_output = os.path.join(results_dir, "youtube_playlists_final.csv")
-        final_df.to_csv(final_output, index=False)
-        logging.info(f"Saved final results. Processed {success_count} new channels.")
+    try:
+        for channel, videos in results:
+            progress.advance()
+            if videos:
+                pending_rows.extend(videos)
+                success_count += 1
+                processed_channels.add(channel)
+                unsaved_channels.append(channel)
+                if len(unsaved_channels) >= flush_every:
+                    save()
+    finally:
+        if unsaved_channels:
+            save()
+        store.close()
+    logging.info(f"Processed {success_count} new channels.")
+    return success_count
+
+def compact_segments(results_dir, output_csv, include_legacy=True, checkpoint_db=CHECKPOINT_DB):
+    """
+    Appends every segment (and legacy snapshot) in results_dir to output_csv,
+    dropping (channel_name, video_id) rows that are already there or repeat
+    across files, then deletes the merged files. Legacy snapshots are
+    checkpointed first, so their channels stay resumable once they're gone;
+    one that can't be read is left in place.
+    """
+    if not os.path.exists(results_dir):
+        return 0
+    skipped = set()
+    if include_legacy:
+        with CheckpointStore(checkpoint_db) as store:
+            skipped.update(import_legacy_snapshots(store, results_dir))
+    files = sorted(f for f in os.listdir(results_dir)
+                   if (SEGMENT_RE.match(f) or (include_legacy and LEGACY_SNAPSHOT_RE.match(f)))
+                   and f not in skipped)
+    
+    def keys_of(chunk):
+        return list(zip(chunk['channel_name'].astype(str), chunk['video_id'].astype(str)))
+    
+    # rows from earlier compactions
+    seen = set()
+    if os.path.exists(output_csv):
+        for chunk in iter_chunks(output_csv, columns=['channel_name', 'video_id']):
+            seen.update(keys_of(chunk))
+    written = 0
+    for file in files:
+        path = os.path.join(results_dir, file)
+        for chunk in iter_chunks(path, columns=VIDEO_COLUMNS):
+            keys = keys_of(chunk)
+            keep = []
+            for key in keys:
+                keep.append(key not in seen)
+                seen.add(key)
+            chunk = chunk[keep]
+            if len(chunk):
+                append_to_csv(chunk, output_csv)
+                written += len(chunk)
+    for file in files:
+        os.remove(os.path.join(results_dir, file))
+    logging.info(f"Compacted {len(files)} files from {results_dir} into {output_csv} ({written} rows)")
+    return written
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser()
+    add_shard_argument(parser)
+    add_telemetry_arguments(parser)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="extract channels in N processes, each with one long-lived YoutubeDL")
+    parser.add_argument("--rate", type=float, default=DOMAIN_RATES['www.youtube.com'],
+                        help="max youtube.com requests per second across all workers")
+    parser.add_argument("--unfiltered", action="store_true",
+                        help="crawl the raw channel list instead of the filtered manifest")
+    parser.add_argument("--rules", help="JSON file overriding channel_filter.DEFAULT_RULES")
+    parser.add_argument("--compact", action="store_true",
+                        help="merge the result segments into channel_playlists.csv and exit")
+    args = parser.parse_args()
+    try:
+        check_shard_count(CHECKPOINT_DB, args.shard)
+    except FileExistsError as e:
+        parser.error(str(e))
+    start_telemetry(args)
+    DOMAIN_RATES['www.youtube.com'] = args.rate
+    
     input_csv = './data/youtube_channels_1M_clean.csv'
-    output_csv = './data/channel_playlists.csv'
+    output_csv = shard_path('./data/channel_playlists.csv', args.shard)
+    results_dir = shard_path("youtube_results", args.shard)
     
-    # Read channel names from CSV
-    channels_df = pd.read_csv(input_csv)
+    if args.compact:
+        compact_segments(results_dir, output_csv, checkpoint_db=shard_path(CHECKPOINT_DB, args.shard))
+        exit(0)
     
     def clean_channel_name(x):
         """Clean and validate channel name"""
@@ -152,17 +394,26 @@ if __name__ == "__main__":
             return None
         return str(x).strip().replace(" ", "")
     
-    # Replace the problematic line with:
-    channel_list = channels_df['channel_name'].apply(clean_channel_name).dropna().tolist()
+    def iter_channel_names(path):
+        """Stream cleaned channel names from CSV, only reading the channel_name column"""
+        for chunk in iter_chunks(path, columns=['channel_name'], shard=args.shard):
+            names = chunk['channel_name'].apply(clean_channel_name).dropna()
+            yield from names[names != '']
+    
+    if not args.unfiltered:
+        input_csv = ensure_manifest(input_csv, rules=load_rules(args.rules))
     
     # Additional validation before processing
-    if not channel_list:
+    channel_list = iter_channel_names(input_csv)
+    first = next(channel_list, None)
+    if first is None:
         logging.error("No valid channel names found in the input data")
         exit(1)
     
-    logging.info(f"Processing {len(channel_list)} valid channels")
-    combined_videos = process_channels(channel_list)
-    
-    if not combined_videos.empty:
-        append_to_csv(combined_videos, output_csv)
-        logging.info("Appended data for all channels")
\ No newline at end of file
+    logging.info(f"Processing channels from {input_csv}")
+    processed = process_channels(itertools.chain([first], channel_list),
+                                 checkpoint_db=shard_path(CHECKPOINT_DB, args.shard),
+                                 results_dir=results_dir,
+                                 workers=args.workers,
+                                 total=count_rows(input_csv) // (args.shard.count if args.shard else 1))
+    logging.info(f"Done, {processed} new channels. Run with --compact to merge segments into {output_csv}")
\ No newline at end of file
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from telemetry import metrics
+
+# googleapiclient is imported on first use, so status/orchestration commands
+# that only read the ledger don't pay for it
+
+# Unit cost of each Data API method we call
+# https://developers.google.com/youtube/v3/determine_quota_cost
+UNIT_COSTS = {
+    'search.list': 100,
+    'channels.list': 1,
+    'playlistItems.list': 1,
+    'playlists.list': 1,
+    'videos.list': 1,
+}
+
+DAILY_QUOTA = 10000
+
+# set to e.g. http://127.0.0.1:8765/ to send every Data API call to another
+# server (benchmark.py's mock); unset means googleapis.com
+API_ENDPOINT_ENV = 'YOUTUBE_API_ENDPOINT'
+QUOTA_LEDGER_DB = "./data/quota_ledger.db"
+
+# The youtube v3 discovery document, saved on first use. Clients are built
+# from the parsed copy (build_from_document), so neither a new thread's
+# client nor a forked worker re-reads or re-fetches it. Delete the file to
+# pick up a newer version of the API.
+DISCOVERY_DOC_JSON = "./data/youtube_v3_discovery.json"
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest"
+
+# Daily quota resets at midnight Pacific time
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+# 403 reasons that mean the key is done for the day vs. "slow down"
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class QuotaExhausted(Exception):
+    """Raised when every key in the pool is out of quota for the day"""
+    def __init__(self, wait_seconds):
+        super().__init__(f"All API keys exhausted, quota resets in {wait_seconds/3600:.1f} hours")
+        self.wait_seconds = wait_seconds
+
+
+def load_api_keys(default=None):
+    """API keys from $YOUTUBE_API_KEYS (comma separated), falling back to default"""
+    keys = [k.strip() for k in os.environ.get('YOUTUBE_API_KEYS', '').split(',') if k.strip()]
+    if not keys and default:
+        keys = [default]
+    return keys
+
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+
+
+def _fetch_discovery_document():
+    """The copy bundled with google-api-python-client 2.x, else the live one"""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = get_static_doc('youtube', 'v3')
+        if doc:
+            return doc
+    except ImportError:
+        pass
+    from urllib.request import urlopen
+    with urlopen(DISCOVERY_URL, timeout=30) as response:
+        return response.read().decode('utf-8')
+
+
+def discovery_document(path=DISCOVERY_DOC_JSON):
+    """Parsed youtube v3 discovery document, loaded once per process and cached at path"""
+    global _discovery_doc
+    with _discovery_lock:
+        if _discovery_doc is None:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    _discovery_doc = json.load(f)
+            else:
+                text = _fetch_discovery_document()
+                _discovery_doc = json.loads(text)
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp = path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp, path)
+        return _discovery_doc
+
+
+def build_youtube(api_key, api_endpoint=None):
+    """youtube v3 client for api_key, built from the cached discovery document"""
+    from googleapiclient.discovery import build_from_document
+    options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    return build_from_document(discovery_document(), developerKey=api_key, client_options=options)
+
+
+def key_label(api_key):
+    """Short stable label so the ledger never stores the raw key"""
+    return hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+def quota_day(now=None):
+    now = now or datetime.now(QUOTA_TZ)
+    return now.astimezone(QUOTA_TZ).strftime('%Y-%m-%d')
+
+
+def seconds_until_reset(now=None):
+    now = (now or datetime.now(QUOTA_TZ)).astimezone(QUOTA_TZ)
+    next_reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (next_reset - now).total_seconds()
+
+
+def error_reason(e):
+    """Pulls the 'reason' string out of an HttpError, if there is one"""
+    details = getattr(e, 'error_details', None)
+    if details and isinstance(details, list) and isinstance(details[0], dict):
+        reason = details[0].get('reason')
+        if reason:
+            return reason
+    try:
+        content = json.loads(e.content.decode('utf-8'))
+        return content['error']['errors'][0]['reason']
+    except Exception:
+        return None
+
+
+def classify_http_error(e):
+    """Returns 'quota', 'rate_limit' or 'other' for an HttpError"""
+    return classify_error(e.resp.status, error_reason(e))
+
+
+def classify_error(status, reason):
+    """Same as classify_http_error, for callers doing their own HTTP"""
+    if reason in QUOTA_REASONS:
+        return 'quota'
+    if status == 429 or reason in RATE_LIMIT_REASONS:
+        return 'rate_limit'
+    return 'other'
+
+
+class QuotaLedger:
+    """Persisted units spent per key per quota day"""
+    def __init__(self, path=QUOTA_LEDGER_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS ledger (
+                   day TEXT NOT NULL,
+                   key_label TEXT NOT NULL,
+                   units INTEGER NOT NULL DEFAULT 0,
+                   calls INTEGER NOT NULL DEFAULT 0,
+                   exhausted INTEGER NOT NULL DEFAULT 0,
+                   PRIMARY KEY (day, key_label)
+               )"""
+        )
+        self.conn.commit()
+
+    def load(self, day):
+        cur = self.conn.execute("SELECT key_label, units, exhausted FROM ledger WHERE day = ?", (day,))
+        return {label: (units, bool(exhausted)) for label, units, exhausted in cur}
+
+    def record(self, day, label, units, exhausted=False):
+        self.conn.execute(
+            """INSERT INTO ledger (day, key_label, units, calls, exhausted) VALUES (?, ?, ?, 1, ?)
+               ON CONFLICT (day, key_label) DO UPDATE SET
+                   units = ledger.units + excluded.units,
+                   calls = ledger.calls + 1,
+                   exhausted = MAX(ledger.exhausted, excluded.exhausted)""",
+            (day, label, units, int(exhausted))
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class QuotaScheduler:
+    """
+    Routes Data API calls across a pool of keys.
+
+    Every call is charged its UNIT_COSTS price against the key that made it,
+    and the running totals are persisted in a QuotaLedger so a restart on the
+    same quota day picks up where it left off. A quotaExceeded 403 pauses only
+    that key until the daily reset; 429s / rateLimitExceeded get a short
+    backoff and are retried. QuotaExhausted is raised once every key is spent.
+    """
+    def __init__(self, api_keys, daily_quota=DAILY_QUOTA, ledger_path=QUOTA_LEDGER_DB,
+                 max_rate_limit_retries=5, api_endpoint=None):
+        if not api_keys:
+            raise ValueError("QuotaScheduler needs at least one API key")
+        self.api_keys = list(api_keys)
+        self.daily_quota = daily_quota
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.api_endpoint = api_endpoint or os.environ.get(API_ENDPOINT_ENV) or None
+        # opened on first use, so importing a module that builds a scheduler creates no files
+        self.ledger_path = ledger_path
+        self._ledger = None
+        self.lock = threading.Lock()
+        # googleapiclient's httplib2 transport isn't thread-safe, so each thread gets its own clients
+        self.local = threading.local()
+        self.day = None
+        self.spent = {}
+        self.exhausted = set()
+        metrics.add_collector(self.gauges)
+
+    @property
+    def ledger(self):
+        if self._ledger is None:
+            self._ledger = QuotaLedger(self.ledger_path)
+        return self._ledger
+
+    def gauges(self):
+        """Telemetry gauges; empty until the scheduler is first used"""
+        if self._ledger is None:
+            return {}
+        return {'youtube_quota_remaining_units': self.remaining(), 'youtube_keys_exhausted': len(self.exhausted)}
+
+    def _roll_day(self):
+        """Reload per-key totals whenever the quota day changes"""
+        day = quota_day()
+        if day == self.day:
+            return
+        self.day = day
+        saved = self.ledger.load(day)
+        self.spent = {}
+        self.exhausted = set()
+        for key in self.api_keys:
+            units, exhausted = saved.get(key_label(key), (0, False))
+            self.spent[key] = units
+            if exhausted:
+                self.exhausted.add(key)
+
+    def remaining(self, key=None):
+        """Units left today for one key, or summed over the pool"""
+        with self.lock:
+            self._roll_day()
+            keys = [key] if key else self.api_keys
+            return sum(0 if k in self.exhausted else max(0, self.daily_quota - self.spent[k]) for k in keys)
+
+    def client(self, key):
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if key not in clients:
+            clients[key] = build_youtube(key, self.api_endpoint)
+        return clients[key]
+
+    def acquire(self, method):
+        """Picks the key with the most quota left that can afford method"""
+        cost = UNIT_COSTS.get(method, 1)
+        with self.lock:
+            self._roll_day()
+            candidates = [k for k in self.api_keys
+                          if k not in self.exhausted and self.daily_quota - self.spent[k] >= cost]
+            if not candidates:
+                raise QuotaExhausted(seconds_until_reset())
+            key = max(candidates, key=lambda k: self.daily_quota - self.spent[k])
+            # reserve now so concurrent callers don't overspend the same key
+            self.spent[key] += cost
+            return key
+
+    def charge(self, key, method, exhausted=False):
+        """
+        Records a finished call made with a key from acquire(). Callers that
+        don't go through execute() (e.g. raw aiohttp requests) must call this
+        once per request, with exhausted=True on a quotaExceeded response.
+        """
+        with self.lock:
+            if exhausted:
+                self.exhausted.add(key)
+            self.ledger.record(self.day, key_label(key), UNIT_COSTS.get(method, 1), exhausted)
+        metrics.inc('youtube_quota_units_total', UNIT_COSTS.get(method, 1), method=method)
+
+    def execute(self, method, make_request):
+        """
+        Runs make_request(youtube_client).execute() on the best available key.
+        method is the Data API method name (e.g. 'search.list') used for costing.
+        """
+        from googleapiclient.errors import HttpError
+        rate_limit_retries = 0
+        while True:
+            key = self.acquire(method)
+            request = make_request(self.client(key))
+            started = time.time()
+            try:
+                response = request.execute()
+                metrics.observe('youtube_api_latency_seconds', time.time() - started, method=method)
+                metrics.inc('youtube_api_calls_total', method=method, status='ok')
+                self.charge(key, method)
+                return response
+            except HttpError as e:
+                kind = classify_http_error(e)
+                metrics.observe('youtube_api_latency_seconds', time.time() - started, method=method)
+                metrics.inc('youtube_api_calls_total', method=method, status=kind)
+                if kind == 'quota':
+                    self.charge(key, method, exhausted=True)
+                    logging.warning(f"Key {key_label(key)} out of quota for {self.day}; rotating")
+                    continue
+                self.charge(key, method)
+                if kind == 'rate_limit' and rate_limit_retries < self.max_rate_limit_retries:
+                    wait_time = 2 ** rate_limit_retries
+                    rate_limit_retries += 1
+                    logging.info(f"Rate limited on {method}. Retrying in {wait_time} seconds...")
+                    time.sleep(wait_time)
+                    continue
+                raise
+
+    def close(self):
+        if self._ledger is not None:
+            self._ledger.close()
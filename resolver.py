@@ -0,0 +1,148 @@
+import re
+import logging
+
+from quota import QuotaExhausted
+
+# Resolving channel -> uploads playlist without paying search.list for every row.
+#
+# A channel ID 'UCxxxx' has its uploads playlist at 'UUxxxx', so once the
+# channel ID is known no call is needed at all. Channel IDs we already have
+# (from the channels CSV or a previous search) are optionally verified with
+# channels.list in batches of 50 IDs for 1 unit per batch; search.list
+# (100 units) is only used for names we have no ID for.
+
+CHANNEL_ID_RE = re.compile(r'^UC[0-9A-Za-z_-]{22}$')
+CHANNEL_URL_RE = re.compile(r'/channel/(UC[0-9A-Za-z_-]{22})')
+CHANNELS_LIST_MAX_IDS = 50
+
+# columns of youtube_channels_1M_clean.csv that may carry the ID
+ID_COLUMNS = ('channel_id', 'channelId', 'channel_url', 'url')
+
+
+def is_channel_id(value):
+    return isinstance(value, str) and bool(CHANNEL_ID_RE.match(value.strip()))
+
+
+def channel_id_from_row(row):
+    """Returns a channel ID already present in a channels CSV row (dict or Series), if any"""
+    for column in ID_COLUMNS:
+        value = row.get(column) if hasattr(row, 'get') else None
+        if not isinstance(value, str):
+            continue
+        value = value.strip()
+        if is_channel_id(value):
+            return value
+        match = CHANNEL_URL_RE.search(value)
+        if match:
+            return match.group(1)
+    name = row.get('channel_name') if hasattr(row, 'get') else None
+    if is_channel_id(name):
+        return name.strip()
+    return None
+
+
+def uploads_playlist_id(channel_id):
+    """UCxxxx -> UUxxxx"""
+    if not is_channel_id(channel_id):
+        return None
+    return 'UU' + channel_id.strip()[2:]
+
+
+def search_channel_id(scheduler, channel_name, cache=None):
+    """
+    Looks a channel name up with search.list (100 units); returns its ID or None.
+    With a search_cache.SearchCache, cached hits and misses cost nothing and
+    fresh results are stored for the next run.
+    """
+    if cache is not None:
+        cached = cache.get(channel_name)
+        if cached is not None:
+            return cached.channel_id
+    response = scheduler.execute('search.list', lambda yt: yt.search().list(
+        part='id', q=channel_name, type='channel', maxResults=1))
+    channel_id = None
+    if response.get('items'):
+        channel_id = response['items'][0]['id']['channelId']
+    else:
+        logging.warning(f"Channel not found: {channel_name}")
+    if cache is not None:
+        cache.put(channel_name, channel_id, uploads_playlist_id(channel_id))
+    return channel_id
+
+
+def fetch_uploads_batch(scheduler, channel_ids):
+    """One channels.list call for up to 50 IDs; returns {channel_id: uploads_playlist_id}"""
+    ids = list(dict.fromkeys(channel_ids))
+    if not ids:
+        return {}
+    if len(ids) > CHANNELS_LIST_MAX_IDS:
+        raise ValueError(f"channels.list takes at most {CHANNELS_LIST_MAX_IDS} IDs, got {len(ids)}")
+    response = scheduler.execute('channels.list', lambda yt: yt.channels().list(
+        part='contentDetails', id=','.join(ids), maxResults=CHANNELS_LIST_MAX_IDS))
+    found = {}
+    for item in response.get('items', []):
+        found[item['id']] = item['contentDetails']['relatedPlaylists']['uploads']
+    return found
+
+
+class BatchResolver:
+    """
+    Collects channels and resolves them to uploads playlist IDs in bulk.
+
+    add() queues a channel (with its ID when known) and returns whatever
+    results became ready; flush() resolves everything still queued. Results
+    are (channel_name, channel_id, uploads_playlist_id) tuples, with
+    uploads_playlist_id None when the channel could not be found.
+
+    With verify=False (default) known IDs are mapped to UU... locally and
+    cost nothing. With verify=True they are checked with batched
+    channels.list calls, which also drops deleted/terminated channels.
+    Name searches go through cache when one is given.
+    """
+    def __init__(self, scheduler, verify=False, batch_size=CHANNELS_LIST_MAX_IDS, cache=None):
+        self.scheduler = scheduler
+        self.verify = verify
+        self.cache = cache
+        self.batch_size = min(batch_size, CHANNELS_LIST_MAX_IDS)
+        self.queue = []
+        # results of batches resolved before a QuotaExhausted, returned by the next flush()
+        self.ready = []
+        self.searches = 0
+        self.batches = 0
+
+    def add(self, channel_name, channel_id=None):
+        if channel_id is None:
+            # no ID to go on, this one has to be looked up by name
+            self.searches += 1
+            channel_id = search_channel_id(self.scheduler, channel_name, self.cache)
+            if channel_id is None:
+                return [(channel_name, None, None)]
+        if not self.verify:
+            return [(channel_name, channel_id, uploads_playlist_id(channel_id))]
+        self.queue.append((channel_name, channel_id))
+        if len(self.queue) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Resolves the queue in channels.list batches. A batch that fails with
+        anything but QuotaExhausted is dropped (logged, its channels come back
+        on the next run); on QuotaExhausted the unresolved rest stays queued.
+        """
+        results, self.ready = self.ready, []
+        while self.queue:
+            batch = self.queue[:self.batch_size]
+            try:
+                found = fetch_uploads_batch(self.scheduler, [cid for _, cid in batch])
+            except QuotaExhausted:
+                self.ready = results
+                raise
+            except Exception as e:
+                logging.error(f"channels.list failed for {len(batch)} channels, leaving them for the next run: {e}")
+                found = None
+            del self.queue[:len(batch)]
+            self.batches += 1
+            if found is not None:
+                results.extend((name, cid, found.get(cid)) for name, cid in batch)
+        return results
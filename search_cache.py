@@ -0,0 +1,134 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+
+from telemetry import metrics
+
+# Persistent channel name -> channel ID / uploads playlist cache.
+# search.list costs 100 units, so every entry point checks here first.
+# Misses ("Channel not found") are cached too, with a shorter TTL, so they
+# aren't searched again on every restart.
+
+SEARCH_CACHE_DB = "./data/search_cache.db"
+
+POSITIVE_TTL = 90 * 24 * 3600
+NEGATIVE_TTL = 7 * 24 * 3600
+MAX_ENTRIES = 2000000
+
+# channel_id is None for a cached miss
+CachedChannel = namedtuple('CachedChannel', ['channel_id', 'uploads_playlist_id'])
+
+
+def normalize_name(channel_name):
+    return str(channel_name).strip().lower()
+
+
+class SearchCache:
+    """
+    SQLite-backed name lookup cache with TTLs and size-bounded eviction.
+    get() returns a CachedChannel or None when the name has no fresh entry.
+    """
+    def __init__(self, path=SEARCH_CACHE_DB, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL,
+                 max_entries=MAX_ENTRIES, commit_every=100):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_cache (
+                   name TEXT PRIMARY KEY,
+                   channel_id TEXT,
+                   uploads_playlist_id TEXT,
+                   expires_at REAL NOT NULL,
+                   last_used REAL NOT NULL
+               ) WITHOUT ROWID"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS search_cache_last_used ON search_cache (last_used)")
+        self.conn.commit()
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, channel_name):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT channel_id, uploads_playlist_id, expires_at FROM search_cache WHERE name = ?",
+                (normalize_name(channel_name),)
+            ).fetchone()
+            if row is None or row[2] < now:
+                self.misses += 1
+                metrics.inc('search_cache_lookups_total', result='miss')
+                return None
+            self.hits += 1
+            metrics.inc('search_cache_lookups_total', result='hit')
+            self.conn.execute("UPDATE search_cache SET last_used = ? WHERE name = ?",
+                              (now, normalize_name(channel_name)))
+            self._maybe_commit()
+            return CachedChannel(row[0], row[1])
+
+    def put(self, channel_name, channel_id, uploads_playlist_id=None):
+        """
+        Caches a lookup result; channel_id None records a miss with the
+        negative TTL. Each result cost a 100-unit search, so it is committed
+        right away; only the last_used updates of get() are batched.
+        """
+        now = time.time()
+        ttl = self.positive_ttl if channel_id else self.negative_ttl
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                (normalize_name(channel_name), channel_id, uploads_playlist_id, now + ttl, now)
+            )
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def _maybe_commit(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones above max_entries"""
+        with self.lock:
+            expired = self.conn.execute("DELETE FROM search_cache WHERE expires_at < ?", (time.time(),)).rowcount
+            count = self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    """DELETE FROM search_cache WHERE name IN (
+                           SELECT name FROM search_cache ORDER BY last_used LIMIT ?)""",
+                    (overflow,)
+                )
+            self.conn.commit()
+            self.uncommitted = 0
+        if expired or overflow > 0:
+            logging.info(f"Search cache evicted {expired} expired and {max(overflow, 0)} old entries")
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        logging.info(f"Search cache: {self.hits} hits, {self.misses} misses")
+        self.conn.close()
@@ -0,0 +1,183 @@
+import os
+import shutil
+import hashlib
+import logging
+from collections import namedtuple
+
+# Splitting a crawl over several processes / machines with no coordination.
+#
+# A run started with --shard i/N only touches channels that hash to bucket i,
+# and reads/writes its own files (video_ids.shard-2-of-8.csv,
+# checkpoints.shard-2-of-8.db, ...). Buckets come from jump consistent hash,
+# so going from N to N+1 shards only moves ~1/(N+1) of the channels.
+# The shard files are named after N as well, so a run refuses to start with
+# a different N while checkpoints of another shard count exist; finish and
+# merge the old run first.
+# `merge` combines the shard outputs once every shard is done; it won't
+# overwrite an existing output or merge with shards missing unless forced.
+
+Shard = namedtuple('Shard', ['index', 'count'])
+
+
+def parse_shard(spec):
+    """'2/8' -> Shard(2, 8); None or '' -> None"""
+    if not spec:
+        return None
+    try:
+        index, count = (int(part) for part in str(spec).split('/'))
+    except ValueError:
+        raise ValueError(f"Bad shard spec '{spec}', expected i/N like 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Bad shard spec '{spec}', need 0 <= i < N")
+    return Shard(index, count)
+
+
+def add_shard_argument(parser):
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="only process shard i of N (e.g. 0/4); files get a .shard-i-of-N suffix")
+
+
+def jump_hash(key, num_buckets):
+    """Jump consistent hash (Lamping & Veach) of a 64-bit int key"""
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def channel_key(channel_name):
+    digest = hashlib.blake2b(str(channel_name).strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_of(channel_name, count):
+    return jump_hash(channel_key(channel_name), count)
+
+
+def in_shard(channel_name, shard):
+    return shard is None or shard_of(channel_name, shard.count) == shard.index
+
+
+def shard_mask(series, shard):
+    """Boolean mask over a Series of channel names selecting the shard's rows"""
+    return series.map(lambda name: shard_of(name, shard.count) == shard.index)
+
+
+def shard_path(path, shard):
+    """./data/video_ids.csv -> ./data/video_ids.shard-2-of-8.csv (unchanged when shard is None)"""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard.index}-of-{shard.count}{ext}"
+
+
+def check_shard_count(path, shard):
+    """
+    Raises FileExistsError when shard files of path exist for another shard
+    count, since changing N would start every shard on an empty checkpoint.
+    """
+    if shard is None:
+        return
+    root, ext = os.path.splitext(path)
+    prefix = os.path.basename(root) + '.shard-'
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        return
+    counts = set()
+    for name in os.listdir(directory):
+        if not (name.startswith(prefix) and name.endswith(ext)):
+            continue
+        _, _, count = name[len(prefix):len(name) - len(ext)].partition('-of-')
+        if count.isdigit() and int(count) != shard.count:
+            counts.add(int(count))
+    if counts:
+        raise FileExistsError(f"{path} has checkpoints for {', '.join(map(str, sorted(counts)))} shards, "
+                              f"not {shard.count}; finish and merge that run or move them away first")
+
+
+def check_merge(path, count, force=False):
+    """
+    Raises FileExistsError when path already holds output (e.g. from an
+    unsharded run) and FileNotFoundError when a shard's output is missing,
+    unless force is set.
+    """
+    if force:
+        return
+    if os.path.isfile(path) or (os.path.isdir(path) and os.listdir(path)):
+        raise FileExistsError(f"{path} already exists; move it away or merge with --force")
+    missing = [shard_path(path, Shard(index, count)) for index in range(count)
+               if not os.path.exists(shard_path(path, Shard(index, count)))]
+    if missing:
+        raise FileNotFoundError(f"Missing shard outputs {', '.join(missing)}; merge with --force to skip them")
+
+
+def merge_csv(path, count, delete=False):
+    """
+    Concatenates the count shard CSVs of path into path (header written
+    once). The result is written next to path and renamed into place.
+    """
+    written = 0
+    tmp = path + '.tmp'
+    parts = []
+    with open(tmp, 'w', encoding='utf-8', newline='') as out:
+        for index in range(count):
+            part = shard_path(path, Shard(index, count))
+            if not os.path.exists(part):
+                logging.warning(f"Missing shard output {part}")
+                continue
+            with open(part, 'r', encoding='utf-8', newline='') as f:
+                header = f.readline()
+                if written == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out, 1 << 20)
+            written += 1
+            parts.append(part)
+    os.replace(tmp, path)
+    if delete:
+        for part in parts:
+            os.remove(part)
+    logging.info(f"Merged {written}/{count} shards into {path}")
+    return written
+
+
+def merge_parquet(path, count, delete=False):
+    """
+    Moves every shard's Parquet files into one dataset directory. The files
+    are already channel-hash partitioned, so this is a rename, not a rewrite.
+    """
+    written = 0
+    for index in range(count):
+        part_root = shard_path(path, Shard(index, count))
+        if not os.path.isdir(part_root):
+            logging.warning(f"Missing shard output {part_root}")
+            continue
+        for dirpath, _, files in os.walk(part_root):
+            rel = os.path.relpath(dirpath, part_root)
+            target_dir = os.path.normpath(os.path.join(path, rel))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                target = os.path.join(target_dir, f"shard{index}-{name}")
+                if delete:
+                    os.replace(os.path.join(dirpath, name), target)
+                else:
+                    shutil.copy2(os.path.join(dirpath, name), target)
+        if delete:
+            shutil.rmtree(part_root, ignore_errors=True)
+        written += 1
+    logging.info(f"Merged {written}/{count} shards into {path}")
+    return written
+
+
+def merge_outputs(path, count, delete=False, force=False):
+    """
+    Merges shard outputs of path, CSV or Parquet directory. Without force
+    an existing path or a missing shard is an error (see check_merge).
+    """
+    check_merge(path, count, force)
+    if path.endswith('.parquet'):
+        return merge_parquet(path, count, delete)
+    return merge_csv(path, count, delete)
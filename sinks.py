@@ -0,0 +1,225 @@
+import os
+import zlib
+import time
+import pandas as pd
+
+from channel_reader import iter_chunks, count_rows
+from telemetry import metrics
+
+# Pluggable output writers for step2 (video IDs) and step3 (transcripts).
+#
+# Both sinks buffer rows and write them out in bounded batches, so nothing
+# holds the whole corpus in memory. write() returns True when the call
+# flushed to disk, which is the moment callers can checkpoint what they
+# wrote. The Parquet sink needs pyarrow; it writes each flush as one
+# zstd-compressed file per partition, partitioned by a hash of channel_name,
+# with channel_name dictionary-encoded, and merges a partition's small files
+# into one once they add up to a row group.
+
+FORMATS = ('csv', 'parquet')
+
+# output schemas of step2 and step3
+VIDEO_COLUMNS      = ['channel_name', 'playlist_id', 'video_id']
+TRANSCRIPT_COLUMNS = ['channel_name', 'playlist_id', 'video_id', 'transcript']
+ROW_GROUP_SIZE = 50000
+PARTITIONS = 16
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = pq = ds = None
+
+
+def output_path(csv_path, fmt):
+    """./data/video_ids.csv -> ./data/video_ids.parquet for the parquet format"""
+    if fmt == 'parquet':
+        return os.path.splitext(csv_path)[0] + '.parquet'
+    return csv_path
+
+
+def channel_partition(channel_name, partitions=PARTITIONS):
+    """Stable partition number for a channel (crc32, same on every machine)"""
+    return zlib.crc32(str(channel_name).encode('utf-8')) % partitions
+
+
+class CsvSink:
+    """Appends rows to a single CSV, writing the header only once"""
+    def __init__(self, path, columns, batch_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.buffer = []
+        self.rows_written = 0
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.buffer:
+            return
+        header = not os.path.exists(self.path)
+        pd.DataFrame(self.buffer, columns=self.columns).to_csv(self.path, mode='a', header=header, index=False)
+        self.rows_written += len(self.buffer)
+        metrics.inc('rows_written_total', len(self.buffer), output=os.path.basename(self.path))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+class ParquetSink:
+    """
+    Writes rows to a directory of Parquet files partitioned by channel hash:
+      <path>/part=<p>/<run>-<seq>.parquet
+    Every flush produces complete files, so a crash never leaves a file
+    without its footer. Callers flush small batches to checkpoint them, so
+    once a partition's files from this run add up to batch_size rows (and
+    on close) they are rewritten as one file; a crash between writing that
+    file and removing its inputs can leave those rows in the output twice.
+    """
+    def __init__(self, path, columns, batch_size=ROW_GROUP_SIZE, partitions=PARTITIONS,
+                 compression='zstd', dictionary_columns=('channel_name', 'playlist_id')):
+        if pa is None:
+            raise ImportError("The parquet output format needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.partitions = partitions
+        self.compression = compression
+        self.dictionary_columns = [c for c in dictionary_columns if c in self.columns]
+        self.schema = pa.schema([
+            (c, pa.dictionary(pa.int32(), pa.string()) if c in self.dictionary_columns else pa.string())
+            for c in self.columns
+        ])
+        self.run_id = time.strftime('%Y%m%d%H%M%S') + f"-{os.getpid()}"
+        self.seq = 0
+        self.buffered = 0
+        self.buffers = [[] for _ in range(partitions)]
+        # (file, rows) written by this run per partition, not compacted yet
+        self.segments = [[] for _ in range(partitions)]
+        self.rows_written = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, rows):
+        for row in rows:
+            self.buffers[channel_partition(row.get('channel_name', ''), self.partitions)].append(row)
+        self.buffered += len(rows)
+        if self.buffered >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.buffered:
+            return
+        for p, rows in enumerate(self.buffers):
+            if not rows:
+                continue
+            table = pa.Table.from_pydict(
+                {c: [None if r.get(c) is None else str(r.get(c)) for r in rows] for c in self.columns},
+                schema=self.schema
+            )
+            self.segments[p].append((self._write_file(p, table), len(rows)))
+            self.buffers[p] = []
+            if sum(n for _, n in self.segments[p]) >= self.batch_size:
+                self._compact(p)
+        self.rows_written += self.buffered
+        metrics.inc('rows_written_total', self.buffered, output=os.path.basename(self.path))
+        self.buffered = 0
+        self.seq += 1
+
+    def _write_file(self, p, table, suffix=''):
+        part_dir = os.path.join(self.path, f"part={p:03d}")
+        os.makedirs(part_dir, exist_ok=True)
+        file_name = f"{self.run_id}-{self.seq:06d}{suffix}.parquet"
+        # dot-prefixed temp files are ignored by pyarrow.dataset readers
+        tmp_path = os.path.join(part_dir, '.' + file_name + '.tmp')
+        pq.write_table(table, tmp_path, compression=self.compression,
+                       use_dictionary=self.dictionary_columns, row_group_size=max(table.num_rows, 1))
+        os.replace(tmp_path, os.path.join(part_dir, file_name))
+        return os.path.join(part_dir, file_name)
+
+    def _compact(self, p):
+        """Rewrites partition p's files from this run as one file; later flushes start a new one"""
+        segments, self.segments[p] = self.segments[p], []
+        if len(segments) < 2:
+            return
+        table = pa.concat_tables([pq.read_table(path, schema=self.schema) for path, _ in segments])
+        self._write_file(p, table, suffix='-merged')
+        for path, _ in segments:
+            os.remove(path)
+
+    def close(self):
+        self.flush()
+        for p in range(self.partitions):
+            self._compact(p)
+
+
+def open_sink(csv_path, columns, fmt='csv', batch_size=ROW_GROUP_SIZE):
+    """Opens the sink for fmt at the path derived from csv_path"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format '{fmt}', use one of {FORMATS}")
+    if fmt == 'parquet':
+        return ParquetSink(output_path(csv_path, fmt), columns, batch_size)
+    return CsvSink(csv_path, columns, batch_size)
+
+
+def iter_output_chunks(csv_path, columns=None, fmt='csv', key=None, skip=None):
+    """
+    Reads step output back as DataFrame chunks, projecting only columns.
+    Parquet is read batch by batch (dictionary columns come back as pandas
+    categoricals); CSV goes through channel_reader.iter_chunks.
+    """
+    if fmt == 'parquet':
+        if ds is None:
+            raise ImportError("Reading parquet output needs pyarrow (pip install pyarrow)")
+        dataset = ds.dataset(output_path(csv_path, fmt), format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(columns=list(columns) if columns else None):
+            chunk = batch.to_pandas()
+            if key is not None:
+                chunk[key] = chunk[key].fillna('').astype(str).str.strip()
+                if skip:
+                    chunk = chunk[~chunk[key].isin(skip)]
+            if len(chunk):
+                yield chunk
+    else:
+        yield from iter_chunks(csv_path, columns, key, skip)
+
+
+def iter_output_rows(csv_path, columns=None, fmt='csv', key=None, skip=None):
+    for chunk in iter_output_chunks(csv_path, columns, fmt, key, skip):
+        yield from chunk.to_dict('records')
+
+
+def count_output_rows(csv_path, fmt='csv'):
+    """Row count from parquet metadata, or a newline scan for CSV"""
+    if fmt == 'parquet':
+        if ds is None:
+            raise ImportError("Reading parquet output needs pyarrow (pip install pyarrow)")
+        return ds.dataset(output_path(csv_path, fmt), format='parquet', partitioning='hive').count_rows()
+    return count_rows(csv_path)
+
+
+def iter_transcripts(csv_path, fmt='csv', store_dir=None, skip=None):
+    """
+    (channel_name, video_id, text) for every step3 transcript, read from
+    the CSV/Parquet output, or from the TranscriptStore in store_dir.
+    skip is a set of video IDs to leave out.
+    """
+    if store_dir:
+        from transcript_store import TranscriptStore
+        with TranscriptStore(store_dir) as store:
+            for video_id, channel_name in store.iter_videos():
+                if not skip or video_id not in skip:
+                    yield channel_name or '', video_id, store.get_text(video_id)
+        return
+    for chunk in iter_output_chunks(csv_path, ['channel_name', 'video_id', 'transcript'], fmt,
+                                    key='video_id', skip=skip):
+        names = chunk['channel_name'].astype(object).fillna('').astype(str)
+        yield from zip(names, chunk['video_id'], chunk['transcript'].astype(object).fillna('').astype(str))
@@ -0,0 +1,256 @@
+import os
+import json
+import atexit
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide crawl metrics, shared by init.py, api.py, pytube1.py and the
+# modules they use.
+#
+# Counters, gauges and latency histograms live in one registry keyed by
+# metric name and label values. They can be read at /metrics (Prometheus
+# text format) or /snapshot.json on a local HTTP port, and/or written as
+# periodic JSON snapshots so a multi-day run can be inspected after the fact.
+# Everything is in-process: worker processes report through their parent.
+
+SNAPSHOT_JSON = "./data/telemetry.json"
+SNAPSHOT_INTERVAL = 60
+
+# seconds; covers a cached lookup up to a slow yt-dlp channel extraction
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-quantile (inf past the last bucket)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Progress:
+    """Done/total for one stage; feeds the queue depth, rate and ETA gauges"""
+    def __init__(self, registry, stage, total=None):
+        self.registry = registry
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.started = time.time()
+
+    def advance(self, n=1):
+        self.done += n
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        self.registry.set_gauge('crawl_items_done', self.done, stage=self.stage)
+        self.registry.set_gauge('crawl_items_per_second', round(rate, 3), stage=self.stage)
+        if self.total is not None:
+            backlog = max(self.total - self.done, 0)
+            self.registry.set_gauge('crawl_queue_depth', backlog, stage=self.stage)
+            self.registry.set_gauge('crawl_eta_seconds', round(backlog / rate) if rate > 0 else -1,
+                                    stage=self.stage)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self.started = time.time()
+
+    def inc(self, name, value=1, /, **labels):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[_key(labels)] = series.get(_key(labels), 0) + value
+
+    def set_gauge(self, name, value, /, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[_key(labels)] = value
+
+    def observe(self, name, seconds, /, **labels):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if _key(labels) not in series:
+                series[_key(labels)] = Histogram()
+            series[_key(labels)].observe(seconds)
+
+    @contextmanager
+    def timed(self, name, /, **labels):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def progress(self, stage, total=None):
+        return Progress(self, stage, total)
+
+    def reset(self):
+        """Drops all recorded values (collectors stay registered)"""
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def add_collector(self, fn):
+        """fn() -> {gauge_name: value} or {gauge_name: (value, labels)}, read at export time"""
+        self.collectors.append(fn)
+
+    def _collect(self):
+        for fn in self.collectors:
+            try:
+                values = fn()
+            except Exception as e:
+                logging.debug(f"Telemetry collector failed: {e}")
+                continue
+            for name, value in values.items():
+                if isinstance(value, tuple):
+                    self.set_gauge(name, value[0], **value[1])
+                else:
+                    self.set_gauge(name, value)
+
+    def snapshot(self):
+        self._collect()
+        with self.lock:
+            def series(metrics, render):
+                return {name: [dict(labels=dict(k), **render(v)) for k, v in values.items()]
+                        for name, values in metrics.items()}
+            return {
+                'time': time.time(),
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'counters': series(self.counters, lambda v: {'value': v}),
+                'gauges': series(self.gauges, lambda v: {'value': v}),
+                'histograms': series(self.histograms, lambda h: {
+                    'count': h.count, 'sum': round(h.sum, 4),
+                    'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}),
+            }
+
+    def render_prometheus(self):
+        self._collect()
+        lines = []
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+
+        with self.lock:
+            for name, values in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in values.items())
+            for name, values in sorted(self.gauges.items()):
+                if any(not isinstance(v, (int, float)) for v in values.values()):
+                    continue
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in values.items())
+            for name, values in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for k, h in values.items():
+                    cumulative = 0
+                    for bound, n in zip(h.buckets + (float('inf'),), h.counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else bound
+                        lines.append(f"{name}_bucket{fmt(k, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{fmt(k)} {h.sum}")
+                    lines.append(f"{name}_count{fmt(k)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path=SNAPSHOT_JSON):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+
+
+# the registry every module reports to
+metrics = Registry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics'):
+            body, ctype = metrics.render_prometheus(), 'text/plain; version=0.0.4'
+        elif self.path.startswith('/snapshot.json'):
+            body, ctype = json.dumps(metrics.snapshot()), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Serves /metrics and /snapshot.json from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='telemetry-http', daemon=True).start()
+    logging.info(f"Telemetry on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def start_snapshots(path=SNAPSHOT_JSON, interval=SNAPSHOT_INTERVAL):
+    """Writes a JSON snapshot every interval seconds from a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.write_snapshot(path)
+            except OSError as e:
+                logging.warning(f"Could not write telemetry snapshot {path}: {e}")
+    threading.Thread(target=loop, name='telemetry-snapshots', daemon=True).start()
+
+
+def add_telemetry_arguments(parser):
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve /metrics and /snapshot.json on this local port")
+    parser.add_argument("--metrics-snapshot", default=None,
+                        help=f"write a JSON metrics snapshot here every --metrics-interval seconds "
+                             f"(e.g. {SNAPSHOT_JSON})")
+    parser.add_argument("--metrics-interval", type=float, default=SNAPSHOT_INTERVAL)
+
+
+def start_telemetry(args):
+    """Starts whatever add_telemetry_arguments asked for"""
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+    if args.metrics_snapshot:
+        start_snapshots(args.metrics_snapshot, args.metrics_interval)
+        # one last snapshot with the final numbers
+        atexit.register(metrics.write_snapshot, args.metrics_snapshot)
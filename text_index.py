@@ -0,0 +1,453 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import argparse
+from itertools import groupby
+import numpy as np
+
+from sinks import iter_transcripts, FORMATS
+from sharding import add_shard_argument, shard_path
+from telemetry import metrics
+
+# Inverted full-text index over the step3 transcripts.
+#
+# Documents get dense integer IDs in docs (index.db), which also holds
+# video_id and channel_name for channel filters. Each update() indexes the
+# transcripts not seen yet into a new immutable segment: seg-N.post holds the
+# postings of every term, and the terms table maps (term, segment) to the
+# byte range. One term's postings are a single varint stream:
+#   doc deltas (df) | term counts (df) | position deltas (sum of counts)
+# where positions restart at each document. Segment files are opened with
+# np.memmap and decoded with vectorized varint code, so a query touches only
+# the postings of its own terms. `compact` merges all segments into one.
+#
+# Queries: words are ANDed, OR separates alternatives, -word or NOT word
+# excludes, "quoted words" is a phrase, channel:NAME (or channel:"a name")
+# restricts to one channel.
+
+TEXT_INDEX_DIR = "./data/text_index"
+TRANSCRIPTS_CSV = "./data/transcripts.csv"
+
+SEGMENT_DOCS = 20000
+WORD_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'-?\w+:"[^"]*"|-?"[^"]*"|\S+')
+
+
+# ================
+# === Encoding
+# ================
+
+def varint_sizes(values):
+    """Encoded length in bytes of each value"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += values >= np.uint64(1 << (7 * k))
+    return nbytes
+
+
+def encode_varints(values):
+    """LEB128 bytes of a non-negative integer array, all values at once"""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b''
+    nbytes = varint_sizes(values)
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        mask = nbytes > k
+        chunk = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = chunk | more
+    return out.tobytes()
+
+
+def decode_varints(data):
+    """Inverse of encode_varints; data is bytes or a uint8 array"""
+    data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else data
+    ends = np.flatnonzero(data < 0x80)
+    if not len(ends):
+        return np.empty(0, dtype=np.uint64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for k in range(int(lengths.max())):
+        mask = lengths > k
+        values[mask] |= (data[starts[mask] + k].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * k)
+    return values
+
+
+def _restart_cumsum(deltas, counts):
+    """cumsum of deltas that restarts at every group of counts elements"""
+    total = np.cumsum(deltas, dtype=np.int64)
+    group_start = np.cumsum(counts) - counts
+    before = np.zeros(len(counts), dtype=np.int64)
+    nonempty = group_start > 0
+    before[nonempty] = total[group_start[nonempty] - 1]
+    return total - np.repeat(before, counts)
+
+
+def encode_postings(docs, counts, positions):
+    """One term: sorted doc IDs, term count per doc, positions grouped by doc (ascending)"""
+    docs = np.asarray(docs, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    doc_deltas = np.diff(docs, prepend=0)
+    pos_deltas = np.diff(positions, prepend=0)
+    # the first position of each document is stored as is
+    group_start = np.cumsum(counts) - counts
+    pos_deltas[group_start[counts > 0]] = positions[group_start[counts > 0]]
+    return encode_varints(np.concatenate([doc_deltas, counts, pos_deltas]))
+
+
+def decode_postings(data, df):
+    """-> (docs, counts, positions) for one term"""
+    values = decode_varints(data).astype(np.int64)
+    docs = np.cumsum(values[:df])
+    counts = values[df:2 * df]
+    positions = _restart_cumsum(values[2 * df:], counts)
+    return docs, counts, positions
+
+
+def tokenize(text):
+    return WORD_RE.findall(str(text).lower())
+
+
+def build_segment(doc_tokens):
+    """
+    doc_tokens: [(doc, [token, ...])] with increasing doc IDs.
+    Returns (postings bytes, [(term, offset, length, df)]), encoding every
+    term's stream in one vectorized pass.
+    """
+    vocab = {}
+    term_ids, doc_ids, positions = [], [], []
+    for doc, tokens in doc_tokens:
+        ids = [vocab.setdefault(t, len(vocab)) for t in tokens]
+        term_ids.append(np.array(ids, dtype=np.int64))
+        doc_ids.append(np.full(len(ids), doc, dtype=np.int64))
+        positions.append(np.arange(len(ids), dtype=np.int64))
+    if not vocab:
+        return b'', []
+    terms = np.concatenate(term_ids)
+    docs = np.concatenate(doc_ids)
+    positions = np.concatenate(positions)
+    order = np.lexsort((positions, docs, terms))
+    terms, docs, positions = terms[order], docs[order], positions[order]
+
+    # one entry per (term, doc) pair
+    new_pair = np.ones(len(terms), dtype=bool)
+    new_pair[1:] = (terms[1:] != terms[:-1]) | (docs[1:] != docs[:-1])
+    pair_starts = np.flatnonzero(new_pair)
+    pair_terms = terms[pair_starts]
+    pair_docs = docs[pair_starts]
+    pair_counts = np.diff(np.append(pair_starts, len(terms)))
+    new_term = np.ones(len(pair_terms), dtype=bool)
+    new_term[1:] = pair_terms[1:] != pair_terms[:-1]
+    doc_deltas = pair_docs - np.where(new_term, 0, np.roll(pair_docs, 1))
+    pos_deltas = positions - np.where(new_pair, 0, np.roll(positions, 1))
+
+    # lay the three sections out term by term and encode them in one go
+    values = np.concatenate([doc_deltas, pair_counts, pos_deltas])
+    owner = np.concatenate([pair_terms, pair_terms, terms])
+    section = np.repeat([0, 1, 2], [len(pair_terms), len(pair_terms), len(terms)])
+    order = np.lexsort((section, owner))
+    values, owner = values[order], owner[order]
+    data = encode_varints(values)
+    lengths = np.bincount(owner, weights=varint_sizes(values), minlength=len(vocab)).astype(np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    dfs = np.bincount(pair_terms, minlength=len(vocab))
+    names = list(vocab)
+    return data, [(names[i], int(offsets[i]), int(lengths[i]), int(dfs[i])) for i in range(len(names))]
+
+
+# ===============
+# === Index
+# ===============
+
+class TextIndex:
+    """Segmented on-disk index; update() appends a segment, search() reads all of them"""
+    def __init__(self, path=TEXT_INDEX_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS docs (
+                   doc INTEGER PRIMARY KEY,
+                   video_id TEXT NOT NULL UNIQUE,
+                   channel_name TEXT
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS docs_channel ON docs (channel_name)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, docs INTEGER NOT NULL)")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS terms (
+                   term TEXT NOT NULL,
+                   segment INTEGER NOT NULL,
+                   offset INTEGER NOT NULL,
+                   length INTEGER NOT NULL,
+                   df INTEGER NOT NULL,
+                   PRIMARY KEY (term, segment)
+               ) WITHOUT ROWID"""
+        )
+        self.conn.commit()
+        self.maps = {}
+        self._remove_orphans()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"seg-{segment:06d}.post")
+
+    def _remove_orphans(self):
+        """Postings files from an update that never committed"""
+        live = {self._segment_path(s) for (s,) in self.conn.execute("SELECT segment FROM segments")}
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith('seg-') and name.endswith('.post') and path not in live:
+                os.remove(path)
+
+    def segments(self):
+        return [s for (s,) in self.conn.execute("SELECT segment FROM segments ORDER BY segment")]
+
+    def indexed_videos(self):
+        return {row[0] for row in self.conn.execute("SELECT video_id FROM docs")}
+
+    # --- writing ---
+
+    def _write_segment(self, data, entries, docs=()):
+        """Writes one postings file, then registers it (and its docs) in a single transaction"""
+        segment = (self.conn.execute("SELECT MAX(segment) FROM segments").fetchone()[0] or 0) + 1
+        path = self._segment_path(segment)
+        with open(path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.conn:
+            self.conn.executemany("INSERT INTO docs VALUES (?, ?, ?)", docs)
+            self.conn.execute("INSERT INTO segments VALUES (?, ?)", (segment, len(docs)))
+            self.conn.executemany("INSERT INTO terms VALUES (?, ?, ?, ?, ?)",
+                                  ((term, segment, offset, length, df) for term, offset, length, df in entries))
+        return segment
+
+    def add_documents(self, rows):
+        """Indexes (channel_name, video_id, text) rows as one new segment"""
+        first = (self.conn.execute("SELECT MAX(doc) FROM docs").fetchone()[0] or 0) + 1
+        docs, doc_tokens = [], []
+        for i, (channel_name, video_id, text) in enumerate(rows):
+            docs.append((first + i, video_id, channel_name))
+            doc_tokens.append((first + i, tokenize(text)))
+        if not docs:
+            return 0
+        data, entries = build_segment(doc_tokens)
+        self._write_segment(data, entries, docs)
+        metrics.inc('text_index_documents_total', len(docs))
+        return len(docs)
+
+    def update(self, transcripts, segment_docs=SEGMENT_DOCS, known=None):
+        """
+        Adds every (channel_name, video_id, text) not indexed yet, SEGMENT_DOCS
+        per segment. known is indexed_videos() when the caller already has it;
+        it is updated in place.
+        """
+        known = self.indexed_videos() if known is None else known
+        progress = metrics.progress('text_index')
+        batch, added = [], 0
+        for row in transcripts:
+            if row[1] in known:
+                continue
+            known.add(row[1])
+            batch.append(row)
+            if len(batch) >= segment_docs:
+                added += self.add_documents(batch)
+                progress.advance(len(batch))
+                logging.info(f"Text index: {added} transcripts indexed")
+                batch = []
+        if batch:
+            added += self.add_documents(batch)
+            progress.advance(len(batch))
+        return added
+
+    def compact(self):
+        """Merges every segment into one; doc IDs are global, so postings simply concatenate per term"""
+        old = self.segments()
+        if len(old) < 2:
+            return
+        segment = max(old) + 1
+        entries = []
+        rows = self.conn.execute("SELECT term, segment, offset, length, df FROM terms ORDER BY term, segment")
+        with open(self._segment_path(segment), 'wb') as f:
+            for term, parts in groupby(rows, key=lambda row: row[0]):
+                decoded = [decode_postings(self._postings_bytes(s, offset, length), df)
+                           for _, s, offset, length, df in parts]
+                docs, counts, positions = (np.concatenate(p) for p in zip(*decoded))
+                data = encode_postings(docs, counts, positions)
+                entries.append((term, segment, f.tell(), len(data), len(docs)))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        docs = len(self)
+        with self.conn:
+            self.conn.execute("DELETE FROM terms")
+            self.conn.execute("DELETE FROM segments")
+            self.conn.execute("INSERT INTO segments VALUES (?, ?)", (segment, docs))
+            self.conn.executemany("INSERT INTO terms VALUES (?, ?, ?, ?, ?)", entries)
+        self.maps.clear()
+        for s in old:
+            os.remove(self._segment_path(s))
+        logging.info(f"Text index: merged {len(old)} segments into one")
+
+    # --- reading ---
+
+    def _postings_bytes(self, segment, offset, length):
+        if segment not in self.maps:
+            path = self._segment_path(segment)
+            self.maps[segment] = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else \
+                np.empty(0, dtype=np.uint8)
+        return self.maps[segment][offset:offset + length]
+
+    def postings(self, term):
+        """(docs, counts, positions) of a term over all segments"""
+        parts = [decode_postings(self._postings_bytes(segment, offset, length), df)
+                 for segment, offset, length, df in self.conn.execute(
+                     "SELECT segment, offset, length, df FROM terms WHERE term = ? ORDER BY segment",
+                     (term.lower(),))]
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return tuple(np.concatenate(p) for p in zip(*parts))
+
+    def term_docs(self, term):
+        return self.postings(term)[0]
+
+    def phrase_docs(self, words):
+        """Docs containing the words at consecutive positions"""
+        words = [w for word in words for w in tokenize(word)]
+        if not words:
+            return np.empty(0, dtype=np.int64)
+        if len(words) == 1:
+            return self.term_docs(words[0])
+        keys = None
+        for i, word in enumerate(words):
+            docs, counts, positions = self.postings(word)
+            # (doc, position the phrase would start at); shifted by len(words) to stay non-negative
+            these = (np.repeat(docs, counts) << 32) | (positions - i + len(words))
+            keys = np.unique(these) if keys is None else np.intersect1d(keys, these, assume_unique=True)
+            if not len(keys):
+                break
+        return np.unique(keys >> 32)
+
+    def channel_docs(self, channel_name):
+        return np.array([d for (d,) in self.conn.execute("SELECT doc FROM docs WHERE channel_name = ?",
+                                                         (channel_name,))], dtype=np.int64)
+
+    def _clause_docs(self, clause):
+        if clause.startswith('"'):
+            return self.phrase_docs(clause.strip('"').split())
+        words = tokenize(clause)
+        if len(words) > 1:
+            return self.phrase_docs(words)
+        return self.term_docs(words[0]) if words else np.empty(0, dtype=np.int64)
+
+    def search(self, query, channel=None):
+        """Sorted doc IDs matching query (see the syntax at the top of this file)"""
+        alternatives = [[]]
+        negate = False
+        for token in QUERY_RE.findall(query):
+            if token == 'OR':
+                alternatives.append([])
+                continue
+            if token == 'NOT':
+                negate = True
+                continue
+            if token.startswith('-') and len(token) > 1:
+                negate, token = True, token[1:]
+            alternatives[-1].append((negate, token))
+            negate = False
+
+        matched = np.empty(0, dtype=np.int64)
+        for clauses in alternatives:
+            include, exclude = None, []
+            for negated, clause in clauses:
+                if clause.lower().startswith('channel:'):
+                    docs = self.channel_docs(clause[len('channel:'):].strip('"'))
+                else:
+                    docs = self._clause_docs(clause)
+                if negated:
+                    exclude.append(docs)
+                else:
+                    include = docs if include is None else np.intersect1d(include, docs, assume_unique=True)
+            if include is None:
+                continue
+            for docs in exclude:
+                include = np.setdiff1d(include, docs, assume_unique=True)
+            matched = np.union1d(matched, include)
+        if channel is not None:
+            matched = np.intersect1d(matched, self.channel_docs(channel), assume_unique=True)
+        return matched
+
+    def documents(self, docs):
+        """[(video_id, channel_name)] for doc IDs"""
+        out = []
+        for start in range(0, len(docs), 500):
+            part = [int(d) for d in docs[start:start + 500]]
+            found = dict((d, (v, c)) for d, v, c in self.conn.execute(
+                f"SELECT doc, video_id, channel_name FROM docs WHERE doc IN ({','.join('?' * len(part))})", part))
+            out.extend(found[d] for d in part if d in found)
+        return out
+
+    def close(self):
+        self.maps.clear()
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Full-text index over the step3 transcripts")
+    parser.add_argument("--dir", default=TEXT_INDEX_DIR, help="index directory")
+    add_shard_argument(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update = commands.add_parser("update", help="index transcripts that aren't in the index yet")
+    update.add_argument("--format", choices=FORMATS, default='csv', help="format of the step3 output")
+    update.add_argument("--store", action="store_true", help="read transcripts from the transcript store")
+    update.add_argument("--segment-docs", type=int, default=SEGMENT_DOCS)
+    commands.add_parser("compact", help="merge all segments into one")
+    query_cmd = commands.add_parser("query", help='e.g. \'"machine learning" python -java OR channel:"Some Channel"\'')
+    query_cmd.add_argument("query")
+    query_cmd.add_argument("--channel", default=None, help="only this channel")
+    query_cmd.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    index_dir = shard_path(args.dir, args.shard)
+    with TextIndex(index_dir) as index:
+        if args.command == "update":
+            from transcript_store import TRANSCRIPT_STORE_DIR
+            store_dir = shard_path(TRANSCRIPT_STORE_DIR, args.shard) if args.store else None
+            known = index.indexed_videos()
+            rows = iter_transcripts(shard_path(TRANSCRIPTS_CSV, args.shard), args.format, store_dir,
+                                    skip=known)
+            added = index.update(rows, args.segment_docs, known)
+            print(f"Indexed {added} new transcripts ({len(index)} total, {len(index.segments())} segments)")
+        elif args.command == "compact":
+            index.compact()
+        elif args.command == "query":
+            started = time.time()
+            docs = index.search(args.query, args.channel)
+            elapsed = (time.time() - started) * 1000
+            print(f"{len(docs)} matches in {elapsed:.1f} ms")
+            for video_id, channel_name in index.documents(docs[:args.limit]):
+                print(f"{video_id}\t{channel_name}")
@@ -0,0 +1,159 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from telemetry import metrics
+
+# Adaptive concurrency control for the transcript endpoint.
+#
+# AdaptiveThrottle wraps every YouTubeTranscriptApi call. The number of
+# calls allowed in flight follows AIMD: +1 per window of successes, halved
+# on a throttled response (only by requests started after the last decrease,
+# so one burst of 429s from requests already in flight only counts once).
+# On top of that a circuit breaker opens when most recent calls fail and
+# pauses every worker;
+# after the pause a single probe request decides whether to close it again
+# or stay open for twice as long.
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class AdaptiveThrottle:
+    def __init__(self, name, max_limit=32, min_limit=1, initial_limit=4, decrease=0.5,
+                 error_threshold=10, error_ratio=0.5, error_window=30.0, open_seconds=30.0, max_open_seconds=900.0):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(min(initial_limit, max_limit))
+        self.decrease = decrease
+        self.error_threshold = error_threshold
+        self.error_ratio = error_ratio
+        self.error_window = error_window
+        self.base_open_seconds = open_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.probing = False
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        # (time, failed) of the calls in the last error_window seconds
+        self.recent = deque()
+        self.recent_errors = 0
+        self.completed = deque()
+        self.totals = {'ok': 0, 'throttled': 0, 'errors': 0, 'opens': 0}
+        self.cond = threading.Condition()
+        metrics.add_collector(self.gauges)
+
+    def _allowed(self, now):
+        if self.state == OPEN:
+            if now < self.open_until:
+                return False
+            self.state = HALF_OPEN
+            logging.info(f"[{self.name}] circuit half-open, sending a probe request")
+        if self.state == HALF_OPEN:
+            return not self.probing and self.in_flight == 0
+        return self.in_flight < int(self.limit)
+
+    def acquire(self):
+        """
+        Blocks until the breaker and the concurrency limit let one more call
+        through; returns the start time to hand back to release().
+        """
+        with self.cond:
+            while True:
+                now = time.time()
+                if self._allowed(now):
+                    break
+                timeout = self.open_until - now if self.state == OPEN else None
+                self.cond.wait(timeout)
+            if self.state == HALF_OPEN:
+                self.probing = True
+            self.in_flight += 1
+            return now
+
+    def release(self, result, started=None):
+        """result is 'ok', 'throttled' or 'error' ('ok' covers permanent misses like disabled captions)"""
+        now = time.time()
+        with self.cond:
+            self.in_flight -= 1
+            self.totals[result if result != 'error' else 'errors'] += 1
+            failed = result != 'ok'
+            self.recent.append((now, failed))
+            self.recent_errors += failed
+            while now - self.recent[0][0] > self.error_window:
+                self.recent_errors -= self.recent.popleft()[1]
+            if result == 'ok':
+                self.completed.append(now)
+                while now - self.completed[0] > 60.0:
+                    self.completed.popleft()
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+                if self.state == HALF_OPEN:
+                    self._close()
+            else:
+                if result == 'throttled' and (started is None or started >= self.last_decrease):
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.last_decrease = now
+                if self.state == HALF_OPEN:
+                    self._open(now, min(self.max_open_seconds, self.open_seconds * 2))
+                elif (self.state == CLOSED and self.recent_errors >= self.error_threshold
+                        and self.recent_errors >= self.error_ratio * len(self.recent)):
+                    self._open(now, self.open_seconds)
+            self.probing = False
+            self.cond.notify_all()
+
+    def _open(self, now, seconds):
+        self.state = OPEN
+        self.open_seconds = seconds
+        self.open_until = now + seconds
+        self.limit = float(self.min_limit)
+        self.last_decrease = now
+        self.recent.clear()
+        self.recent_errors = 0
+        self.totals['opens'] += 1
+        logging.warning(f"[{self.name}] circuit open for {seconds:.1f}s after an error burst")
+
+    def _close(self):
+        self.state = CLOSED
+        self.open_seconds = self.base_open_seconds
+        logging.info(f"[{self.name}] circuit closed")
+
+    def call(self, fn, *args, classify=None):
+        """
+        Runs fn(*args) under the throttle. classify maps its return value to
+        'ok' / 'throttled' / 'error'; exceptions count as errors and are re-raised.
+        """
+        started = self.acquire()
+        result = 'error'
+        try:
+            value = fn(*args)
+            result = classify(value) if classify else 'ok'
+            return value
+        finally:
+            self.release(result, started)
+
+    def rate(self, window=60.0):
+        """Successful calls per second over the last window seconds"""
+        now = time.time()
+        with self.cond:
+            while self.completed and now - self.completed[0] > window:
+                self.completed.popleft()
+            return len(self.completed) / window
+
+    def gauges(self):
+        """Telemetry gauges, labelled with the throttle name"""
+        m = self.metrics()
+        labels = {'throttle': self.name}
+        return {'throttle_limit': (m['limit'], labels), 'throttle_in_flight': (m['in_flight'], labels),
+                'throttle_rate': (m['rate'], labels), 'throttle_open': (int(m['state'] != CLOSED), labels),
+                'throttle_opens': (m['opens'], labels)}
+
+    def metrics(self):
+        rate = self.rate()
+        with self.cond:
+            return dict(self.totals, state=self.state, limit=round(self.limit, 2),
+                        in_flight=self.in_flight, rate=round(rate, 2))
@@ -0,0 +1,210 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+
+from telemetry import metrics
+
+# Persistent per-video transcript outcome cache.
+# Most failed transcript fetches fail the same way every time (captions
+# disabled, no transcript in the wanted language, video gone), so the outcome
+# of every attempt is kept with the caption languages the video offers, and
+# a per-status retry policy decides when the video is worth another request.
+# step3 skips videos that are still blocked; only rate limits and transient
+# errors come back quickly.
+
+TRANSCRIPT_CACHE_DB = "./data/transcript_cache.db"
+
+# youtube_transcript_api is imported on the first fetch; benchmark.py swaps
+# in its mock by assigning this attribute
+YouTubeTranscriptApi = None
+
+OK = 'ok'
+DISABLED = 'disabled'
+NOT_FOUND = 'not_found'
+UNAVAILABLE = 'unavailable'
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+
+PERMANENT = (DISABLED, NOT_FOUND, UNAVAILABLE)
+
+# (base delay, max delay) in seconds, doubled per consecutive failure.
+# OK entries are informational; the checkpoint store is what skips finished videos.
+RETRY_POLICY = {
+    DISABLED: (30 * 24 * 3600, 180 * 24 * 3600),
+    NOT_FOUND: (14 * 24 * 3600, 90 * 24 * 3600),
+    UNAVAILABLE: (90 * 24 * 3600, 365 * 24 * 3600),
+    RATE_LIMITED: (10 * 60, 6 * 3600),
+    TRANSIENT: (60 * 60, 24 * 3600),
+}
+
+# youtube_transcript_api exception class names -> status. Matched by name so
+# older and newer versions of the library both work.
+ERROR_STATUS = {
+    'TranscriptsDisabled': DISABLED,
+    'NoTranscriptFound': NOT_FOUND,
+    'NoTranscriptAvailable': NOT_FOUND,
+    'VideoUnavailable': UNAVAILABLE,
+    'InvalidVideoId': UNAVAILABLE,
+    'AgeRestricted': UNAVAILABLE,
+    'VideoUnplayable': UNAVAILABLE,
+    'TooManyRequests': RATE_LIMITED,
+    'RequestBlocked': RATE_LIMITED,
+    'IpBlocked': RATE_LIMITED,
+}
+
+# segments are the raw {'text', 'start', 'duration'} entries (see transcript_store.py)
+TranscriptOutcome = namedtuple('TranscriptOutcome', ['status', 'text', 'languages', 'segments'])
+CachedOutcome = namedtuple('CachedOutcome', ['status', 'languages', 'attempts', 'checked_at', 'retry_at'])
+
+
+def classify_transcript_error(e):
+    """Maps a youtube_transcript_api exception to a cache status"""
+    status = ERROR_STATUS.get(type(e).__name__)
+    if status:
+        return status
+    if '429' in str(e) or 'Too Many Requests' in str(e):
+        return RATE_LIMITED
+    return TRANSIENT
+
+
+def retry_delay(status, attempts):
+    """Seconds until a video with `attempts` consecutive failures of status is retried"""
+    base, cap = RETRY_POLICY[status]
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+def transcript_api():
+    global YouTubeTranscriptApi
+    if YouTubeTranscriptApi is None:
+        from youtube_transcript_api import YouTubeTranscriptApi as api
+        YouTubeTranscriptApi = api
+    return YouTubeTranscriptApi
+
+
+def list_transcripts(api, video_id):
+    """TranscriptList of a video; list_transcripts() up to 1.1, YouTubeTranscriptApi().list() from 1.2"""
+    if hasattr(api, 'list_transcripts'):
+        return api.list_transcripts(video_id)
+    return api().list(video_id)
+
+
+def raw_segments(fetched):
+    """
+    {'text', 'start', 'duration'} dicts of a fetched transcript: 1.x returns
+    a FetchedTranscript of snippet objects, older versions the dicts.
+    """
+    if hasattr(fetched, 'to_raw_data'):
+        return fetched.to_raw_data()
+    return list(fetched)
+
+
+def fetch_transcript(video_id, languages=('en',)):
+    """
+    Fetches a transcript the way YouTubeTranscriptApi.get_transcript does,
+    but keeps the list of caption languages and classifies failures.
+    Returns a TranscriptOutcome; text and segments are None unless status is OK.
+    """
+    api = transcript_api()
+    available = []
+    started = time.time()
+    try:
+        transcript_list = list_transcripts(api, video_id)
+        available = [t.language_code for t in transcript_list]
+        entries = raw_segments(transcript_list.find_transcript(languages).fetch())
+        outcome = TranscriptOutcome(OK, " ".join(entry['text'] for entry in entries), available, entries)
+    except Exception as e:
+        outcome = TranscriptOutcome(classify_transcript_error(e), None, available, None)
+    metrics.observe('transcript_latency_seconds', time.time() - started)
+    metrics.inc('transcript_calls_total', status=outcome.status)
+    return outcome
+
+
+class TranscriptCache:
+    """
+    SQLite-backed video_id -> last transcript outcome.
+    record() stores an outcome, blocked_keys() returns the videos whose
+    retry time has not come yet.
+    """
+    def __init__(self, path=TRANSCRIPT_CACHE_DB, commit_every=500):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS transcript_outcomes (
+                   video_id TEXT PRIMARY KEY,
+                   status TEXT NOT NULL,
+                   languages TEXT,
+                   attempts INTEGER NOT NULL,
+                   checked_at REAL NOT NULL,
+                   retry_at REAL
+               ) WITHOUT ROWID"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS transcript_outcomes_retry ON transcript_outcomes (retry_at)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, video_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, languages, attempts, checked_at, retry_at FROM transcript_outcomes WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CachedOutcome(row[0], row[1].split(',') if row[1] else [], row[2], row[3], row[4])
+
+    def should_skip(self, video_id, now=None):
+        cached = self.get(video_id)
+        return bool(cached and cached.retry_at and cached.retry_at > (now or time.time()))
+
+    def blocked_keys(self, now=None):
+        """Video IDs that failed recently enough that their retry time hasn't come"""
+        with self.lock:
+            cur = self.conn.execute("SELECT video_id FROM transcript_outcomes WHERE retry_at > ?",
+                                    (now or time.time(),))
+            return set(row[0] for row in cur)
+
+    def record(self, video_id, status, languages=None):
+        """Stores an outcome; consecutive failures of the same status back off further"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT status, attempts FROM transcript_outcomes WHERE video_id = ?",
+                                    (video_id,)).fetchone()
+            attempts = row[1] + 1 if row and row[0] == status else 1
+            retry_at = None if status == OK else now + retry_delay(status, attempts)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcript_outcomes VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, status, ','.join(languages or []), attempts, now, retry_at)
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.conn.commit()
+                self.uncommitted = 0
+
+    def status_counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM transcript_outcomes GROUP BY status"))
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        logging.info(f"Transcript cache: {self.status_counts()}")
+        self.conn.close()
@@ -0,0 +1,226 @@
+import os
+import zlib
+import struct
+import hashlib
+import sqlite3
+import logging
+import threading
+import numpy as np
+
+from telemetry import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact on-disk transcript store that keeps segment timing.
+#
+# Every distinct transcript is one blob appended to blobs.bin:
+#   header | starts (float32[n]) | durations (float32[n]) | text ends (uint32[n]) | compressed text
+# where the text of all segments is concatenated as UTF-8 and compressed
+# with zstd (zlib when the zstandard package is missing). A SQLite index maps
+# video_id -> content hash -> (offset, length), so reuploads with identical
+# transcripts share one blob and any video can be read back with a single
+# pread, without loading the rest of the corpus.
+
+TRANSCRIPT_STORE_DIR = "./data/transcript_store"
+
+CODEC_ZSTD = 1
+CODEC_ZLIB = 2
+ZSTD_LEVEL = 9
+
+# codec, segment count, compressed text length, raw text length
+BLOB_HEADER = struct.Struct('<BIII')
+
+
+def _compress(data):
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 9)
+
+
+def _decompress(codec, data, raw_len):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImportError("This transcript was stored with zstd; reading it needs zstandard (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_len)
+    return zlib.decompress(data)
+
+
+def encode_segments(segments):
+    """
+    Splits youtube_transcript_api entries ({'text', 'start', 'duration'})
+    into (arrays_bytes, text_bytes, n) -- the uncompressed parts of a blob.
+    """
+    n = len(segments)
+    starts = np.fromiter((s.get('start', 0.0) for s in segments), dtype='<f4', count=n)
+    durations = np.fromiter((s.get('duration', 0.0) for s in segments), dtype='<f4', count=n)
+    texts = [str(s.get('text', '')).encode('utf-8') for s in segments]
+    ends = np.cumsum(np.fromiter((len(t) for t in texts), dtype='<u4', count=n), dtype='<u4')
+    return starts.tobytes() + durations.tobytes() + ends.tobytes(), b''.join(texts), n
+
+
+def content_hash(arrays, text):
+    return hashlib.blake2b(arrays + text, digest_size=16).hexdigest()
+
+
+def decode_blob(blob):
+    """Blob bytes -> (starts, durations, texts)"""
+    codec, n, compressed_len, raw_len = BLOB_HEADER.unpack_from(blob)
+    pos = BLOB_HEADER.size
+    starts = np.frombuffer(blob, dtype='<f4', count=n, offset=pos)
+    durations = np.frombuffer(blob, dtype='<f4', count=n, offset=pos + 4 * n)
+    ends = np.frombuffer(blob, dtype='<u4', count=n, offset=pos + 8 * n)
+    text = _decompress(codec, blob[pos + 12 * n:pos + 12 * n + compressed_len], raw_len)
+    bounds = [0] + ends.tolist()
+    texts = [text[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(n)]
+    return starts, durations, texts
+
+
+class TranscriptStore:
+    """
+    Append-only blob file plus SQLite index. Doubles as a step3 sink:
+    write(rows) takes rows with video_id, channel_name and segments and
+    returns True when it flushed (blobs fsynced, index committed).
+    """
+    def __init__(self, path=TRANSCRIPT_STORE_DIR, batch_size=500):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.buffered = 0
+        self.rows_written = 0
+        self.deduped = 0
+        self.lock = threading.Lock()
+        self.blob_file = open(os.path.join(path, 'blobs.bin'), 'ab+')
+        self.fd = self.blob_file.fileno()
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS blobs (
+                   hash TEXT PRIMARY KEY,
+                   offset INTEGER NOT NULL,
+                   length INTEGER NOT NULL,
+                   segments INTEGER NOT NULL
+               ) WITHOUT ROWID"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS videos (
+                   video_id TEXT PRIMARY KEY,
+                   hash TEXT NOT NULL,
+                   channel_name TEXT
+               ) WITHOUT ROWID"""
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, video_id):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM videos WHERE video_id = ?", (video_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def put(self, video_id, segments, channel_name=None):
+        """Stores one transcript; returns False when an identical one was already stored"""
+        arrays, text, n = encode_segments(segments)
+        digest = content_hash(arrays, text)
+        with self.lock:
+            known = self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if known is None:
+                codec, compressed = _compress(text)
+                blob = BLOB_HEADER.pack(codec, n, len(compressed), len(text)) + arrays + compressed
+                self.blob_file.seek(0, os.SEEK_END)
+                offset = self.blob_file.tell()
+                self.blob_file.write(blob)
+                self.conn.execute("INSERT INTO blobs VALUES (?, ?, ?, ?)", (digest, offset, len(blob), n))
+            else:
+                self.deduped += 1
+            self.conn.execute("INSERT OR REPLACE INTO videos VALUES (?, ?, ?)", (video_id, digest, channel_name))
+            self.buffered += 1
+        return known is None
+
+    def write(self, rows):
+        for row in rows:
+            self.put(row['video_id'], row['segments'], row.get('channel_name'))
+        if self.buffered >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def _read_blob(self, video_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT b.offset, b.length FROM videos v JOIN blobs b ON b.hash = v.hash WHERE v.video_id = ?",
+                (video_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.blob_file.flush()
+        return os.pread(self.fd, row[1], row[0])
+
+    def get_arrays(self, video_id):
+        """(starts float32, durations float32, texts) for a video, or None"""
+        blob = self._read_blob(video_id)
+        return decode_blob(blob) if blob is not None else None
+
+    def get_segments(self, video_id):
+        """Segments in youtube_transcript_api form, or None"""
+        arrays = self.get_arrays(video_id)
+        if arrays is None:
+            return None
+        starts, durations, texts = arrays
+        return [{'text': t, 'start': float(s), 'duration': float(d)} for s, d, t in zip(starts, durations, texts)]
+
+    def get_text(self, video_id):
+        """The transcript joined with spaces, as in transcripts.csv"""
+        arrays = self.get_arrays(video_id)
+        return " ".join(arrays[2]) if arrays is not None else None
+
+    def video_ids(self, channel_name=None):
+        with self.lock:
+            if channel_name is None:
+                cur = self.conn.execute("SELECT video_id FROM videos")
+            else:
+                cur = self.conn.execute("SELECT video_id FROM videos WHERE channel_name = ?", (channel_name,))
+            return [row[0] for row in cur]
+
+    def iter_videos(self, page_size=10000):
+        """
+        (video_id, channel_name) of every stored video, read page_size rows
+        at a time in video_id order so the index is never held in memory
+        """
+        last = ''
+        while True:
+            with self.lock:
+                page = self.conn.execute(
+                    "SELECT video_id, channel_name FROM videos WHERE video_id > ? ORDER BY video_id LIMIT ?",
+                    (last, page_size)
+                ).fetchall()
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1][0]
+
+    def flush(self):
+        with self.lock:
+            # blobs must be on disk before the index points at them
+            self.blob_file.flush()
+            os.fsync(self.fd)
+            self.conn.commit()
+            self.rows_written += self.buffered
+            metrics.inc('rows_written_total', self.buffered, output=os.path.basename(self.path))
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        logging.info(f"Transcript store: {self.rows_written} transcripts written, {self.deduped} deduplicated")
+        self.conn.close()
+        self.blob_file.close()
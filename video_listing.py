@@ -0,0 +1,193 @@
+import time
+import logging
+import threading
+
+from checkpoint import is_known_video
+from quota import QuotaExhausted
+from telemetry import metrics
+
+# Step2 backends: where the video IDs of an uploads playlist come from.
+#
+# Every lister has list_videos(playlist_id, state=None) returning
+# (video_id, published_at) pairs newest first, stopping at the first video
+# that state (checkpoint.load_playlist_state) says an earlier run saw, so
+# step2 and the pipeline write the same rows and checkpoints whichever one
+# is used:
+#   api     playlistItems.list through the QuotaScheduler (1 unit per page)
+#   ytdlp   yt-dlp flat playlist extraction, no API key and no quota, all entries
+#   hybrid  api while the key pool has more than HYBRID_RESERVE_UNITS left,
+#           ytdlp after that (and for the rest of the quota day)
+# A lister raises ListingError when a playlist couldn't be listed at all,
+# so it isn't checkpointed and a later run retries it.
+
+LISTERS = ('api', 'ytdlp', 'hybrid')
+
+# units kept back for step1's searches when step2 runs in hybrid mode
+HYBRID_RESERVE_UNITS = 500
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list={}"
+YTDLP_LISTING_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    # only the playlist pages, no per-video extraction
+    'extract_flat': 'in_playlist',
+}
+
+
+class ListingError(Exception):
+    pass
+
+
+def api_playlist_items(scheduler, playlist_id, state=None):
+    """
+    Returns (video_id, published_at) pairs of a playlist via pagination,
+    newest first for uploads playlists. With state (see
+    checkpoint.load_playlist_state) paging stops at the first video a
+    previous run already saw.
+    QuotaExhausted is passed up so the caller can stop cleanly; any other
+    failure (after the scheduler's rate limit retries) raises ListingError,
+    since a partial list would checkpoint the playlist with pages missing.
+    """
+    items_out = []
+    next_page_token = None
+    while True:
+        try:
+            response = scheduler.execute('playlistItems.list', lambda yt: yt.playlistItems().list(
+                part="contentDetails",
+                playlistId=playlist_id,
+                maxResults=50,
+                pageToken=next_page_token,
+                fields="items/contentDetails(videoId,videoPublishedAt),nextPageToken"
+            ))
+            items = response.get('items', [])
+            if not items:
+                break
+
+            for item in items:
+                video_id = item['contentDetails']['videoId']
+                published_at = item['contentDetails'].get('videoPublishedAt')
+                if is_known_video(video_id, published_at, state):
+                    return items_out
+                items_out.append((video_id, published_at))
+
+            next_page_token = response.get('nextPageToken')
+            if not next_page_token:
+                break
+
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            raise ListingError(f"Could not list playlist '{playlist_id}': {e}") from e
+
+    return items_out
+
+
+class ApiLister:
+    name = 'api'
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    def list_videos(self, playlist_id, state=None):
+        items = api_playlist_items(self.scheduler, playlist_id, state)
+        metrics.inc('step2_playlists_listed_total', backend=self.name)
+        return items
+
+
+def _published_at(entry):
+    """Flat entries only sometimes carry a timestamp; same format as videoPublishedAt"""
+    timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+    if not timestamp:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+class YtDlpLister:
+    """
+    Lists the whole uploads playlist with yt-dlp's flat extraction. With a
+    throttle (throttle.AdaptiveThrottle for www.youtube.com) the listing
+    requests share the transcript fetches' concurrency budget and 429 handling.
+    """
+    name = 'ytdlp'
+
+    def __init__(self, throttle=None, opts=YTDLP_LISTING_OPTS):
+        try:
+            import yt_dlp
+        except ImportError:
+            raise ImportError("The ytdlp lister needs yt-dlp (pip install yt-dlp)")
+        self.yt_dlp = yt_dlp
+        self.throttle = throttle
+        self.opts = opts
+        # YoutubeDL instances aren't thread-safe; each thread keeps its own session
+        self.local = threading.local()
+
+    def _ydl(self):
+        if getattr(self.local, 'ydl', None) is None:
+            self.local.ydl = self.yt_dlp.YoutubeDL(dict(self.opts))
+        return self.local.ydl
+
+    def list_videos(self, playlist_id, state=None):
+        started = self.throttle.acquire() if self.throttle else None
+        result = 'error'
+        try:
+            # process=False leaves entries as the extractor's lazy page iterator,
+            # so a refresh that hits a known video stops fetching pages there
+            info = self._ydl().extract_info(PLAYLIST_URL.format(playlist_id), download=False, process=False)
+            if not info or info.get('entries') is None:
+                raise ListingError(f"yt-dlp returned no entries for {playlist_id}")
+            items = []
+            # later pages are fetched while iterating, so their errors surface here
+            for entry in info['entries']:
+                if not entry or not entry.get('id'):
+                    continue
+                published_at = _published_at(entry)
+                if is_known_video(entry['id'], published_at, state):
+                    break
+                items.append((entry['id'], published_at))
+            result = 'ok'
+        except (self.yt_dlp.utils.YoutubeDLError, OSError) as e:
+            result = 'throttled' if '429' in str(e) else 'error'
+            raise ListingError(f"yt-dlp could not list {playlist_id}: {e}") from e
+        finally:
+            if self.throttle:
+                self.throttle.release(result, started)
+        metrics.inc('step2_playlists_listed_total', backend=self.name)
+        return items
+
+
+class HybridLister:
+    """Data API while quota lasts, yt-dlp once the pool is down to reserve_units"""
+    name = 'hybrid'
+
+    def __init__(self, scheduler, api, ytdlp, reserve_units=HYBRID_RESERVE_UNITS):
+        self.scheduler = scheduler
+        self.api = api
+        self.ytdlp = ytdlp
+        self.reserve_units = reserve_units
+        self.on_api = True
+
+    def list_videos(self, playlist_id, state=None):
+        if self.scheduler.remaining() > self.reserve_units:
+            if not self.on_api:
+                logging.info("[step2] Quota available again, listing with the Data API")
+                self.on_api = True
+            try:
+                return self.api.list_videos(playlist_id, state)
+            except QuotaExhausted:
+                pass
+        if self.on_api:
+            logging.info("[step2] Quota down to the reserve, listing with yt-dlp")
+            self.on_api = False
+        return self.ytdlp.list_videos(playlist_id, state)
+
+
+def make_lister(name, scheduler, throttle=None):
+    """Builds the LISTERS backend called name"""
+    if name == 'api':
+        return ApiLister(scheduler)
+    if name == 'ytdlp':
+        return YtDlpLister(throttle)
+    if name == 'hybrid':
+        return HybridLister(scheduler, ApiLister(scheduler), YtDlpLister(throttle))
+    raise ValueError(f"Unknown lister '{name}', use one of {LISTERS}")